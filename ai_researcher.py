@@ -12,7 +12,6 @@ import random
 import requests
 from io import BytesIO
 from PIL import Image
-from google import genai
 from google.genai import types
 from config import log, USER_AGENTS
 from api_manager import key_manager
@@ -133,9 +132,8 @@ def upload_external_image(source_url, filename_title):
         
 def smart_hunt(topic, config, mode="general"):
     model_name = "gemini-2.5-flash" 
-    key = key_manager.get_current_key()
-    if not key: return []
-    client = genai.Client(api_key=key)
+    client = key_manager.get_client()
+    if not client: return []
     
     search_plan = generate_search_plan(topic, client, model_name)
     active_query = search_plan.get("news_query", topic)
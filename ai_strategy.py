@@ -9,15 +9,10 @@ from typing import Optional, List
 
 # Project imports
 from config import log
-from api_manager import generate_step_strict
+from api_manager import generate_step_strict, agenerate_step_strict
 
-def _get_core_keywords_from_ai(long_title: str) -> Optional[str]:
-    """
-    Legacy function: Uses AI to extract a single core keyword (Broad).
-    Used by News Fetcher.
-    """
-    try:
-        prompt = f"""
+def _build_core_keywords_prompt(long_title: str) -> str:
+    return f"""
         ROLE: Search Engine Specialist.
         TASK: Extract the primary entity (Product Name or Technology) from this title.
         ---
@@ -28,6 +23,14 @@ def _get_core_keywords_from_ai(long_title: str) -> Optional[str]:
         TITLE: {long_title}
         OUTPUT JSON: {{ "core_keywords": "Search Phrase" }}
         """
+
+def _get_core_keywords_from_ai(long_title: str) -> Optional[str]:
+    """
+    Legacy function: Uses AI to extract a single core keyword (Broad).
+    Used by News Fetcher.
+    """
+    try:
+        prompt = _build_core_keywords_prompt(long_title)
         result = generate_step_strict("gemini-2.5-flash", prompt, "Core Keyword Extraction", ["core_keywords"])
         return result.get('core_keywords')
     except:
@@ -45,6 +48,18 @@ def generate_smart_query(long_keyword: str) -> str:
     smart = _get_core_keywords_from_ai(long_keyword)
     return smart if smart else _get_core_keywords_heuristic(long_keyword)
 
+async def agenerate_smart_query(long_keyword: str) -> str:
+    """
+    Async variant of generate_smart_query (for asyncio.gather with other independent steps).
+    """
+    try:
+        prompt = _build_core_keywords_prompt(long_keyword)
+        result = await agenerate_step_strict("gemini-2.5-flash", prompt, "Core Keyword Extraction", ["core_keywords"])
+        smart = result.get('core_keywords')
+    except:
+        smart = None
+    return smart if smart else _get_core_keywords_heuristic(long_keyword)
+
 # ==============================================================================
 # NEW: GRADUATED SEARCH PLANNER
 # ==============================================================================
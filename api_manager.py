@@ -2,23 +2,27 @@
 # ROLE: Advanced AI Orchestrator (Hybrid Waterfall Strategy)
 # STRATEGY: Puter.js (Claude/GPT) -> Gemini 2.0 -> Gemini 1.5 Pro -> Gemini Flash
 # DESCRIPTION: Ensures the highest quality model is always used, degrading gracefully only on failure.
-# FEATURES: Key Rotation, Self-Healing JSON, Multi-Provider Redundancy.
+# FEATURES: Rate-Aware Key Scheduling, Self-Healing JSON, Multi-Provider Redundancy, Persistent Response Cache, Token Budget.
 
 import os
 import time
 import json
+import asyncio
+import hashlib
 import logging
-import regex
+import threading
+import statistics
+import contextvars
+import re
 import json_repair
 import puter as puter_sdk
 from google import genai
 from google.genai import types
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, before_sleep_log
 from config import log
+import cassette
 
 # --- CONFIGURATION ---
-API_HEAT = 30  # Seconds to wait between heavy calls to prevent flooding
-
 # 1. Primary Engine (The Best Writer available via Puter)
 PUTER_MODEL = "claude-3-5-sonnet" 
 
@@ -31,6 +35,107 @@ GEMINI_FALLBACK_CHAIN = [
     "gemini-robotics-er-1.5-preview"      
 ]
 
+# 3. Persistent Response Cache (Skips identical prompts on reruns/retries)
+RESPONSE_CACHE_DIR = ".ai_cache/responses"
+RESPONSE_CACHE_TTL = 24 * 3600          # Offline reasoning steps (Intent, Vetting, Keywords...)
+RESPONSE_CACHE_SEARCH_TTL = 2 * 3600    # Search-grounded steps go stale much faster
+RESPONSE_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# 4. Async Engine Concurrency Limits (agenerate_step_strict)
+ASYNC_MAX_CONCURRENCY = 4   # Total in-flight LLM steps across all keys
+ASYNC_PER_KEY_CONCURRENCY = 2   # In-flight requests allowed on a single Gemini key
+
+# 5. Proactive Per-Key Rate Limits (Token Buckets, replaces fixed sleeps & 429 round-trips)
+KEY_RPM_LIMIT = 10            # Requests per minute per Gemini key
+KEY_TPM_LIMIT = 250000        # Tokens per minute per Gemini key (prompt + expected output)
+ESTIMATED_OUTPUT_TOKENS = 1024
+RATE_LIMIT_COOLDOWN = 60      # Seconds a key is benched after a real 429
+
+# 6. Circuit Breakers & Health Scoring for the Waterfall (persisted across runs)
+MODEL_HEALTH_FILE = "model_health.json"
+PUTER_PROVIDER = f"puter:{PUTER_MODEL}"
+BREAKER_FAILURE_THRESHOLD = 3     # Consecutive failures before a model's breaker opens
+BREAKER_COOLDOWN = 600            # Seconds before an open breaker allows a half-open probe
+BREAKER_MAX_COOLDOWN = 6 * 3600   # Cap for the doubling cooldown after failed probes
+MODEL_NOT_FOUND_COOLDOWN = 24 * 3600  # A 404 model is parked for a day
+HEALTH_WINDOW = 50                # Recent outcomes/latencies kept per model
+
+# 7. Streaming Mode (Artisan / SEO Polish / Humanizer)
+STREAM_PREAMBLE_LIMIT = 400       # Chars of non-JSON preamble tolerated before a stream is declared malformed
+
+# 8. Token & Cost Accounting (budget itself lives in config_advanced.json -> settings.token_budget)
+USAGE_REPORT_FILE = "usage_report.json"
+BUDGET_CHEAP_MODELS = ["gemini-2.5-flash-lite", "gemini-3.1-flash-lite-preview"]  # Used once the run budget is spent
+# List prices in USD per 1M tokens (input, output). Estimates only -> update when pricing changes.
+MODEL_PRICING = {
+    PUTER_MODEL: (3.00, 15.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-3-flash-preview": (0.50, 3.00),
+    "gemini-3.1-flash-lite-preview": (0.25, 1.50),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-robotics-er-1.5-preview": (0.30, 2.50),
+}
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 chars per token) used for TPM budgeting."""
+    return len(text or "") // 4 + ESTIMATED_OUTPUT_TOKENS
+
+class TokenBucket:
+    """Classic token bucket. Tokens may go negative (debt) so callers learn how long to wait."""
+    def __init__(self, capacity, refill_per_sec):
+        self.capacity = float(capacity)
+        self.refill_per_sec = float(refill_per_sec)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_sec)
+        self.updated = now
+
+    def headroom(self):
+        """Fraction of the budget currently available (<= 0 means in debt)."""
+        self._refill()
+        return self.tokens / self.capacity
+
+    def consume(self, amount):
+        """Books `amount` tokens and returns the seconds to wait until the booking is covered."""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.refill_per_sec)
+
+    def drain(self, seconds):
+        """Empties the bucket and pushes it `seconds` into debt (used after a 429)."""
+        self._refill()
+        self.tokens = -seconds * self.refill_per_sec
+
+class ClientPool:
+    """
+    Keeps one genai.Client per API key so HTTP connections and TLS sessions
+    are reused across calls instead of re-handshaking on every request.
+    """
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = genai.Client(api_key=key)
+                self._clients[key] = client
+            return client
+
+    def invalidate(self, key):
+        """
+        Drops the cached client for a key (e.g. after it hit its quota).
+        The client is not closed: other callers may still hold it mid-request.
+        """
+        with self._lock:
+            self._clients.pop(key, None)
+
+client_pool = ClientPool()
+
 class KeyManager:
     def __init__(self):
         self.keys = []
@@ -44,24 +149,410 @@ class KeyManager:
             if k: self.keys.append(k)
             
         self.current_index = 0
+        self._rate_buckets = {}
+        self._lock = threading.Lock()
         log(f"🔑 Loaded {len(self.keys)} Gemini API Keys.")
 
     def get_current_key(self):
         if not self.keys: return None
         return self.keys[self.current_index]
 
-    def switch_key(self):
-        if self.current_index < len(self.keys) - 1:
-            self.current_index += 1
-            log(f"   🔄 Switching to Gemini Key #{self.current_index + 1}...")
+    def _buckets(self, key):
+        buckets = self._rate_buckets.get(key)
+        if buckets is None:
+            buckets = (TokenBucket(KEY_RPM_LIMIT, KEY_RPM_LIMIT / 60.0),
+                       TokenBucket(KEY_TPM_LIMIT, KEY_TPM_LIMIT / 60.0))
+            self._rate_buckets[key] = buckets
+        return buckets
+
+    def _headroom(self, key):
+        rpm, tpm = self._buckets(key)
+        return min(rpm.headroom(), tpm.headroom())
+
+    def reserve_key(self, estimated_tokens=0):
+        """
+        Schedules a request onto the key with the most remaining RPM/TPM headroom.
+        Returns (key_index, key, wait_seconds); the caller sleeps before sending if wait > 0.
+        Callers must use the returned index: current_index is shared and moves with every reservation.
+        """
+        if not self.keys: return None, None, 0.0
+        with self._lock:
+            best = max(range(len(self.keys)), key=lambda i: self._headroom(self.keys[i]))
+            self.current_index = best
+            key = self.keys[best]
+            rpm, tpm = self._buckets(key)
+            wait = max(rpm.consume(1), tpm.consume(estimated_tokens))
+        return best, key, wait
+
+    def acquire_key(self, estimated_tokens=0):
+        """Blocking version of reserve_key: waits for the chosen key's budget, then returns (key_index, key)."""
+        key_index, key, wait = self.reserve_key(estimated_tokens)
+        if wait > 0:
+            log(f"      ⏳ Rate budget: waiting {wait:.1f}s for Gemini Key #{key_index + 1}...")
+            time.sleep(wait)
+        return key_index, key
+
+    def report_rate_limited(self, key):
+        """Benches a key that returned 429 so the scheduler routes around it."""
+        with self._lock:
+            rpm, tpm = self._buckets(key)
+            rpm.drain(RATE_LIMIT_COOLDOWN)
+            tpm.drain(RATE_LIMIT_COOLDOWN)
+        client_pool.invalidate(key)
+
+    def get_client(self, estimated_tokens=0):
+        """Returns the pooled genai.Client of the key with the most rate headroom."""
+        _, key = self.acquire_key(estimated_tokens)
+        if not key: return None
+        return client_pool.get(key)
+
+    def switch_key(self, key_index=None):
+        """
+        Benches the key that hit its quota (the index reserve_key/acquire_key returned) so the
+        scheduler routes around it. Returns False once no other key has headroom left.
+        """
+        if not self.keys: return False
+        if key_index is None: key_index = self.current_index # Legacy callers without an index
+        self.report_rate_limited(self.keys[key_index])
+        with self._lock:
+            available = [i for i in range(len(self.keys)) if i != key_index and self._headroom(self.keys[i]) > 0]
+        if available:
+            log(f"   🔄 Gemini Key #{key_index + 1} benched. Switching to one of {len(available)} key(s) with headroom...")
             return True
-        log("   ⚠️ All Gemini keys exhausted. Resetting to Key #1 (Looping)...")
-        self.current_index = 0
+        log("   ⚠️ All Gemini keys exhausted.")
         return False
 
 # Singleton Instance
 key_manager = KeyManager()
 
+class ModelHealth:
+    """
+    Per-model / per-provider circuit breakers + rolling health stats.
+    States: closed (normal) -> open (skipped until cooldown) -> half_open (one probe).
+    Persisted to MODEL_HEALTH_FILE so a model that died yesterday is not retried first today.
+    """
+    def __init__(self, path=MODEL_HEALTH_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._probing = set()
+        self.models = self._load()
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    for entry in data.values():
+                        # A probe cannot survive a restart: resume as open-with-expired-cooldown
+                        if entry.get("state") == "half_open": entry["state"] = "open"
+                    return data
+        except Exception as e:
+            log(f"⚠️ Error reading model health file: {e}")
+        return {}
+
+    def _save(self):
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.models, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception: pass
+
+    def _entry(self, name):
+        return self.models.setdefault(name, {
+            "state": "closed", "opened_at": 0, "cooldown": BREAKER_COOLDOWN,
+            "consecutive_failures": 0, "outcomes": [], "latencies": []
+        })
+
+    def is_blocked(self, name):
+        """Non-mutating check: True while the breaker is open and still cooling down."""
+        entry = self.models.get(name)
+        if not entry or entry["state"] == "closed": return False
+        if entry["state"] == "half_open": return name in self._probing
+        return time.time() < entry["opened_at"] + entry["cooldown"]
+
+    def allow(self, name, force=False):
+        """Gatekeeper before each attempt. Turns an expired open breaker into a single half-open probe."""
+        with self._lock:
+            entry = self._entry(name)
+            if entry["state"] == "closed" or force:
+                return True
+            if entry["state"] == "half_open":
+                return name not in self._probing
+            if time.time() >= entry["opened_at"] + entry["cooldown"]:
+                entry["state"] = "half_open"
+                self._probing.add(name)
+                log(f"      🩺 [Breaker] Half-open probe for {name}.")
+                return True
+            return False
+
+    def record_success(self, name, latency):
+        with self._lock:
+            entry = self._entry(name)
+            entry["outcomes"] = (entry["outcomes"] + [1])[-HEALTH_WINDOW:]
+            entry["latencies"] = (entry["latencies"] + [round(latency, 3)])[-HEALTH_WINDOW:]
+            entry["consecutive_failures"] = 0
+            if entry["state"] != "closed":
+                log(f"      💚 [Breaker] {name} recovered. Closing breaker.")
+            entry["state"] = "closed"
+            entry["cooldown"] = BREAKER_COOLDOWN
+            self._probing.discard(name)
+            self._save()
+
+    def record_failure(self, name):
+        with self._lock:
+            entry = self._entry(name)
+            entry["outcomes"] = (entry["outcomes"] + [0])[-HEALTH_WINDOW:]
+            entry["consecutive_failures"] += 1
+            if entry["state"] == "half_open":
+                self._open(name, entry, min(entry["cooldown"] * 2, BREAKER_MAX_COOLDOWN))
+            elif entry["state"] == "closed" and entry["consecutive_failures"] >= BREAKER_FAILURE_THRESHOLD:
+                self._open(name, entry, BREAKER_COOLDOWN)
+            self._save()
+
+    def trip(self, name, cooldown):
+        """Opens the breaker immediately (e.g. 404 Model Not Found)."""
+        with self._lock:
+            entry = self._entry(name)
+            entry["outcomes"] = (entry["outcomes"] + [0])[-HEALTH_WINDOW:]
+            self._open(name, entry, cooldown)
+            self._save()
+
+    def _open(self, name, entry, cooldown):
+        entry["state"] = "open"
+        entry["opened_at"] = time.time()
+        entry["cooldown"] = cooldown
+        self._probing.discard(name)
+        log(f"      🔌 [Breaker] {name} opened for {int(cooldown)}s.")
+
+    def success_rate(self, name):
+        outcomes = self.models.get(name, {}).get("outcomes", [])
+        # Laplace-style prior: an unseen model starts at 1.0 and converges to its real rate
+        return (sum(outcomes) + 1) / (len(outcomes) + 1)
+
+    def p50_latency(self, name):
+        latencies = self.models.get(name, {}).get("latencies", [])
+        return statistics.median(latencies) if latencies else float("inf")
+
+    def order(self, chain):
+        """
+        Reorders the waterfall: the requested model stays first while it is healthy,
+        the rest are ranked by success rate (0.1 buckets) then p50 latency, and
+        blocked models are pushed to the end.
+        """
+        preferred, rest = chain[0], chain[1:]
+        available = [m for m in rest if not self.is_blocked(m)]
+        blocked = [m for m in rest if self.is_blocked(m)]
+        available.sort(key=lambda m: (-round(self.success_rate(m), 1), self.p50_latency(m), chain.index(m)))
+        if self.is_blocked(preferred) or self.success_rate(preferred) < 0.5:
+            return available + [preferred] + blocked
+        return [preferred] + available + blocked
+
+model_health = ModelHealth()
+
+class ResponseCache:
+    """
+    Disk-backed, content-addressed cache for validated AI responses.
+    One JSON file per entry; file mtime doubles as the LRU access clock.
+    """
+    def __init__(self, cache_dir=RESPONSE_CACHE_DIR, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = os.getenv("AI_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+
+    @staticmethod
+    def make_key(model_name, prompt, required_keys, use_google_search):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        material = json.dumps([
+            model_name.replace("models/", ""), prompt_hash,
+            sorted(required_keys or []), bool(use_google_search)
+        ])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        if not self.enabled: return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if time.time() - entry.get("created", 0) > entry.get("ttl", 0):
+                os.remove(path)
+                return None
+            os.utime(path, None)  # Touch: mark as recently used
+            return entry.get("data")
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Corrupted entry -> drop it silently
+            try: os.remove(path)
+            except OSError: pass
+            return None
+
+    def set(self, key, data, ttl, step_name=""):
+        if not self.enabled: return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"created": time.time(), "ttl": ttl, "step": step_name, "data": data}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self._evict()
+        except Exception as e:
+            log(f"      ⚠️ Response cache write failed: {e}")
+
+    def _evict(self):
+        """Drops least-recently-used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"): continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        if total <= self.max_bytes: return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes: break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError: pass
+
+response_cache = ResponseCache()
+
+# Step currently being generated (contextvars follow asyncio tasks and asyncio.to_thread)
+_current_step = contextvars.ContextVar("current_step", default="unknown")
+
+class UsageTracker:
+    """
+    Token/cost ledger for one run. Every provider call is booked against the current
+    step and category; once settings.token_budget.max_tokens_per_run is exceeded the
+    waterfall degrades to BUDGET_CHEAP_MODELS and Puter is skipped.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.category = None
+        self.max_tokens = None
+        self.cheap_models = list(BUDGET_CHEAP_MODELS)
+        self.calls = []
+        self.started_at = time.time()
+        self._budget_warned = False
+
+    def configure(self, settings):
+        """Reads settings.token_budget from config_advanced.json."""
+        budget = (settings or {}).get("token_budget") or {}
+        self.max_tokens = budget.get("max_tokens_per_run") or None
+        self.cheap_models = budget.get("cheap_models") or list(BUDGET_CHEAP_MODELS)
+        if self.max_tokens:
+            log(f"💰 Token budget: {self.max_tokens:,} tokens per run (then degrade to {', '.join(self.cheap_models)}).")
+
+    def set_category(self, category):
+        self.category = category
+
+    def record(self, model, prompt_tokens, output_tokens, estimated=False):
+        model = model.replace("models/", "")
+        price_in, price_out = MODEL_PRICING.get(model, (0.0, 0.0))
+        cost = (prompt_tokens * price_in + output_tokens * price_out) / 1_000_000
+        with self._lock:
+            self.calls.append({
+                "step": _current_step.get(), "category": self.category, "model": model,
+                "prompt_tokens": prompt_tokens, "output_tokens": output_tokens,
+                "cost_usd": round(cost, 6), "estimated": estimated
+            })
+
+    def total_tokens(self):
+        with self._lock:
+            return sum(c["prompt_tokens"] + c["output_tokens"] for c in self.calls)
+
+    def over_budget(self):
+        if not self.max_tokens: return False
+        used = self.total_tokens()
+        if used < self.max_tokens: return False
+        if not self._budget_warned:
+            self._budget_warned = True
+            log(f"   💸 Token budget exceeded ({used:,}/{self.max_tokens:,}). Degrading to cheaper models.")
+        return True
+
+    def degrade_chain(self, chain):
+        """Keeps only the cheap models of the chain (unchanged if none of them are in it)."""
+        cheap = [m for m in chain if m in self.cheap_models]
+        return cheap or chain
+
+    def summary(self):
+        def _aggregate(field):
+            groups = {}
+            for c in calls:
+                g = groups.setdefault(str(c[field]), {"calls": 0, "prompt_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+                g["calls"] += 1
+                g["prompt_tokens"] += c["prompt_tokens"]
+                g["output_tokens"] += c["output_tokens"]
+                g["cost_usd"] = round(g["cost_usd"] + c["cost_usd"], 6)
+            return groups
+        with self._lock:
+            calls = list(self.calls)
+        return {
+            "started_at": self.started_at,
+            "finished_at": time.time(),
+            "budget_tokens": self.max_tokens,
+            "total": {
+                "calls": len(calls),
+                "prompt_tokens": sum(c["prompt_tokens"] for c in calls),
+                "output_tokens": sum(c["output_tokens"] for c in calls),
+                "cost_usd": round(sum(c["cost_usd"] for c in calls), 6),
+                "estimated_calls": sum(1 for c in calls if c["estimated"])
+            },
+            "by_step": _aggregate("step"),
+            "by_category": _aggregate("category"),
+            "by_model": _aggregate("model"),
+            "latencies": step_latencies,
+        }
+
+    def write_report(self, path=USAGE_REPORT_FILE):
+        report = self.summary()
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            total = report["total"]
+            log(f"💰 Usage: {total['prompt_tokens'] + total['output_tokens']:,} tokens in {total['calls']} calls (~${total['cost_usd']:.4f}). Report: {path}")
+        except Exception as e:
+            log(f"⚠️ Could not write usage report: {e}")
+
+usage_tracker = UsageTracker()
+
+def _usage_counts(response):
+    """(prompt_tokens, output_tokens) from a Gemini/Puter response, or None when it carries no usage."""
+    meta = getattr(response, 'usage_metadata', None)
+    if meta is not None:
+        prompt_tokens = getattr(meta, 'prompt_token_count', None) or 0
+        # Thinking tokens are billed as output
+        output_tokens = (getattr(meta, 'candidates_token_count', None) or 0) + (getattr(meta, 'thoughts_token_count', None) or 0)
+        if prompt_tokens or output_tokens: return prompt_tokens, output_tokens
+    usage = getattr(response, 'usage', None)
+    if usage is None and isinstance(response, dict): usage = response.get('usage')
+    if usage is not None:
+        get = usage.get if isinstance(usage, dict) else (lambda k: getattr(usage, k, None))
+        prompt_tokens = get('input_tokens') or get('prompt_tokens') or 0
+        output_tokens = get('output_tokens') or get('completion_tokens') or 0
+        if prompt_tokens or output_tokens: return prompt_tokens, output_tokens
+    return None
+
+def book_usage(model, prompt, response=None, output_text=None):
+    """Books one provider call: real usage metadata when present, ~4 chars/token estimate otherwise."""
+    counts = _usage_counts(response) if response is not None else None
+    if counts:
+        usage_tracker.record(model, counts[0], counts[1])
+    else:
+        usage_tracker.record(model, len(prompt or "") // 4, len(output_text or "") // 4, estimated=True)
+
 # Logging Setup
 logger = logging.getLogger("RetryEngine")
 logger.setLevel(logging.INFO)
@@ -69,6 +560,28 @@ logger.setLevel(logging.INFO)
 # Custom Exceptions
 class JSONValidationError(Exception): pass
 class JSONParsingError(Exception): pass
+class StreamAbortedError(Exception): pass
+
+class ProviderFailure:
+    """
+    Falsy result of one provider attempt, with the reason it failed.
+    Only failures caused by the model itself count against its circuit breaker;
+    key quota, network or loop errors say nothing about the model's health.
+    """
+    MODEL_FAULTS = ("not_found", "empty", "bad_json", "stream_aborted")
+
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __bool__(self):
+        return False
+
+    @property
+    def model_fault(self):
+        return self.reason in self.MODEL_FAULTS
+
+# Per-step latency log: {"step", "source", "ttft", "total", "streamed"}
+step_latencies = []
 
 # System Prompt for strict format adherence
 STRICT_SYSTEM_PROMPT = """
@@ -79,29 +592,80 @@ If the user requests JSON, return PURE JSON.
 Obey safety policy.
 """
 
+# Strings are consumed whole by the C regex engine (escape-aware), brackets one at a time.
+_JSON_TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]]', re.DOTALL)
+_JSON_CLOSERS = {'{': '}', '[': ']'}
+_JSON_TRAILING_COMMA_RE = re.compile(r'"(?:[^"\\]|\\.)*"|,\s*(?=[}\]])', re.DOTALL)
+
+def _strip_trailing_commas(candidate):
+    """Removes `,}` / `,]` outside of strings (the most common LLM JSON defect) in one C-level pass."""
+    return _JSON_TRAILING_COMMA_RE.sub(lambda m: m.group() if m.group()[0] == '"' else '', candidate)
+
+def extract_json_span(text):
+    """
+    Single-pass, string/escape-aware bracket matcher.
+    Returns (start, end, balanced) for the first top-level JSON object/array in `text`:
+    - balanced=True  -> text[start:end] is a complete bracketed span.
+    - balanced=False -> the span opened at `start` never closed (e.g. truncated output).
+    Returns None when no opening bracket exists.
+    """
+    start = None
+    stack = []
+    for token in _JSON_TOKEN_RE.finditer(text):
+        tok = token.group()
+        if tok[0] == '"':
+            continue
+        if tok in _JSON_CLOSERS:
+            if start is None: start = token.start()
+            stack.append(_JSON_CLOSERS[tok])
+        elif start is not None:
+            if not stack or stack.pop() != tok:
+                return start, len(text), False # Mismatched bracket -> let the repairer handle it
+            if not stack:
+                return start, token.end(), True
+    if start is None:
+        return None
+    return start, len(text), False
+
 def master_json_parser(text):
     """
     Robust JSON extraction: Handles Markdown blocks, raw text, and minor syntax errors.
+    Fast path first (plain json.loads), json_repair only when strict parsing fails.
     """
     if not text: return None
     
     # Clean Markdown wrappers
     clean_text = text.replace("```json", "").replace("```", "").strip()
     
-    # Regex to extract the first JSON object/array
-    match = regex.search(r'\{(?:[^{}]|(?R))*\}|\[(?:[^\[\]]|(?R))*\]', clean_text, regex.DOTALL)
-    candidate = match.group(0) if match else clean_text
+    # Attempt 1: The whole answer is already pure JSON (the common case with JSON mode)
+    if clean_text[:1] in ('{', '['):
+        try:
+            return json.loads(clean_text)
+        except ValueError: pass
     
-    # Attempt 1: json_repair (Best for minor syntax errors like trailing commas)
-    try:
-        decoded = json_repair.repair_json(candidate, return_objects=True)
-        if isinstance(decoded, (dict, list)): return decoded
-    except: pass
+    # Attempt 2: Locate the first JSON object/array with the bracket scanner
+    span = extract_json_span(clean_text)
+    if span is None:
+        candidate, balanced = clean_text, False
+    else:
+        start, end, balanced = span
+        candidate = clean_text[start:end]
+    
+    if balanced:
+        try:
+            return json.loads(candidate)
+        except ValueError: pass
+        try:
+            return json.loads(_strip_trailing_commas(candidate))
+        except ValueError: pass
     
-    # Attempt 2: Standard JSON load
+    # Attempt 3: json_repair (Best for minor syntax errors like trailing commas or truncation)
     try:
-        return json.loads(candidate)
-    except: return None
+        # json.loads was already tried above, so skip json_repair's own strict attempt
+        decoded = json_repair.repair_json(candidate, return_objects=True, skip_json_loads=True)
+        if isinstance(decoded, (dict, list)): return decoded
+    except Exception: pass
+    return None
 
 def validate_structure(data, required_keys):
     """
@@ -115,12 +679,97 @@ def validate_structure(data, required_keys):
         raise JSONValidationError(f"Missing keys: {missing}")
     return True
 
+# ==============================================================================
+# STREAMING: INCREMENTAL JSON SCANNER
+# ==============================================================================
+class IncrementalJSONScanner:
+    """
+    Character-level twin of extract_json_span for streamed output.
+    Tracks string/escape state and the bracket stack across chunk boundaries and raises
+    StreamAbortedError the moment the output is clearly not the JSON we asked for.
+    """
+    def __init__(self):
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.complete = False
+        self.seen = 0
+
+    def feed(self, chunk):
+        for ch in chunk:
+            if self.complete: return
+            self.seen += 1
+            if not self.started:
+                if ch in _JSON_CLOSERS:
+                    self.started = True
+                    self.stack.append(_JSON_CLOSERS[ch])
+                elif self.seen > STREAM_PREAMBLE_LIMIT:
+                    raise StreamAbortedError(f"no JSON opened within {STREAM_PREAMBLE_LIMIT} chars")
+                continue
+            if self.in_string:
+                if self.escape: self.escape = False
+                elif ch == '\\': self.escape = True
+                elif ch == '"': self.in_string = False
+                continue
+            if ch == '"':
+                self.in_string = True
+            elif ch in _JSON_CLOSERS:
+                self.stack.append(_JSON_CLOSERS[ch])
+            elif ch in '}]':
+                if self.stack.pop() != ch:
+                    raise StreamAbortedError(f"mismatched '{ch}' at char {self.seen}")
+                if not self.stack:
+                    self.complete = True
+
+def _chunk_text(chunk):
+    """Extracts text from a Gemini or Puter stream chunk (SDK shapes vary)."""
+    if isinstance(chunk, str): return chunk
+    text = getattr(chunk, 'text', None)
+    if text is None and hasattr(chunk, 'message'):
+        text = getattr(chunk.message, 'content', None)
+    if text is None and isinstance(chunk, dict):
+        text = chunk.get('text') or chunk.get('content')
+    return text or ""
+
+def consume_json_stream(chunks, started, stream_stats=None):
+    """
+    Accumulates a streamed answer while validating it incrementally.
+    Text after the top-level JSON value closes is ignored, but the stream is still drained so the
+    final chunk's usage metadata gets booked; raises StreamAbortedError on malformed output.
+    Fills stream_stats with ttft/total (seconds since `started`; total = until the JSON closed).
+    """
+    scanner = IncrementalJSONScanner()
+    parts = []
+    ttft = None
+    total = None
+    for chunk in chunks:
+        if stream_stats is not None and _usage_counts(chunk):
+            stream_stats["usage_chunk"] = chunk # Usually only the final chunk carries it
+        if scanner.complete: continue # Draining: only the usage chunk still matters
+        text = _chunk_text(chunk)
+        if not text: continue
+        if ttft is None: ttft = time.monotonic() - started
+        parts.append(text)
+        scanner.feed(text)
+        if scanner.complete: total = time.monotonic() - started
+    if stream_stats is not None:
+        stream_stats["ttft"] = ttft
+        stream_stats["total"] = total if total is not None else time.monotonic() - started
+    return "".join(parts)
+
+def record_step_latency(step_name, source, total, ttft=None, streamed=False):
+    step_latencies.append({"step": step_name, "source": source, "ttft": ttft, "total": round(total, 3), "streamed": streamed})
+    ttft_txt = f"TTFT {ttft:.1f}s | " if ttft is not None else ""
+    log(f"      ⏱️ {step_name}: {ttft_txt}total {total:.1f}s ({source}).")
+
 # ==============================================================================
 # ENGINE 1: PUTER.JS (PRIMARY / TIER 1)
 # ==============================================================================
-def try_puter_generation(prompt, system_prompt):
+def try_puter_generation(prompt, system_prompt, stream=False, stream_stats=None):
     """
     Attempts to generate content using Puter.js (Accessing Claude/GPT).
+    With stream=True the answer is consumed chunk by chunk and abandoned as soon as it is clearly not JSON.
     """
     try:
         # log(f"   ⚡ Attempting Tier 1: Puter.js ({PUTER_MODEL})...")
@@ -130,190 +779,436 @@ def try_puter_generation(prompt, system_prompt):
         ]
         
         # Puter SDK call
+        started = time.monotonic()
         response = puter_sdk.ai.chat(
             messages=messages,
             model=PUTER_MODEL,
-            stream=False
+            stream=stream
         )
         
+        if stream:
+            stream_stats = {} if stream_stats is None else stream_stats
+            text = consume_json_stream(response, started, stream_stats)
+            book_usage(PUTER_MODEL, system_prompt + prompt, stream_stats.get("usage_chunk"), text)
         # Robustly handle Puter response structure
-        text = ""
-        if hasattr(response, 'message') and hasattr(response.message, 'content'):
+        elif hasattr(response, 'message') and hasattr(response.message, 'content'):
             text = response.message.content
         elif isinstance(response, str):
             text = response
         else:
             text = str(response)
+        if not stream:
+            book_usage(PUTER_MODEL, system_prompt + prompt, response, text)
 
-        if not text: return None
+        if not text: return ProviderFailure("empty")
         
         parsed = master_json_parser(text)
         if parsed:
             return parsed
         else:
             log("      ⚠️ Puter returned content but JSON parsing failed.")
-            return None
+            return ProviderFailure("bad_json")
 
+    except StreamAbortedError as e:
+        log(f"      ✂️ Puter stream aborted early: {e}")
+        return ProviderFailure("stream_aborted")
     except Exception as e:
         # Silently failover to Gemini (Uncomment log for debugging)
         # log(f"      ⚠️ Puter.js Skipped: {str(e)[:100]}")
-        return None
+        return ProviderFailure("api_error")
 
 # ==============================================================================
 # ENGINE 2: GOOGLE GEMINI (BACKUP / TIERS 2-5) - UPDATED WITH INTERNET ACCESS
 # ==============================================================================
-def try_gemini_generation(model_name, prompt, system_prompt, use_google_search=False):
+REPAIR_MODEL = "gemini-2.5-flash" # Use the fastest/cheapest model for repair
+
+def _build_generation_config(system_prompt, use_google_search=False):
+    """
+    Dynamic Tool & Config Selection (shared by the sync and async engines).
+    NOTE: When tools are enabled, response_mime_type must be None to avoid API conflict.
+    """
+    google_tools = None
+    current_mime_type = "application/json"
+    
+    if use_google_search:
+        # Activate the 'Radar' - Real-time Google Search access
+        google_tools = [types.Tool(google_search=types.GoogleSearch())]
+        current_mime_type = None # Disable strict JSON mode at API level to allow Tools
+
+    return types.GenerateContentConfig(
+        response_mime_type=current_mime_type, 
+        system_instruction=system_prompt, 
+        temperature=0.3,
+        tools=google_tools
+    )
+
+def _build_repair_request(raw_text):
+    """Prompt + config asking the model to extract pure JSON from a noisy answer."""
+    repair_prompt = f"Extract ONLY the valid JSON from the following text. Remove citations and conversational filler:\n\n{raw_text[:8000]}"
+    # Simple repair config (No tools, strict JSON)
+    repair_config = types.GenerateContentConfig(
+        response_mime_type="application/json",
+        temperature=0.1
+    )
+    return repair_prompt, repair_config
+
+def _is_quota_error(error_msg):
+    return "429" in error_msg or "quota" in error_msg or "limit" in error_msg
+
+def _is_not_found_error(error_msg):
+    return "404" in error_msg or "not found" in error_msg
+
+def try_gemini_generation(model_name, prompt, system_prompt, use_google_search=False, _attempt=0, stream=False, stream_stats=None):
     """
     Attempts to generate using a specific Gemini model.
-    Handles Key Rotation, Self-Repair, and API Errors.
+    Handles Key Scheduling, Self-Repair, and API Errors.
     INTEGRATED: Google Search Grounding (Internet Access) - Follows ai_researcher.py logic.
+    STREAMING: stream=True uses generate_content_stream and aborts early on malformed output.
     """
     model_slug = model_name.replace("models/", "")
     
-    # 1. Acquire Key and Client
-    key = key_manager.get_current_key()
+    # 1. Acquire Key (with the most rate headroom) and Client
+    key_index, key = key_manager.acquire_key(estimate_tokens(prompt))
     if not key: 
         raise RuntimeError("FATAL: No Gemini API Keys available in KeyManager.")
     
-    client = genai.Client(api_key=key)
+    client = client_pool.get(key)
     
     try:
         # 2. Dynamic Tool & Config Selection
-        # NOTE: When tools are enabled, response_mime_type must be None to avoid API conflict
-        google_tools = None
-        current_mime_type = "application/json"
-        
-        if use_google_search:
-            # Activate the 'Radar' - Real-time Google Search access
-            google_tools = [types.Tool(google_search=types.GoogleSearch())]
-            current_mime_type = None # Disable strict JSON mode at API level to allow Tools
-            # log(f"      📡 [Internet Access] Enabled for {model_slug}")
-
-        generation_config = types.GenerateContentConfig(
-            response_mime_type=current_mime_type, 
-            system_instruction=system_prompt, 
-            temperature=0.3,
-            tools=google_tools
-        )
+        generation_config = _build_generation_config(system_prompt, use_google_search)
         
         # 3. API Execution
-        response = client.models.generate_content(
-            model=model_slug, 
-            contents=prompt, 
-            config=generation_config
-        )
+        if stream:
+            started = time.monotonic()
+            stream_stats = {} if stream_stats is None else stream_stats
+            raw_text = consume_json_stream(
+                client.models.generate_content_stream(model=model_slug, contents=prompt, config=generation_config),
+                started, stream_stats
+            )
+            book_usage(model_slug, prompt, stream_stats.get("usage_chunk"), raw_text)
+        else:
+            response = client.models.generate_content(
+                model=model_slug, 
+                contents=prompt, 
+                config=generation_config
+            )
+            raw_text = response.text if response else None
+            book_usage(model_slug, prompt, response, raw_text)
         
-        if not response or not response.text:
-            return None
+        if not raw_text:
+            return ProviderFailure("empty")
 
         # 4. JSON Extraction Logic (Essential when response_mime_type is None)
-        parsed_data = master_json_parser(response.text)
+        parsed_data = master_json_parser(raw_text)
         
         # --- SELF-CORRECTION MECHANISM ---
         # If parsing fails (common when Internet Search adds citations/text), ask for repair
         if not parsed_data:
-            # log(f"      🔧 [Self-Repair] Attempting to fix non-JSON output from {model_slug}...")
-            repair_prompt = f"Extract ONLY the valid JSON from the following text. Remove citations and conversational filler:\n\n{response.text[:8000]}"
-            
-            # Simple repair config (No tools, strict JSON)
-            repair_config = types.GenerateContentConfig(
-                response_mime_type="application/json",
-                temperature=0.1
-            )
-            
+            repair_prompt, repair_config = _build_repair_request(raw_text)
             repair_resp = client.models.generate_content(
-                model="gemini-2.5-flash", # Use the fastest/cheapest model for repair
+                model=REPAIR_MODEL,
                 contents=repair_prompt, 
                 config=repair_config
             )
+            book_usage(REPAIR_MODEL, repair_prompt, repair_resp, repair_resp.text)
             parsed_data = master_json_parser(repair_resp.text)
             
-        return parsed_data
+        return parsed_data or ProviderFailure("bad_json")
+
+    except StreamAbortedError as e:
+        log(f"      ✂️ {model_slug} stream aborted early: {e}")
+        return ProviderFailure("stream_aborted")
 
     except Exception as e:
         error_msg = str(e).lower()
         
         # Handle Rate Limits (429) / Quota Exhaustion
-        if "429" in error_msg or "quota" in error_msg or "limit" in error_msg:
-            log(f"      ⚠️ Quota hit on {model_slug} (Key #{key_manager.current_index + 1}). Rotating...")
-            if key_manager.switch_key():
-                # Recursive retry with the new key
-                return try_gemini_generation(model_name, prompt, system_prompt, use_google_search)
+        if _is_quota_error(error_msg):
+            log(f"      ⚠️ Quota hit on {model_slug} (Key #{key_index + 1}). Rotating...")
+            key_manager.report_rate_limited(key)
+            if _attempt < len(key_manager.keys) - 1:
+                # Recursive retry: the scheduler now prefers another key
+                return try_gemini_generation(model_name, prompt, system_prompt, use_google_search, _attempt + 1, stream, stream_stats)
             else:
                 log("      ❌ FATAL: All keys exhausted for this model.")
-                return None
+                return ProviderFailure("quota")
                 
         # Handle Model Not Found (404)
-        elif "404" in error_msg or "not found" in error_msg:
+        elif _is_not_found_error(error_msg):
              log(f"      ⚠️ Model {model_slug} not found or unsupported by this API key.")
-             return None
+             model_health.trip(model_slug, MODEL_NOT_FOUND_COOLDOWN)
+             return ProviderFailure("not_found")
              
         else:
             log(f"      ❌ API Error on {model_slug}: {str(e)[:100]}")
-            return None
+            return ProviderFailure("api_error")
 
 # ==============================================================================
 # MASTER GENERATOR (ORCHESTRATOR) - UPDATED FOR MULTI-MODE EXECUTION
 # ==============================================================================
+def _build_model_waterfall(initial_model_name):
+    """
+    Prioritized list of Gemini models: the requested one first, then the rest of the chain,
+    reordered by observed health (see ModelHealth.order).
+    Once the run's token budget is spent only the cheap models are kept.
+    """
+    clean_initial = initial_model_name.replace("models/", "")
+    if clean_initial in GEMINI_FALLBACK_CHAIN:
+        # Add the rest of the chain, avoiding duplicates
+        chain = [clean_initial] + [m for m in GEMINI_FALLBACK_CHAIN if m != clean_initial]
+    else:
+        chain = list(GEMINI_FALLBACK_CHAIN)
+    if usage_tracker.over_budget():
+        chain = usage_tracker.degrade_chain(chain)
+    return model_health.order(chain)
+
+def _accept_result(provider, result, required_keys, started, source_label):
+    """Validation Gate + health bookkeeping for one provider attempt."""
+    if not result:
+        # Quota / network errors are not the model's fault: they must not open its breaker
+        if getattr(result, "model_fault", True):
+            model_health.record_failure(provider)
+        return False
+    try:
+        if required_keys: validate_structure(result, required_keys)
+    except JSONValidationError as ve:
+        log(f"      ⚠️ {source_label} returned invalid structure: {ve}. Trying next model...")
+        model_health.record_failure(provider)
+        return False
+    model_health.record_success(provider, time.monotonic() - started)
+    log(f"      ✅ Success (Source: {source_label}).")
+    return True
+
+@cassette.recordable("api_manager.generate_step_strict")
 @retry(
     stop=stop_after_attempt(5), 
     wait=wait_exponential(multiplier=1, min=2, max=10), 
     retry=retry_if_exception_type(Exception), 
     before_sleep=before_sleep_log(logger, logging.DEBUG)
 )
-def generate_step_strict(initial_model_name, prompt, step_name, required_keys=[], use_google_search=False):
+def generate_step_strict(initial_model_name, prompt, step_name, required_keys=[], use_google_search=False, use_cache=True, stream=False):
     """
     The Intelligence Hub.
-    Flow: Puter (Tier 1 - Only for Non-Search) -> Gemini Chain (Tiers 2-5).
+    Flow: Response Cache -> Puter (Tier 1 - Only for Non-Search) -> Gemini Chain (Tiers 2-5).
+    stream=True: for large article-producing steps; malformed streams fall through to the next model sooner.
     """
-    global API_HEAT
-    if API_HEAT > 0: time.sleep(1) # Micro-pause to prevent flooding
-    
+    # --- TIER 0: PERSISTENT RESPONSE CACHE ---
+    cache_key = ResponseCache.make_key(initial_model_name, prompt, required_keys, use_google_search)
+    cache_ttl = RESPONSE_CACHE_SEARCH_TTL if use_google_search else RESPONSE_CACHE_TTL
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            log(f"   ♻️ Cache Hit: {step_name} (skipped API call).")
+            return cached
+
     log(f"   🔄 Executing: {step_name} {'(with Web Search 🌐)' if use_google_search else ''}")
+    _current_step.set(step_name)
 
     # --- TIER 1: PUTER.JS (CLAUDE/GPT) ---
     # Puter.js currently does NOT support Google Search Tools via this SDK.
-    # Therefore, we skip Tier 1 if web search is requested.
-    if not use_google_search:
-        result = try_puter_generation(prompt, STRICT_SYSTEM_PROMPT)
-        if result:
-            try:
-                if required_keys: validate_structure(result, required_keys)
-                log(f"      ✅ Success (Source: Puter/Claude).")
-                return result
-            except JSONValidationError:
-                log("      ⚠️ Puter JSON structure invalid. Falling back to Gemini.")
-    else:
-        # log(f"      ℹ️ Skipping Puter.js (Tier 1) because Web Search is required.")
-        pass
+    # Therefore, we skip Tier 1 if web search is requested (or while its breaker is open / the budget is spent).
+    if not use_google_search and not usage_tracker.over_budget() and model_health.allow(PUTER_PROVIDER):
+        started = time.monotonic()
+        stream_stats = {}
+        result = try_puter_generation(prompt, STRICT_SYSTEM_PROMPT, stream=stream, stream_stats=stream_stats)
+        if _accept_result(PUTER_PROVIDER, result, required_keys, started, "Puter/Claude"):
+            record_step_latency(step_name, "Puter/Claude", time.monotonic() - started, stream_stats.get("ttft"), stream)
+            if use_cache: response_cache.set(cache_key, result, cache_ttl, step_name)
+            return result
 
     # --- TIER 2-5: GEMINI WATERFALL ---
-    # Construct the prioritized list of models
-    models_to_try = []
-    clean_initial = initial_model_name.replace("models/", "")
-    
-    if clean_initial in GEMINI_FALLBACK_CHAIN:
-        models_to_try.append(clean_initial)
-        # Add the rest of the chain, avoiding duplicates
-        models_to_try.extend([m for m in GEMINI_FALLBACK_CHAIN if m != clean_initial])
-    else:
-        models_to_try = GEMINI_FALLBACK_CHAIN
+    models_to_try = _build_model_waterfall(initial_model_name)
+    attempted = False
 
     # Iterate through the chain until one succeeds or all fail
     for model in models_to_try:
-        gemini_result = try_gemini_generation(model, prompt, STRICT_SYSTEM_PROMPT, use_google_search)
+        # Circuit Breaker: skip open models; if every breaker is open, force-probe the last one in line
+        if not model_health.allow(model, force=(not attempted and model == models_to_try[-1])):
+            log(f"      ⏭️ [Breaker] Skipping {model} (circuit open).")
+            continue
+        attempted = True
+        started = time.monotonic()
+        stream_stats = {}
+        gemini_result = try_gemini_generation(model, prompt, STRICT_SYSTEM_PROMPT, use_google_search, stream=stream, stream_stats=stream_stats)
         
-        if gemini_result:
-            try:
-                # Validation Gate
-                if required_keys: validate_structure(gemini_result, required_keys)
-                log(f"      ✅ Success (Source: {model}).")
-                return gemini_result
-            except JSONValidationError as ve:
-                log(f"      ⚠️ {model} returned invalid structure: {ve}. Trying next model...")
-                continue # Try next model in the waterfall
-        
-        # If None (API/Auth failure), the loop continues to the next model automatically.
+        if _accept_result(model, gemini_result, required_keys, started, model):
+            record_step_latency(step_name, model, time.monotonic() - started, stream_stats.get("ttft"), stream)
+            if use_cache: response_cache.set(cache_key, gemini_result, cache_ttl, step_name)
+            return gemini_result
+        # If None/invalid, the loop continues to the next model automatically.
 
     # If the loop finishes without a return
     raise RuntimeError(f"❌ CRITICAL FAILURE: All AI Models (Puter + Gemini Chain) failed for step: {step_name}")
+
+# ==============================================================================
+# ASYNC ENGINE: CONCURRENT STEPS (agenerate_step_strict)
+# ==============================================================================
+class _AsyncLimits:
+    """
+    Global + per-key semaphores for the async engine.
+    asyncio primitives are bound to the loop that first uses them, so the set is
+    rebuilt whenever a new event loop (e.g. a fresh asyncio.run) is detected.
+    """
+    def __init__(self):
+        self._loop = None
+        self.global_sem = None
+        self._per_key = {}
+
+    def _ensure_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self.global_sem = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+            self._per_key = {}
+
+    def global_slot(self):
+        self._ensure_loop()
+        return self.global_sem
+
+    def key_slot(self, key):
+        self._ensure_loop()
+        sem = self._per_key.get(key)
+        if sem is None:
+            sem = asyncio.Semaphore(ASYNC_PER_KEY_CONCURRENCY)
+            self._per_key[key] = sem
+        return sem
+
+_async_limits = _AsyncLimits()
+
+async def try_gemini_generation_async(model_name, prompt, system_prompt, use_google_search=False, _attempt=0):
+    """
+    Async twin of try_gemini_generation built on client.aio.
+    Concurrency on each key is capped by ASYNC_PER_KEY_CONCURRENCY.
+    """
+    model_slug = model_name.replace("models/", "")
+    
+    key_index, key, wait = key_manager.reserve_key(estimate_tokens(prompt))
+    if not key: 
+        raise RuntimeError("FATAL: No Gemini API Keys available in KeyManager.")
+    if wait > 0:
+        await asyncio.sleep(wait)
+    
+    client = client_pool.get(key)
+    
+    try:
+        async with _async_limits.key_slot(key):
+            response = await client.aio.models.generate_content(
+                model=model_slug, 
+                contents=prompt, 
+                config=_build_generation_config(system_prompt, use_google_search)
+            )
+            if response: book_usage(model_slug, prompt, response, response.text)
+            
+            if not response or not response.text:
+                return ProviderFailure("empty")
+
+            parsed_data = master_json_parser(response.text)
+            
+            # --- SELF-CORRECTION MECHANISM ---
+            if not parsed_data:
+                repair_prompt, repair_config = _build_repair_request(response.text)
+                repair_resp = await client.aio.models.generate_content(
+                    model=REPAIR_MODEL,
+                    contents=repair_prompt, 
+                    config=repair_config
+                )
+                book_usage(REPAIR_MODEL, repair_prompt, repair_resp, repair_resp.text)
+                parsed_data = master_json_parser(repair_resp.text)
+                
+            return parsed_data or ProviderFailure("bad_json")
+
+    except Exception as e:
+        error_msg = str(e).lower()
+        
+        if _is_quota_error(error_msg):
+            log(f"      ⚠️ Quota hit on {model_slug} (Key #{key_index + 1}). Rotating...")
+            key_manager.report_rate_limited(key)
+            if _attempt < len(key_manager.keys) - 1:
+                return await try_gemini_generation_async(model_name, prompt, system_prompt, use_google_search, _attempt + 1)
+            log("      ❌ FATAL: All keys exhausted for this model.")
+            return ProviderFailure("quota")
+                
+        elif _is_not_found_error(error_msg):
+             log(f"      ⚠️ Model {model_slug} not found or unsupported by this API key.")
+             model_health.trip(model_slug, MODEL_NOT_FOUND_COOLDOWN)
+             return ProviderFailure("not_found")
+             
+        else:
+            log(f"      ❌ API Error on {model_slug}: {str(e)[:100]}")
+            return ProviderFailure("api_error")
+
+@cassette.recordable("api_manager.agenerate_step_strict")
+@retry(
+    stop=stop_after_attempt(5), 
+    wait=wait_exponential(multiplier=1, min=2, max=10), 
+    retry=retry_if_exception_type(Exception), 
+    before_sleep=before_sleep_log(logger, logging.DEBUG)
+)
+async def agenerate_step_strict(initial_model_name, prompt, step_name, required_keys=[], use_google_search=False, use_cache=True):
+    """
+    Coroutine variant of generate_step_strict for independent steps.
+    Same flow (Cache -> Puter -> Gemini Chain), bounded by ASYNC_MAX_CONCURRENCY.
+    Usage: await asyncio.gather(agenerate_step_strict(...), agenerate_step_strict(...))
+    """
+    cache_key = ResponseCache.make_key(initial_model_name, prompt, required_keys, use_google_search)
+    cache_ttl = RESPONSE_CACHE_SEARCH_TTL if use_google_search else RESPONSE_CACHE_TTL
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            log(f"   ♻️ Cache Hit: {step_name} (skipped API call).")
+            return cached
+
+    async with _async_limits.global_slot():
+        log(f"   🔄 Executing (async): {step_name} {'(with Web Search 🌐)' if use_google_search else ''}")
+        _current_step.set(step_name)
+
+        # --- TIER 1: PUTER.JS (blocking SDK -> worker thread) ---
+        if not use_google_search and not usage_tracker.over_budget() and model_health.allow(PUTER_PROVIDER):
+            started = time.monotonic()
+            result = await asyncio.to_thread(try_puter_generation, prompt, STRICT_SYSTEM_PROMPT)
+            if _accept_result(PUTER_PROVIDER, result, required_keys, started, "Puter/Claude"):
+                record_step_latency(step_name, "Puter/Claude", time.monotonic() - started)
+                if use_cache: response_cache.set(cache_key, result, cache_ttl, step_name)
+                return result
+
+        # --- TIER 2-5: GEMINI WATERFALL ---
+        models_to_try = _build_model_waterfall(initial_model_name)
+        attempted = False
+        for model in models_to_try:
+            if not model_health.allow(model, force=(not attempted and model == models_to_try[-1])):
+                log(f"      ⏭️ [Breaker] Skipping {model} (circuit open).")
+                continue
+            attempted = True
+            started = time.monotonic()
+            gemini_result = await try_gemini_generation_async(model, prompt, STRICT_SYSTEM_PROMPT, use_google_search)
+            
+            if _accept_result(model, gemini_result, required_keys, started, model):
+                record_step_latency(step_name, model, time.monotonic() - started)
+                if use_cache: response_cache.set(cache_key, gemini_result, cache_ttl, step_name)
+                return gemini_result
+
+    raise RuntimeError(f"❌ CRITICAL FAILURE: All AI Models (Puter + Gemini Chain) failed for step: {step_name}")
+
+# One event loop for every batch: the pooled clients' client.aio (httpx AsyncClient) binds to the
+# loop of its first request, so a fresh asyncio.run per batch would fail with "Event loop is closed".
+_steps_loop = None
+_steps_loop_lock = threading.Lock()
+
+def _get_steps_loop():
+    global _steps_loop
+    if _steps_loop is None or _steps_loop.is_closed():
+        _steps_loop = asyncio.new_event_loop()
+    return _steps_loop
+
+def run_steps_concurrently(*coroutines):
+    """
+    Sync bridge for the pipeline: runs independent step coroutines together and
+    returns their results in order. Failed steps come back as the raised Exception
+    so each caller can keep its own fallback logic.
+    All batches share one long-lived event loop (see _steps_loop).
+    """
+    async def _gather():
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+    with _steps_loop_lock:
+        return _get_steps_loop().run_until_complete(_gather())
@@ -0,0 +1,359 @@
+"""
+benchmark_suite.py
+==================
+Micro-benchmarks for the hot paths of the pipeline. Each benchmark compares the
+legacy implementation against the current one on the same inputs.
+
+Usage: python3 benchmark_suite.py [benchmark ...] [--samples DIR]
+
+  json_parser   master_json_parser vs. the old recursive-regex + json_repair-first parser.
+                --samples DIR loads captured raw model outputs (*.txt / *.json) instead of
+                the built-in synthetic responses.
+  pipeline      End-to-end main.main() replayed from a cassette (see cassette.py), no network.
+                --samples DIR is the cassette directory (default: cassettes/default).
+                State files (knowledge_graph.json, ...) are copied to a temp dir first.
+  title_matcher Phase-1 duplicate scan: legacy difflib loop over every KG title vs. the trigram
+                TitleIndex, at 200 / 2k / 20k titles (agreement with the legacy verdicts is reported).
+  vector_search Semantic-linking top-5: exact float32 scan (same ranking as the legacy cosine_similarity)
+                vs. the binary-quantized first pass + exact re-rank, at KG size / 2k / 20k vectors built
+                from knowledge_graph_embeddings.npy. Reports scan memory and top-5 recall (target >= 0.95).
+  startup       Cold-import time of history_manager (fresh interpreter per sample) vs. the legacy
+                eager behaviour (import + SentenceTransformer load), per embedding backend.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import subprocess
+import tempfile
+import statistics
+
+sys.path.insert(0, '.')
+
+
+def _timeit(fn, inputs, rounds=5):
+    """Returns the median wall time (seconds) of running fn over every input, `rounds` times."""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for item in inputs:
+            fn(item)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def _report(name, legacy_s, current_s, extra=""):
+    speedup = legacy_s / current_s if current_s else float("inf")
+    print(f"  {name:<28} legacy {legacy_s*1000:9.2f} ms | current {current_s*1000:9.2f} ms | x{speedup:6.1f} {extra}")
+
+
+# ---------------------------------------------------------------------------
+# JSON PARSER
+# ---------------------------------------------------------------------------
+def _legacy_json_parser(text):
+    import regex
+    import json_repair
+    if not text: return None
+    clean_text = text.replace("```json", "").replace("```", "").strip()
+    match = regex.search(r'\{(?:[^{}]|(?R))*\}|\[(?:[^\[\]]|(?R))*\]', clean_text, regex.DOTALL)
+    candidate = match.group(0) if match else clean_text
+    try:
+        decoded = json_repair.repair_json(candidate, return_objects=True)
+        if isinstance(decoded, (dict, list)): return decoded
+    except: pass
+    try:
+        return json.loads(candidate)
+    except: return None
+
+
+def _synthetic_article_html(paragraphs):
+    rnd = random.Random(paragraphs)
+    words = ["model", "latency", "benchmark", "pricing", "tokens", "workflow", "API", "release",
+             "context", "window", "creators", "video", "voice", "quality", "update", "official"]
+    body = ['<h2 id="section-1">What\'s New</h2>']
+    for i in range(paragraphs):
+        sentence = " ".join(rnd.choice(words) for _ in range(40))
+        body.append(f'<p style="margin: 10px 0;">{sentence} <a href="https://example.com/{i}" target="_blank">source {i}</a>.</p>')
+        if i % 6 == 0:
+            body.append('<table><tr><th>Plan</th><th>Price</th></tr><tr><td>Pro</td><td>$20 {"monthly"}</td></tr></table>')
+    return "\n".join(body)
+
+
+def _synthetic_responses():
+    """
+    Shapes seen in production: JSON mode, fenced JSON, grounded prose + JSON, truncated, trailing commas.
+    Returns {name: (raw_text, expected_top_level_keys_or_len)}.
+    """
+    small = {"is_duplicate": False, "conflict_title": "None", "reason": "Different product and intent."}
+    artisan = {"headline": "Sora 2 Pricing Explained", "article_body": _synthetic_article_html(120)}
+    seo = {"finalTitle": "Sora 2: Real Costs", "finalContent": _synthetic_article_html(200),
+           "seo": {"metaTitle": "x", "metaDescription": "y"}, "schemaMarkup": {"OUTPUT": {"@type": "Article"}}}
+    sources = [{"title": f"Page {i}", "link": f"https://site{i}.com/a"} for i in range(15)]
+    artisan_keys = sorted(artisan)
+    return {
+        "dedup_judge (json mode)": (json.dumps(small), sorted(small)),
+        "artisan (json mode)": (json.dumps(artisan, ensure_ascii=False), artisan_keys),
+        "seo_polish (fenced)": ("```json\n" + json.dumps(seo, ensure_ascii=False, indent=2) + "\n```", sorted(seo)),
+        "grounded (prose + json)": ("Here are the sources:\n" + json.dumps(sources) + "\nLet me know!", len(sources)),
+        "trailing comma": (json.dumps(artisan, ensure_ascii=False)[:-1] + ',}', artisan_keys),
+        "truncated": (json.dumps(artisan, ensure_ascii=False)[:-400], artisan_keys),
+    }
+
+
+def _shape(parsed):
+    if isinstance(parsed, dict): return sorted(parsed)
+    if isinstance(parsed, list): return len(parsed)
+    return None
+
+
+def _load_samples(samples_dir):
+    """Captured raw outputs have no ground truth, so correctness is judged as 'both parsers agree'."""
+    samples = {}
+    for name in sorted(os.listdir(samples_dir)):
+        if name.endswith((".txt", ".json")):
+            with open(os.path.join(samples_dir, name), 'r', encoding='utf-8') as f:
+                samples[name] = (f.read(), None)
+    return samples
+
+
+def bench_json_parser(samples_dir=None):
+    from api_manager import master_json_parser
+    samples = _load_samples(samples_dir) if samples_dir else _synthetic_responses()
+    print(f"\n[json_parser] {len(samples)} responses, {sum(len(v[0]) for v in samples.values())/1024:.0f} KB total")
+    total_legacy = total_current = 0.0
+    skipped = []
+    for name, (raw, expected) in samples.items():
+        rounds = 3 if len(raw) > 20000 else 20
+        legacy_s = _timeit(_legacy_json_parser, [raw], rounds)
+        current_s = _timeit(master_json_parser, [raw], rounds)
+        legacy_out, current_out = _legacy_json_parser(raw), master_json_parser(raw)
+        if expected is None:
+            verdict = "agree" if legacy_out == current_out else "DIFFER"
+        else:
+            verdict = (f"legacy {'ok' if _shape(legacy_out) == expected else 'WRONG'}, "
+                       f"current {'ok' if _shape(current_out) == expected else 'WRONG'}")
+        _report(f"{name} ({len(raw)/1024:.0f}KB)", legacy_s, current_s, verdict)
+        if "WRONG" in verdict or verdict == "DIFFER":
+            skipped.append(name) # A wrong answer is not a fair speed comparison
+            continue
+        total_legacy += legacy_s
+        total_current += current_s
+    _report("TOTAL (matching results)", total_legacy, total_current,
+            f"excluded: {', '.join(skipped)}" if skipped else "")
+
+
+# ---------------------------------------------------------------------------
+# END-TO-END PIPELINE (CASSETTE REPLAY)
+# ---------------------------------------------------------------------------
+PIPELINE_STATE_FILES = ["config_advanced.json", "knowledge_graph.json", "knowledge_graph_embeddings.npy",
+                        "knowledge_graph.journal.jsonl", "knowledge_graph.db",
+                        ".ai_cache/knowledge_graph_text.jsonl", "content_plan.json", "source_reputation.json",
+                        "model_health.json"]
+
+def bench_pipeline(samples_dir=None):
+    repo_dir = os.path.abspath('.')
+    cassette_dir = os.path.abspath(samples_dir or os.path.join("cassettes", "default"))
+    if not os.path.isdir(cassette_dir):
+        print(f"\n[pipeline] No cassette at {cassette_dir}. Record one first: PIPELINE_CASSETTE=record python3 main.py")
+        return
+    work_dir = tempfile.mkdtemp(prefix="pipeline_replay_")
+    for name in PIPELINE_STATE_FILES:
+        if os.path.exists(os.path.join(repo_dir, name)):
+            os.makedirs(os.path.dirname(os.path.join(work_dir, name)), exist_ok=True)
+            shutil.copy(os.path.join(repo_dir, name), os.path.join(work_dir, name))
+    sys.path.insert(0, repo_dir)
+    os.chdir(work_dir) # Modules read/write their JSON state relative to the cwd
+    try:
+        import cassette
+        cassette.activate("replay", cassette_dir)
+        start = time.perf_counter()
+        import main
+        import_s = time.perf_counter() - start
+        start = time.perf_counter()
+        main.main()
+        run_s = time.perf_counter() - start
+        print(f"\n[pipeline] replay of {cassette_dir}")
+        print(f"  imports {import_s:7.2f} s | main.main() {run_s:7.2f} s | total {import_s + run_s:7.2f} s")
+        misses = cassette._active.misses
+        if misses:
+            print(f"  ⚠️ {len(misses)} cassette miss(es), replay diverged from the recording: "
+                  f"{sorted(set(name for name, _ in misses))}")
+    finally:
+        os.chdir(repo_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+# STARTUP (COLD IMPORT OF history_manager)
+# ---------------------------------------------------------------------------
+_STARTUP_PROBE = """
+import sys, time, json
+sys.path.insert(0, {repo!r})
+start = time.perf_counter()
+import history_manager
+imported = time.perf_counter() - start
+loaded = None
+if {load_model!r}:
+    history_manager.configure({{"embedding_model": {{"backend": {backend!r}}}}})
+    try:
+        start = time.perf_counter()
+        history_manager._generate_embedding("warm up")
+        loaded = time.perf_counter() - start
+    except Exception as e:
+        loaded = str(e)[:80]
+print("STARTUP_RESULT " + json.dumps({{"import": imported, "model": loaded}}))
+"""
+
+def _startup_sample(repo_dir, work_dir, load_model, backend="torch"):
+    code = _STARTUP_PROBE.format(repo=repo_dir, load_model=load_model, backend=backend)
+    proc = subprocess.run([sys.executable, "-c", code], cwd=work_dir, capture_output=True, text=True, timeout=600)
+    for line in proc.stdout.splitlines():
+        if line.startswith("STARTUP_RESULT "):
+            return json.loads(line[len("STARTUP_RESULT "):])
+    return {"import": None, "model": (proc.stderr.strip().splitlines() or ["failed"])[-1][:80]}
+
+def bench_startup(samples=3):
+    repo_dir = os.path.abspath('.')
+    work_dir = tempfile.mkdtemp(prefix="startup_bench_")
+    for name in PIPELINE_STATE_FILES:
+        if os.path.exists(os.path.join(repo_dir, name)):
+            os.makedirs(os.path.dirname(os.path.join(work_dir, name)), exist_ok=True)
+            shutil.copy(os.path.join(repo_dir, name), os.path.join(work_dir, name))
+    try:
+        print(f"\n[startup] cold import of history_manager, median of {samples} fresh interpreters")
+        lazy = [_startup_sample(repo_dir, work_dir, False)["import"] for _ in range(samples)]
+        lazy = [t for t in lazy if isinstance(t, float)]
+        if not lazy:
+            print("  history_manager failed to import in this environment.")
+            return
+        lazy_s = statistics.median(lazy)
+        print(f"  lazy import (current)        {lazy_s*1000:9.1f} ms")
+        for backend in ("torch", "onnx"):
+            runs = [_startup_sample(repo_dir, work_dir, True, backend) for _ in range(samples)]
+            loads = [r["model"] for r in runs if isinstance(r["model"], float)]
+            if not loads:
+                print(f"  model load ({backend:<5})           skipped: {runs[0]['model']}")
+                continue
+            load_s = statistics.median(loads)
+            _report(f"eager import ({backend})", lazy_s + load_s, lazy_s, f"(first embedding pays {load_s:.2f} s)")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+# TITLE MATCHER (PHASE-1 DUPLICATE SCAN)
+# ---------------------------------------------------------------------------
+def _legacy_phase1(target, titles, threshold):
+    import difflib
+    target = target.strip().lower()
+    for title in titles:
+        existing = title.lower()
+        if difflib.SequenceMatcher(None, target, existing).ratio() > threshold: return True
+        if len(target) > 8 and target in existing: return True
+    return False
+
+def _synthetic_titles(count, rnd):
+    products = ["Sora 2", "Veo 3", "Runway Gen-4", "Kling 2.1", "ElevenLabs v3", "Suno v4.5", "Udio", "HeyGen",
+                "Synthesia", "Pika 2.2", "Luma Ray2", "Midjourney V7", "CapCut AI", "Descript", "Gemini 2.5",
+                "Claude 4", "GPT-5", "Llama 4", "Flux Kontext", "Ideogram 3", "Hailuo 02", "Hedra", "Captions"]
+    angles = ["Pricing Explained", "Review After 30 Days", "vs the Competition", "Hidden Limits",
+              "Complete Guide for Creators", "What Changed in the Update", "Is It Worth It", "Real Benchmarks",
+              "API Deep Dive", "for Faceless YouTube Channels", "Tips Nobody Tells You", "Free Plan Tested"]
+    qualifiers = ["2026", "Honest Take", "Step by Step", "for Beginners", "Pro Workflow", "Case Study", ""]
+    return [f"{rnd.choice(products)} {rnd.choice(angles)}: {rnd.choice(qualifiers)} #{i}".strip()
+            for i in range(count)]
+
+def _title_queries(titles, rnd, count):
+    queries = []
+    for i in range(count):
+        base = rnd.choice(titles)
+        kind = i % 3
+        if kind == 0:   queries.append(base.lower().replace(":", "").rsplit("#", 1)[0])   # near duplicate
+        elif kind == 1: queries.append(base.split(":")[0])                               # substring
+        else:           queries.append(f"Unrelated topic about gardening tools {i}")     # clean miss
+    return queries
+
+def bench_title_matcher():
+    from title_matcher import TitleIndex
+    threshold = 0.65
+    rnd = random.Random(7)
+    for size, query_count in ((200, 60), (2000, 30), (20000, 6)):
+        titles = _synthetic_titles(size, rnd)
+        queries = _title_queries(titles, rnd, query_count)
+        start = time.perf_counter()
+        index = TitleIndex()
+        for title in titles: index.add(title)
+        build_s = time.perf_counter() - start
+        legacy_s = _timeit(lambda q: _legacy_phase1(q, titles, threshold), queries, rounds=1)
+        current_s = _timeit(lambda q: index.first_match(q, threshold), queries, rounds=3)
+        agree = sum(_legacy_phase1(q, titles, threshold) == bool(index.first_match(q, threshold)) for q in queries)
+        print(f"\n[title_matcher] {size} titles, {query_count} queries (index build {build_s*1000:.0f} ms)")
+        _report("phase-1 scan", legacy_s, current_s, f"agreement {agree}/{query_count}")
+
+
+# ---------------------------------------------------------------------------
+# VECTOR SEARCH (QUANTIZED FIRST PASS + EXACT RE-RANK)
+# ---------------------------------------------------------------------------
+RECALL_TARGET = 0.95
+
+def _synthetic_vectors(base, count, rng):
+    """Real KG vectors plus noise: the same neighbourhood structure at a larger archive size."""
+    import numpy as np
+    if count <= len(base): return base[:count]
+    picks = base[rng.randint(0, len(base), count)]
+    return picks + rng.randn(count, base.shape[1]).astype(np.float32) * 0.06
+
+def bench_vector_search():
+    import numpy as np
+    from vector_index import VectorIndex, BinaryVectorIndex, normalize_rows
+    if not os.path.exists("knowledge_graph_embeddings.npy"):
+        print("\n[vector_search] knowledge_graph_embeddings.npy not found. Skipped.")
+        return
+    base = normalize_rows(np.load("knowledge_graph_embeddings.npy"))
+    rng = np.random.RandomState(11)
+    for size, query_count in ((len(base), 100), (2000, 100), (20000, 50)):
+        store = normalize_rows(_synthetic_vectors(base, size, rng))
+        keys = list(range(size))
+        queries = normalize_rows(store[rng.randint(0, size, query_count)] +
+                                 rng.randn(query_count, store.shape[1]).astype(np.float32) * 0.05)
+        exact = VectorIndex(store.shape[1])
+        exact.add_many(keys, store)
+        quantized = BinaryVectorIndex(store.shape[1], lambda: store)
+        quantized.add_many(keys, keys)
+        legacy_s = _timeit(lambda q: exact.search(q, 5), queries, rounds=3)
+        current_s = _timeit(lambda q: quantized.search(q, 5), queries, rounds=3)
+        recall = np.mean([len({k for _, k in exact.search(q, 5)} & {k for _, k in quantized.search(q, 5)}) / 5
+                          for q in queries])
+        scan_ratio = exact.matrix.nbytes / quantized._codes[:size].nbytes
+        print(f"\n[vector_search] {size} vectors, {query_count} queries (scan memory /{scan_ratio:.0f})")
+        _report("top-5 search", legacy_s, current_s,
+                f"recall@5 {recall:.3f} {'PASS' if recall >= RECALL_TARGET else 'FAIL'}")
+
+
+BENCHMARKS = {
+    "json_parser": bench_json_parser,
+    "pipeline": bench_pipeline,
+    "startup": bench_startup,
+    "title_matcher": bench_title_matcher,
+    "vector_search": bench_vector_search,
+}
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    samples_dir = None
+    if "--samples" in args:
+        idx = args.index("--samples")
+        samples_dir = args[idx + 1]
+        del args[idx:idx + 2]
+    selected = args or list(BENCHMARKS)
+    for name in selected:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name}. Available: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+        if name in ("json_parser", "pipeline"):
+            BENCHMARKS[name](samples_dir)
+        else:
+            BENCHMARKS[name]()
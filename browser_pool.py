@@ -0,0 +1,190 @@
+# FILE: browser_pool.py
+# ROLE: Shared Headless Chrome Pool (scraper.py, url_resolver.py)
+# DESCRIPTION: Starts up to BROWSER_POOL_SIZE drivers once per process instead of one Chrome per URL.
+#              Each caller gets a fresh tab with its own user agent; cookies and site storage are wiped over
+#              CDP when the tab is returned, crashed or worn-out drivers are replaced, and the chromedriver
+#              path is resolved once.
+# USAGE:  with browser_pool.page(timeout=60) as driver:
+#             driver.get(url)
+
+import time
+import queue
+import atexit
+import random
+import threading
+import contextlib
+import urllib.parse
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import WebDriverException
+from webdriver_manager.chrome import ChromeDriverManager
+from config import log, USER_AGENTS
+
+# --- CONFIGURATION ---
+BROWSER_POOL_SIZE = 2        # Drivers kept alive; callers beyond this wait for a free one
+DRIVER_MAX_USES = 30         # Recycle a driver after this many pages (Chrome memory creep)
+ACQUIRE_TIMEOUT = 180        # Seconds a caller waits for a free driver
+SETTLE_POLL = 0.2            # Seconds between readiness checks (replaces fixed sleeps)
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+def _get_driver_path():
+    """ChromeDriverManager().install() hits the network and the disk: do it once per process."""
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            _driver_path = ChromeDriverManager().install()
+    return _driver_path
+
+def _build_options():
+    chrome_options = Options()
+    chrome_options.page_load_strategy = 'eager' # DOM ready is enough; images are awaited by wait_for_settle()
+    chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--window-size=1920,1080")
+    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    chrome_options.add_argument(f'user-agent={random.choice(USER_AGENTS)}')
+    return chrome_options
+
+def wait_for_settle(driver, max_wait=1.5):
+    """Returns as soon as the document and its images finished loading (at most max_wait seconds)."""
+    deadline = time.time() + max_wait
+    while time.time() < deadline:
+        try:
+            if driver.execute_script(
+                    "return document.readyState === 'complete' && "
+                    "Array.from(document.images).every(function (img) { return img.complete; });"):
+                return True
+        except WebDriverException:
+            return False
+        time.sleep(SETTLE_POLL)
+    return False
+
+class BrowserPool:
+    def __init__(self, size=BROWSER_POOL_SIZE):
+        self.size = size
+        self._slots = threading.BoundedSemaphore(size)   # At most `size` drivers alive (idle + in use)
+        self._idle = queue.LifoQueue()   # Most recently used driver first (warm caches)
+        self._uses = {}                  # id(driver) -> pages served
+        self._lock = threading.Lock()    # Guards _uses / _started (callers run on several threads)
+        self._started = 0
+        self._closed = False
+
+    def _start_driver(self):
+        driver = webdriver.Chrome(service=Service(_get_driver_path()), options=_build_options())
+        with self._lock:
+            self._uses[id(driver)] = 0
+            self._started += 1
+            started = self._started
+        log(f"      🌐 [Browser Pool] Started Chrome #{started} (pool size {self.size}).")
+        return driver
+
+    def _checkout(self):
+        """Idle driver if any (dead ones, e.g. Chrome crash or OOM kill, are replaced), else a new one."""
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                return self._start_driver()
+            if self._is_alive(driver): return driver
+            log("      ♻️ [Browser Pool] Replacing a crashed Chrome.")
+            self._discard(driver)
+
+    def _discard(self, driver):
+        with self._lock:
+            self._uses.pop(id(driver), None)
+        try: driver.quit()
+        except Exception: pass
+
+    def _release(self, driver, healthy):
+        with self._lock:
+            reusable = healthy and not self._closed and self._uses.get(id(driver), 0) < DRIVER_MAX_USES
+        if reusable:
+            self._idle.put(driver)
+        else:
+            self._discard(driver)
+
+    @staticmethod
+    def _clear_state(driver):
+        """
+        Wipes what the last page left behind before the driver serves another caller:
+        all cookies, plus storage (localStorage, IndexedDB, cache storage, service workers)
+        of the origin it ended on and, where Chrome accepts the wildcard, of every origin.
+        """
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        parts = urllib.parse.urlsplit(driver.current_url or "")
+        origins = ["*"]
+        if parts.scheme in ("http", "https"): origins.insert(0, f"{parts.scheme}://{parts.netloc}")
+        for origin in origins:
+            try:
+                driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            except WebDriverException:
+                pass
+
+    @contextlib.contextmanager
+    def page(self, timeout=60, acquire_timeout=ACQUIRE_TIMEOUT):
+        """
+        Yields a driver focused on a fresh tab. The tab is closed afterwards; a driver that crashed
+        (or served DRIVER_MAX_USES pages) is quit and replaced on the next request.
+        """
+        if not self._slots.acquire(timeout=acquire_timeout):
+            raise TimeoutError(f"No browser free after {acquire_timeout:.0f}s")
+        driver = None
+        healthy = True
+        base_handle = None
+        try:
+            driver = self._checkout()
+            base_handle = driver.window_handles[0]
+            driver.switch_to.new_window('tab')
+            try:
+                driver.execute_cdp_cmd("Network.setUserAgentOverride", {"userAgent": random.choice(USER_AGENTS)})
+            except Exception:
+                pass # Non-Chromium driver: keeps the launch user agent
+            driver.set_page_load_timeout(timeout)
+            with self._lock:
+                self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+            yield driver
+        except WebDriverException:
+            healthy = driver is not None and self._is_alive(driver)
+            raise
+        finally:
+            if driver is not None:
+                if healthy:
+                    try:
+                        self._clear_state(driver)
+                    except Exception:
+                        healthy = False # Non-Chromium driver or dead session: never hand it out with stale state
+                    try:
+                        if healthy and driver.current_window_handle != base_handle:
+                            driver.close()
+                        driver.switch_to.window(base_handle)
+                    except Exception:
+                        healthy = False
+                self._release(driver, healthy)
+            self._slots.release()
+
+    @staticmethod
+    def _is_alive(driver):
+        try:
+            driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+_pool = BrowserPool()
+atexit.register(_pool.close)
+
+def page(timeout=60, acquire_timeout=ACQUIRE_TIMEOUT):
+    return _pool.page(timeout, acquire_timeout)
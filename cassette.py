@@ -0,0 +1,210 @@
+# FILE: cassette.py
+# ROLE: Record/Replay Harness for every external call of the pipeline
+# USAGE: PIPELINE_CASSETTE=record python main.py   -> runs live and captures each interaction to disk
+#        PIPELINE_CASSETTE=replay python main.py   -> replays the captured interactions (no network, no keys)
+#        PIPELINE_CASSETTE_DIR=cassettes/<name>    -> cassette location (default: cassettes/default)
+# FEATURES: Strict argument-hash matching (CassetteMiss on drift), async support, recorded exceptions, seeded randomness.
+
+import os
+import re
+import json
+import random
+import hashlib
+import builtins
+import functools
+import threading
+import inspect
+import contextvars
+from config import log
+
+# --- CONFIGURATION ---
+CASSETTE_MODE = os.getenv("PIPELINE_CASSETTE", "off").lower()   # off | record | replay
+CASSETTE_DIR = os.getenv("PIPELINE_CASSETTE_DIR", os.path.join("cassettes", "default"))
+CASSETTE_SEED = 1337   # random.shuffle in main.py must pick the same order when recording and replaying
+ARGS_PREVIEW_CHARS = 300
+
+# Values that change between runs but do not change the meaning of a call (object ids, dates, clock times)
+_VOLATILE_RE = re.compile(r' at 0x[0-9a-fA-F]+|\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2})?(?:\.\d+)?)?|\b\d{2}:\d{2}:\d{2}\b')
+
+class CassetteMiss(Exception): pass
+
+# Set while a recorded call runs: nested recordable calls (e.g. the LLM vetting inside get_strict_rss)
+# are covered by the outer entry and must not be taped twice.
+_inside_call = contextvars.ContextVar("cassette_inside_call", default=False)
+
+def _encode(value):
+    """JSON-safe encoding that keeps tuples as tuples (resolve_and_scrape returns one)."""
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(v) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _encode(v) for k, v in value.items()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes_sha256__": hashlib.sha256(value).hexdigest()}
+    return repr(value)
+
+def _decode(value):
+    if isinstance(value, dict):
+        if set(value) == {"__tuple__"}:
+            return tuple(_decode(v) for v in value["__tuple__"])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+def _call_digest(name, args, kwargs):
+    material = json.dumps([name, _encode(args), _encode(kwargs)], sort_keys=True, ensure_ascii=False)
+    material = _VOLATILE_RE.sub("", material)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class Cassette:
+    """
+    One directory per recorded function; one JSON file per call, prefixed with its call order.
+    Replay matches on the argument hash only (dates / clock times / object ids are stripped first);
+    identical calls are served in call order. A call whose arguments match nothing raises CassetteMiss
+    rather than being answered with some other call's response.
+    """
+    def __init__(self, mode, root):
+        self.mode = mode
+        self.root = root
+        self._lock = threading.Lock()
+        self._sequence = {}   # name -> next call index (record)
+        self._tapes = {}      # name -> list of recorded entries (replay)
+        self._used = {}       # name -> set of consumed entry indexes (replay)
+        self.misses = []      # (name, digest) of replayed calls with no recording (callers may swallow the raise)
+
+    def _dir(self, name):
+        return os.path.join(self.root, name)
+
+    def record(self, name, digest, args, kwargs, result=None, error=None):
+        with self._lock:
+            seq = self._sequence.get(name, 0)
+            self._sequence[name] = seq + 1
+        entry = {
+            "name": name, "seq": seq, "digest": digest,
+            "args_preview": repr((args, kwargs))[:ARGS_PREVIEW_CHARS],
+            "result": _encode(result),
+            "error": {"type": type(error).__name__, "message": str(error)} if error is not None else None
+        }
+        try:
+            os.makedirs(self._dir(name), exist_ok=True)
+            with open(os.path.join(self._dir(name), f"{seq:05d}_{digest[:12]}.json"), 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False, indent=1)
+        except Exception as e:
+            log(f"   ⚠️ [Cassette] Could not record {name}: {e}")
+
+    def _tape(self, name):
+        tape = self._tapes.get(name)
+        if tape is None:
+            tape = []
+            folder = self._dir(name)
+            if os.path.isdir(folder):
+                for file_name in sorted(os.listdir(folder)):
+                    if not file_name.endswith(".json"): continue
+                    with open(os.path.join(folder, file_name), 'r', encoding='utf-8') as f:
+                        tape.append(json.load(f))
+            self._tapes[name] = tape
+            self._used[name] = set()
+        return tape
+
+    def replay(self, name, digest):
+        """Returns the recorded entry for this call; raises CassetteMiss when no unused entry matches."""
+        with self._lock:
+            tape = self._tape(name)
+            used = self._used[name]
+            for i, entry in enumerate(tape):
+                if i not in used and entry["digest"] == digest:
+                    used.add(i)
+                    return entry
+            left = len(tape) - len(used)
+            self.misses.append((name, digest))
+        log(f"   📼 [Cassette] MISS: {name} was called with arguments that were never recorded.")
+        raise CassetteMiss(f"No recorded interaction for {name} with digest {digest[:12]} in {self.root} "
+                           f"({left} unused call(s) with other arguments)")
+
+_active = None
+
+def activate(mode, root=CASSETTE_DIR):
+    """Switches the harness on ('record' / 'replay') or off. Also seeds `random` for reproducible runs."""
+    global _active
+    if mode not in ("record", "replay"):
+        _active = None
+        return
+    _active = Cassette(mode, root)
+    random.seed(CASSETTE_SEED)
+    log(f"📼 [Cassette] {mode.upper()} mode -> {root}")
+
+def _replay_result(entry):
+    error = entry.get("error")
+    if error:
+        exc_type = getattr(builtins, error["type"], None)
+        if not (isinstance(exc_type, type) and issubclass(exc_type, Exception)):
+            exc_type = RuntimeError
+        raise exc_type(error["message"])
+    return _decode(entry["result"])
+
+def _reseed(digest):
+    """
+    Replay skips the recorded function bodies, so any random draws they made while recording
+    (user agents, keyword picks...) would shift every later draw. Reseeding after each top-level
+    call on the main thread keeps both modes on the same random sequence. Async steps are skipped:
+    their completion order differs between a live run and a replay.
+    """
+    if threading.current_thread() is threading.main_thread():
+        random.seed(f"{CASSETTE_SEED}:{digest}")
+
+def recordable(name):
+    """
+    Decorator for functions that talk to the outside world (LLMs, scraping, publishing, uploads).
+    A no-op unless the harness is active.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                cassette = _active
+                if cassette is None or _inside_call.get():
+                    return await fn(*args, **kwargs)
+                digest = _call_digest(name, args, kwargs)
+                if cassette.mode == "replay":
+                    return _replay_result(cassette.replay(name, digest))
+                token = _inside_call.set(True)
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception as e:
+                    cassette.record(name, digest, args, kwargs, error=e)
+                    raise
+                finally:
+                    _inside_call.reset(token)
+                cassette.record(name, digest, args, kwargs, result=result)
+                return result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            cassette = _active
+            if cassette is None or _inside_call.get():
+                return fn(*args, **kwargs)
+            digest = _call_digest(name, args, kwargs)
+            if cassette.mode == "replay":
+                entry = cassette.replay(name, digest)
+                _reseed(digest)
+                return _replay_result(entry)
+            token = _inside_call.set(True)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                cassette.record(name, digest, args, kwargs, error=e)
+                raise
+            finally:
+                _inside_call.reset(token)
+                _reseed(digest)
+            cassette.record(name, digest, args, kwargs, result=result)
+            return result
+        return wrapper
+    return decorator
+
+activate(CASSETTE_MODE)
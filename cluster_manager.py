@@ -77,13 +77,15 @@ def generate_verified_cluster(category, config):
     final_official_title = None
 
     # --- PHASE 2: THE GAUNTLET (Filter & Verify) ---
+    # Semantic Blacklist Check for all candidates at once (one LLM call instead of one per candidate)
+    duplicates = history_manager.check_semantic_duplication_batch(raw_trends, category, config)
+
     for candidate in raw_trends:
         log(f"      🕵️‍♂️ Investigating candidate: '{candidate}'")
 
         # 1. Semantic Blacklist Check (history_manager)
         # Does this topic overlap with what we already published?
-        is_duplicate = history_manager.check_semantic_duplication(candidate, category, config)
-        if is_duplicate:
+        if duplicates.get(candidate):
             log(f"      ⏭️ Skipping '{candidate}': Detected as duplicate in Knowledge Graph.")
             continue
 
@@ -8,48 +8,56 @@ import logging
 import json
 import time
 from bs4 import BeautifulSoup
-from google import genai
 from google.genai import types
 from tenacity import retry, stop_after_attempt, wait_fixed
 from urllib.parse import urlparse
-from api_manager import key_manager  # <--- IMPORT KEY MANAGER
+from api_manager import key_manager, client_pool, estimate_tokens  # <--- IMPORT KEY MANAGER
+import cassette
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - [CORE-SURGEON-3.0] - %(message)s')
 logger = logging.getLogger("CoreSurgeon")
 
 class AdvancedContentValidator:
     def __init__(self, model_name="gemini-2.5-flash"):
-        # REMOVED: self.client = google_client (We now fetch fresh clients dynamically)
+        # REMOVED: self.client = google_client (Clients come from the shared pool in api_manager)
         self.model_name = model_name
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36 ProValidator/3.0'
         })
 
-    def _get_client(self):
-        """Generates a fresh client using the currently active API key."""
-        key = key_manager.get_current_key()
-        return genai.Client(api_key=key)
+    def _get_client(self, prompt):
+        """
+        Pooled client of the key with the most rate headroom, charged for this prompt.
+        Returns (key_index, client): the index is what switch_key() must bench on a quota error.
+        """
+        key_index, key = key_manager.acquire_key(estimate_tokens(prompt))
+        if key is None: return None, None
+        return key_index, client_pool.get(key)
 
+    @cassette.recordable("content_validator_pro.safe_generate")
     def _safe_generate(self, prompt, config=None):
         """
         The Core Protection Mechanism:
         Wraps the API call. If a 429/Quota error occurs, it switches keys and retries.
+        Returns the response text (plain data, so the cassette can replay it).
         """
         max_retries = len(key_manager.keys) + 2
         for attempt in range(max_retries):
-            client = self._get_client()
+            key_index, client = self._get_client(prompt)
+            if client is None:
+                raise RuntimeError("No Gemini API keys available for validation.")
             try:
                 if config:
-                    return client.models.generate_content(model=self.model_name, contents=prompt, config=config)
+                    return client.models.generate_content(model=self.model_name, contents=prompt, config=config).text
                 else:
-                    return client.models.generate_content(model=self.model_name, contents=prompt)
+                    return client.models.generate_content(model=self.model_name, contents=prompt).text
             except Exception as e:
                 error_str = str(e).lower()
                 # Detect Quota Errors
                 if "429" in error_str or "quota" in error_str or "exhausted" in error_str:
-                    logger.warning(f"      ⚠️ Validator Quota Error (Key #{key_manager.current_index + 1}). Switching Key...")
-                    if key_manager.switch_key():
+                    logger.warning(f"      ⚠️ Validator Quota Error (Key #{key_index + 1}). Switching Key...")
+                    if key_manager.switch_key(key_index):
                         time.sleep(2) # Cool down slightly
                         continue # Retry loop with new key
                     else:
@@ -145,12 +153,12 @@ class AdvancedContentValidator:
         """
         try:
             # UPDATED: Use _safe_generate instead of direct client call
-            resp = self._safe_generate(
+            resp_text = self._safe_generate(
                 prompt,
                 config=types.GenerateContentConfig(response_mime_type="application/json", temperature=0.1)
             )
             
-            json_text = self._clean_json_text(resp.text)
+            json_text = self._clean_json_text(resp_text)
             corrections = json.loads(json_text)
             
             final_html = str(soup)
@@ -194,8 +202,8 @@ class AdvancedContentValidator:
         prompt = f"REBUILD TASK: Create a high-quality HTML {element_type} using ONLY facts from: {source_text[:8000]}. Use clean CSS classes. Output ONLY HTML."
         try:
             # UPDATED: Use _safe_generate
-            resp = self._safe_generate(prompt)
-            return resp.text.replace("```html", "").replace("```", "").strip()
+            resp_text = self._safe_generate(prompt)
+            return resp_text.replace("```html", "").replace("```", "").strip()
         except: return None
 
     
@@ -225,6 +233,7 @@ class AdvancedContentValidator:
             logger.info(f"   ✅ Removed {removed} dead-anchor links from article.")
         return str(soup)
 
+    @cassette.recordable("content_validator_pro.restore_link_integrity")
     def restore_link_integrity(self, html_content, sources_metadata):
         soup = BeautifulSoup(html_content, 'html.parser')
         links = soup.find_all('a', href=True)
@@ -302,8 +311,8 @@ class AdvancedContentValidator:
         prompt = f"EXTRACT VERBATIM QUOTE: Find one powerful, real sentence from this text: {source_text[:5000]}. Return as HTML <blockquote>. Output ONLY HTML."
         try:
             # UPDATED: Use _safe_generate
-            resp = self._safe_generate(prompt)
-            return resp.text.replace("```html", "").replace("```", "").strip()
+            resp_text = self._safe_generate(prompt)
+            return resp_text.replace("```html", "").replace("```", "").strip()
         except: return None
 
     def run_professional_validation(self, html_content, full_source_text, sources_metadata):
@@ -4,7 +4,7 @@
 
 import json
 from config import log
-from api_manager import generate_step_strict
+from api_manager import generate_step_strict, agenerate_step_strict
 
 # البرومبت المتقدم مع تصحيح الأقواس (Doubled Curly Braces)
 PROMPT_DEEP_DIVE = """
@@ -46,6 +46,17 @@ The JSON structure MUST be:
 }}
 """
 
+DEEP_DIVE_REQUIRED_KEYS = ["official_sources", "research_studies", "personal_experiences", "independent_critiques"]
+
+def _check_deep_dive_result(result):
+    # التحقق من جودة النتائج
+    if (len(result.get("official_sources", [])) < 1 or 
+        len(result.get("research_studies", [])) < 1):
+        log("   ⚠️ Deep Dive returned insufficient sources. Results may be partial.")
+    
+    log("   ✅ Deep Dive research completed successfully.")
+    return result
+
 def conduct_deep_dive(topic: str, model_name: str):
     """
     Executes the deep dive research prompt to gather high-value, structured sources.
@@ -59,17 +70,30 @@ def conduct_deep_dive(topic: str, model_name: str):
             PROMPT_DEEP_DIVE.format(topic=topic),
             "Deep Dive Research",
             # تمت إضافة independent_critiques لقائمة التحقق لضمان وجودها
-            required_keys=["official_sources", "research_studies", "personal_experiences", "independent_critiques"],
+            required_keys=DEEP_DIVE_REQUIRED_KEYS,
+            use_google_search=True
+        )
+        return _check_deep_dive_result(result)
+
+    except Exception as e:
+        log(f"   ❌ CRITICAL: Deep Dive research failed: {e}")
+        return None
+
+async def aconduct_deep_dive(topic: str, model_name: str):
+    """
+    Async variant of conduct_deep_dive, so it can run alongside other independent research steps.
+    """
+    log(f"🕵️‍♂️ [Deep Dive Researcher] Initiating high-value source acquisition for: '{topic}'")
+    
+    try:
+        result = await agenerate_step_strict(
+            model_name,
+            PROMPT_DEEP_DIVE.format(topic=topic),
+            "Deep Dive Research",
+            required_keys=DEEP_DIVE_REQUIRED_KEYS,
             use_google_search=True
         )
-        
-        # التحقق من جودة النتائج
-        if (len(result.get("official_sources", [])) < 1 or 
-            len(result.get("research_studies", [])) < 1):
-            log("   ⚠️ Deep Dive returned insufficient sources. Results may be partial.")
-        
-        log("   ✅ Deep Dive research completed successfully.")
-        return result
+        return _check_deep_dive_result(result)
 
     except Exception as e:
         log(f"   ❌ CRITICAL: Deep Dive research failed: {e}")
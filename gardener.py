@@ -1,13 +1,12 @@
 # FILE: gardener.py
 # ROLE: Updates old content to keep it "Fresh" for Google (The Living Article Protocol).
 
-import json
 import datetime
-import os
 from bs4 import BeautifulSoup
 from config import log
 from api_manager import generate_step_strict
 import publisher  # نستدعي الناشر لتحديث المقالات
+import history_manager  # كل تعديلات الذاكرة تمر عبر سجل الـ KG
 import indexer    # نستدعي المفهرس لإعلام جوجل بالتحديث
 
 # برومبت جديد كلياً ومصمم للتحديث الاستراتيجي
@@ -44,43 +43,23 @@ def run_daily_maintenance(config):
     log("\n🧹 [Gardener V2.0] Starting Living Article Maintenance...")
     
     # 1. تحميل الذاكرة (Knowledge Graph)
-    kg_path = 'knowledge_graph.json'
-    if not os.path.exists(kg_path):
+    kg_data = history_manager.load_kg()
+    if not kg_data:
         log("   ✅ No knowledge graph found. Skipping maintenance.")
         return
-    with open(kg_path, 'r', encoding='utf-8') as f:
-        kg_data = json.load(f)
     
     # 2. البحث عن مقال قديم ومناسب للتحديث
     today = datetime.date.today()
     target_article = None
     
-    # نبحث عن أقدم مقال لم يتم تحديثه ومر عليه 90 يوماً
-    old_articles = []
-    for item in kg_data:
-        try:
-            post_id = item.get('post_id')
-            if not post_id: continue # لا يمكن تحديث مقال بدون ID
-
-            pub_date = datetime.datetime.strptime(item['date'], "%Y-%m-%d").date()
-            age_days = (today - pub_date).days
-            
-            # الأفضلية للمقالات التي لم تُحدّث أبداً
-            last_updated_str = item.get('last_updated', "1970-01-01")
-            last_updated_date = datetime.datetime.strptime(last_updated_str, "%Y-%m-%d").date()
-
-            if age_days > 90:
-                old_articles.append((item, (today - last_updated_date).days))
-        except:
-            continue
+    # نبحث عن أقدم مقال لم يتم تحديثه ومر عليه 90 يوماً (استعلام مفهرس على واجهة SQLite)
+    old_articles = history_manager.get_stale_articles(min_age_days=90, limit=1)
 
     if not old_articles:
         log("   ✅ No articles require maintenance today.")
         return
 
-    # ترتيب المقالات حسب الأقدمية في التحديث
-    old_articles.sort(key=lambda x: x[1], reverse=True)
-    target_article = old_articles[0][0]
+    target_article = old_articles[0]
 
     log(f"   🥀 Found candidate for revival: '{target_article['title']}' (Post ID: {target_article['post_id']})")
     
@@ -116,12 +95,7 @@ def run_daily_maintenance(config):
         if not decision.get('update_needed'):
             log(f"   ✨ Article '{original_title}' is still fresh. Reason: {decision.get('reason')}")
             # نحدث تاريخ الفحص في KG حتى لا نفحصه غداً
-            for item in kg_data:
-                if item['post_id'] == target_article['post_id']:
-                    item['last_updated'] = today.isoformat()
-                    break
-            with open(kg_path, 'w', encoding='utf-8') as f:
-                json.dump(kg_data, f, indent=2)
+            history_manager.touch_article(target_article['url'])
             return
 
         # 5. تنفيذ التحديث
@@ -144,15 +118,7 @@ def run_daily_maintenance(config):
             log(f"   ✅ Successfully pushed update to Blogger for '{new_title}'")
             # 7. تحديث الذاكرة وتنبيه جوجل
             article_url = target_article['url']
-            for item in kg_data:
-                if item['post_id'] == target_article['post_id']:
-                    item['title'] = new_title # تحديث العنوان في ذاكرتنا
-                    item['last_updated'] = today.isoformat()
-                    item['update_count'] = item.get('update_count', 0) + 1
-                    break
-            
-            with open(kg_path, 'w', encoding='utf-8') as f:
-                json.dump(kg_data, f, indent=2)
+            history_manager.retitle_article(article_url, new_title) # تحديث العنوان في ذاكرتنا
 
             # إرسال إشعار لجوجل لإعادة الأرشفة
             indexer.submit_url(article_url)
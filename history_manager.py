@@ -1,42 +1,97 @@
-# FILE: history_manager.py (V11.0 - Self-Healing & Semantic Linking Integration)
+# FILE: history_manager.py (V11.2 - Self-Healing, Semantic Linking, Memory-Mapped Vectors & KG Journal)
 # ROLE: Central Intelligence Memory & Semantic Deduplication Engine
-# DESCRIPTION: Manages the Knowledge Graph (knowledge_graph.json). 
+# DESCRIPTION: Manages the Knowledge Graph (knowledge_graph.json snapshot + knowledge_graph.journal.jsonl
+#              + knowledge_graph_embeddings.npy). All KG writers (incl. gardener.py) go through this module.
 #              Prevents SEO Cannibalization using a Hybrid Blacklist Strategy.
 #              UPGRADED: Now features self-healing for legacy data and a semantic
 #              vector-based internal linking strategy for superior SEO siloing.
 # INTEGRATION: Directly linked to main.py, cluster_manager.py, and gardener.py.
 
 import os
+import io
 import json
 import datetime
-import difflib
 import traceback
+import threading
 import numpy as np
 from config import log
 from api_manager import generate_step_strict
-
-# --- الترقية: إضافة الذكاء الدلالي (Semantic Intelligence) ---
-try:
-    from sentence_transformers import SentenceTransformer
-    from sklearn.metrics.pairwise import cosine_similarity
-except ImportError:
-    log("❌ CRITICAL ERROR: 'sentence-transformers' or 'scikit-learn' not installed.")
-    log("   Please add them to your requirements.txt file and ensure they are installed.")
-    raise
-
-# --- الترقية: تحميل النموذج الذكي مرة واحدة عالمياً لتوفير الموارد ---
-# هذا النموذج يعمل محلياً، لا يحتاج لإنترنت (بعد التحميل الأول) ولا مفتاح API.
-_model = SentenceTransformer('all-MiniLM-L6-v2')
+from vector_index import BinaryVectorIndex, normalize_rows
+from title_matcher import TitleIndex
+from kg_store import KGStore
+from text_index import BM25Index, reciprocal_rank_fusion
+from bs4 import BeautifulSoup
 
 # --- GLOBAL CONFIGURATION ---
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_BACKEND = 'torch'   # 'torch' | 'onnx' | 'openvino' (settings.embedding_model in config_advanced.json)
+EMBEDDING_ONNX_FILE = 'onnx/model_qint8_avx512_vnni.onnx'  # Pre-quantized int8 export shipped with the model repo
 DB_FILE = 'knowledge_graph.json'
+EMBEDDINGS_FILE = 'knowledge_graph_embeddings.npy'  # Row i = vector of the entry whose "embedding_row" is i
+EMBEDDING_DTYPE = np.float32
+KG_JOURNAL_FILE = 'knowledge_graph.journal.jsonl'  # Append-only mutations applied on top of DB_FILE
+JOURNAL_COMPACT_EVERY = 50   # Journal records before they are folded into a fresh snapshot
+KG_BACKEND = 'json'   # 'json' (snapshot + journal) | 'sqlite' (settings.knowledge_graph.backend)
+KG_SQLITE_FILE = 'knowledge_graph.db'
+KG_TEXT_FILE = '.ai_cache/knowledge_graph_text.jsonl'   # Plain text of published articles ({"url", "text"} per line, last wins);
+                                                         # workflow-cached, not committed: losing it only narrows search to titles
+MAX_CACHED_TEXT_CHARS = 20000
+HYBRID_CANDIDATES = 50   # Depth of the BM25 and embedding rankings fused by search()
 MAX_HISTORY_ITEMS_FOR_AI = 60
 SIMILARITY_THRESHOLD = 0.65
+# Vector tier between Phase 1 and the LLM judge (settings.semantic_dedup overrides both)
+DEDUP_AUTO_ACCEPT_BELOW = 0.45   # Max cosine to any KG title below this -> unique, no LLM call
+DEDUP_AUTO_REJECT_ABOVE = 0.85   # Max cosine above this -> same topic, no LLM call
+
+# --- الترقية: تحميل النموذج الذكي عند أول استخدام فقط (Lazy Loading) ---
+# هذا النموذج يعمل محلياً، لا يحتاج لإنترنت (بعد التحميل الأول) ولا مفتاح API.
+_model = None
+_model_lock = threading.Lock()
+
+def configure(settings):
+    """
+    Reads settings.embedding_model (name / backend / onnx_file) and settings.knowledge_graph (backend / sqlite_file).
+    Must run before the first embedding; switching to SQLite migrates the loaded KG on first use.
+    """
+    global EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_ONNX_FILE, KG_BACKEND, KG_SQLITE_FILE
+    cfg = (settings or {}).get("embedding_model") or {}
+    EMBEDDING_MODEL_NAME = cfg.get("name", EMBEDDING_MODEL_NAME)
+    EMBEDDING_BACKEND = cfg.get("backend", EMBEDDING_BACKEND)
+    EMBEDDING_ONNX_FILE = cfg.get("onnx_file", EMBEDDING_ONNX_FILE)
+    kg_cfg = (settings or {}).get("knowledge_graph") or {}
+    KG_BACKEND = kg_cfg.get("backend", KG_BACKEND)
+    KG_SQLITE_FILE = kg_cfg.get("sqlite_file", KG_SQLITE_FILE)
+    if KG_BACKEND == "sqlite" and _kg_store is None:
+        _open_sqlite_store()
+
+def _get_model():
+    """Loads SentenceTransformer (and torch) on first use instead of at import."""
+    global _model
+    if _model is not None: return _model
+    with _model_lock:
+        if _model is not None: return _model
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            log("❌ CRITICAL ERROR: 'sentence-transformers' not installed.")
+            log("   Please add it to your requirements.txt file and ensure it is installed.")
+            raise
+        if EMBEDDING_BACKEND in ('onnx', 'openvino'):
+            try:
+                model_kwargs = {"file_name": EMBEDDING_ONNX_FILE} if EMBEDDING_BACKEND == 'onnx' and EMBEDDING_ONNX_FILE else None
+                _model = SentenceTransformer(EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND, model_kwargs=model_kwargs)
+                log(f"   🧠 Embedding model loaded ({EMBEDDING_MODEL_NAME}, {EMBEDDING_BACKEND}).")
+                return _model
+            except Exception as e:
+                log(f"   ⚠️ {EMBEDDING_BACKEND} embedding backend unavailable ({str(e)[:80]}). Falling back to torch.")
+        _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        log(f"   🧠 Embedding model loaded ({EMBEDDING_MODEL_NAME}, torch).")
+        return _model
 
 # --- الترقية: دالة مساعدة لتوليد المتجهات الرقمية ---
 def _generate_embedding(text: str):
     """Generates a sentence embedding (vector) for the given text."""
-    return _model.encode(text, convert_to_numpy=True)
+    return _get_model().encode(text, convert_to_numpy=True)
 
 def _load_kg_raw():
     """
@@ -60,33 +115,434 @@ def _load_kg_raw():
         return []
     return []
 
+# ==============================================================================
+# EMBEDDING STORE (float32 .npy matrix, memory-mapped; the JSON only keeps row ids)
+# ==============================================================================
+def _open_embeddings():
+    """Memory-maps the vector matrix: nothing is read until rows are actually used."""
+    try:
+        if os.path.exists(EMBEDDINGS_FILE):
+            return np.load(EMBEDDINGS_FILE, mmap_mode='r')
+    except Exception as e:
+        log(f"   ⚠️ Embedding store unreadable ({e}). Vectors will be rebuilt.")
+    return None
+
+def _append_embedding_rows(rows):
+    """
+    Appends rows to the .npy file in O(new rows): the data is written at the end and only the
+    fixed-size header is patched with the new shape (numpy pads it for growth).
+    Returns the index of the first appended row.
+    """
+    rows = normalize_rows(rows).astype(EMBEDDING_DTYPE) # Stored unit-length: cosine == dot product
+    if not os.path.exists(EMBEDDINGS_FILE):
+        np.save(EMBEDDINGS_FILE, rows)
+        return 0
+    with open(EMBEDDINGS_FILE, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version != (1, 0): raise ValueError(f"Unsupported .npy version {version}")
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        header_len = f.tell()
+        if dtype != rows.dtype or fortran_order or shape[1:] != rows.shape[1:]:
+            raise ValueError(f"Embedding store layout mismatch: {shape} {dtype} vs new rows {rows.shape} {rows.dtype}")
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (shape[0] + len(rows),) + shape[1:]})
+        if len(header.getvalue()) == header_len:
+            f.seek(header_len + shape[0] * rows.shape[1] * rows.itemsize)
+            f.write(rows.tobytes())
+            f.truncate()
+            f.seek(0)
+            f.write(header.getvalue())
+            return shape[0]
+    # Header outgrew its padding (practically never): fall back to a full rewrite
+    existing = np.load(EMBEDDINGS_FILE)
+    tmp_path = f"{EMBEDDINGS_FILE}.tmp.npy"
+    np.save(tmp_path, np.vstack([existing, rows]))
+    os.replace(tmp_path, EMBEDDINGS_FILE)
+    return existing.shape[0]
+
+def _write_embedding_row(row, vector):
+    """Overwrites one stored vector in place (a retitle reuses its entry's row instead of orphaning it)."""
+    vector = normalize_rows(vector).astype(EMBEDDING_DTYPE)
+    with open(EMBEDDINGS_FILE, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version != (1, 0): raise ValueError(f"Unsupported .npy version {version}")
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        if dtype != vector.dtype or fortran_order or shape[1:] != vector.shape[1:] or not 0 <= row < shape[0]:
+            raise ValueError(f"Embedding store layout mismatch: row {row} of {shape} {dtype}")
+        f.seek(f.tell() + row * vector.shape[1] * vector.itemsize)
+        f.write(vector.tobytes())
+
+def _save_kg(data):
+    """Writes the (vector-free) metadata snapshot atomically (tmp file + rename), or rewrites the SQLite table."""
+    if _kg_store is not None:
+        _kg_store.replace_all(data)
+        return
+    tmp_path = f"{DB_FILE}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, DB_FILE)
+
+# ==============================================================================
+# KG JOURNAL (append-only write-ahead log, compacted into the snapshot)
+# Records: {"op": "insert", "entry": {...}} | {"op": "set", "url": ..., "fields": {...}}
+# Every record is idempotent (insert skips known URLs, set writes absolute values),
+# so replaying a journal that was already folded into the snapshot is harmless.
+# ==============================================================================
+_kg_lock = threading.RLock()
+_journal_records = 0
+_kg_revision = 0   # Bumped on every mutation; invalidates derived caches (blacklist context)
+_kg_store = None   # KGStore when the SQLite backend is active (then it replaces snapshot + journal)
+
+def _apply_record(data, record):
+    op = record.get("op")
+    if op == "insert":
+        entry = record.get("entry") or {}
+        if entry.get("url") and not any(item.get("url") == entry["url"] for item in data):
+            data.append(entry)
+    elif op == "set":
+        for item in data:
+            if item.get("url") == record.get("url"):
+                item.update(record.get("fields") or {})
+                break
+
+def _replay_journal(data):
+    """
+    Applies the journal on top of the snapshot.
+    A torn last line (crash mid-append) is cut off so the next append starts on a clean line.
+    """
+    global _journal_records
+    _journal_records = 0
+    if not os.path.exists(KG_JOURNAL_FILE): return data
+    try:
+        valid_bytes = 0
+        with open(KG_JOURNAL_FILE, 'rb') as f:
+            for line_no, line in enumerate(f, 1):
+                try:
+                    if not line.endswith(b"\n"): raise ValueError("no newline")
+                    record = json.loads(line) if line.strip() else None
+                except ValueError:
+                    log(f"   ⚠️ KG journal line {line_no} is incomplete. Dropping it.")
+                    break
+                valid_bytes += len(line)
+                if record is None: continue
+                _apply_record(data, record)
+                _journal_records += 1
+        if valid_bytes < os.path.getsize(KG_JOURNAL_FILE):
+            with open(KG_JOURNAL_FILE, 'r+b') as f:
+                f.truncate(valid_bytes)
+    except Exception as e:
+        log(f"   ❌ Could not replay KG journal: {e}")
+    return data
+
+def _compact_text_file():
+    """Rewrites KG_TEXT_FILE with one line per KG article (superseded lines and removed articles dropped)."""
+    if not os.path.exists(KG_TEXT_FILE): return
+    try:
+        texts = {}
+        with open(KG_TEXT_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    texts[record["url"]] = record.get("text", "")
+                except (ValueError, KeyError, TypeError):
+                    continue
+        tmp_path = f"{KG_TEXT_FILE}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for item in _kg_data:
+                if item.get('url') in texts:
+                    f.write(json.dumps({"url": item['url'], "text": texts[item['url']]}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, KG_TEXT_FILE)
+    except Exception as e:
+        log(f"   ⚠️ Could not compact article text cache: {e}")
+
+def _compact():
+    """Folds the journal into a new snapshot (atomic rename), then empties the journal and compacts KG_TEXT_FILE."""
+    global _journal_records
+    with _kg_lock:
+        _save_kg(_kg_data)
+        with open(KG_JOURNAL_FILE, 'w', encoding='utf-8'):
+            pass
+        _journal_records = 0
+        _compact_text_file()
+    log(f"   🗜️ [KG Journal] Compacted into snapshot ({len(_kg_data)} articles).")
+
+def _journal_append(record):
+    """Durably appends one mutation (O(1) regardless of archive size) and applies it in memory."""
+    global _journal_records, _kg_revision
+    with _kg_lock:
+        if _kg_store is not None:
+            _kg_store.apply(record) # One SQLite transaction; no journal needed
+            _apply_record(_kg_data, record)
+            _kg_revision += 1
+            return
+        with open(KG_JOURNAL_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        _apply_record(_kg_data, record)
+        _journal_records += 1
+        _kg_revision += 1
+        if _journal_records >= JOURNAL_COMPACT_EVERY:
+            _compact()
+
 # --- الترقية: دالة الإصلاح الذاتي الآلية ---
 def _ensure_all_embeddings_exist(data):
     """
-    Self-healing function. Checks if any old article is missing an embedding and fixes it.
+    Self-healing function. Moves legacy inline "embedding" lists into the .npy store (one-time migration)
+    and generates vectors for entries that have none or point past the end of the store.
     This runs automatically, removing the need for a separate backfill script.
     """
-    needs_saving = False
+    global _embeddings
+    _embeddings = _open_embeddings()
+    row_count = 0 if _embeddings is None else _embeddings.shape[0]
+
+    pending_items, pending_rows = [], []
     for item in data:
-        if "embedding" not in item or not item.get("embedding"):
+        row = item.get("embedding_row")
+        if isinstance(row, int) and 0 <= row < row_count:
+            item.pop("embedding", None)
+            continue
+        vector = item.pop("embedding", None)
+        if not vector:
             title = item.get("title")
-            if title:
-                log(f"   🔧 [Self-Healing] Found old article missing vector. Generating for: {title[:40]}...")
-                item["embedding"] = _generate_embedding(title).tolist()
-                needs_saving = True
-    
-    if needs_saving:
-        log("   💾 Saving updated knowledge graph with backfilled vectors...")
+            if not title: continue
+            log(f"   🔧 [Self-Healing] Found article missing vector. Generating for: {title[:40]}...")
+            vector = _generate_embedding(title)
+        pending_items.append(item)
+        pending_rows.append(vector)
+
+    if pending_items:
+        log(f"   💾 Moving {len(pending_items)} vectors into {EMBEDDINGS_FILE}...")
         try:
-            with open(DB_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            first_row = _append_embedding_rows(pending_rows)
+            for offset, item in enumerate(pending_items):
+                item["embedding_row"] = first_row + offset
+            _save_kg(data) # Snapshot now includes the replayed journal
+            if _kg_store is None:
+                with open(KG_JOURNAL_FILE, 'w', encoding='utf-8'):
+                    pass
+            _embeddings = _open_embeddings()
         except Exception as e:
             log(f"   ❌ Self-Healing Save Error: {e}")
     return data
 
 # --- الترقية: تحميل ومعالجة قاعدة البيانات عند بدء تشغيل الوحدة ---
-_kg_data = _load_kg_raw()
+_embeddings = None
+_kg_data = _replay_journal(_load_kg_raw())
 _kg_data = _ensure_all_embeddings_exist(_kg_data) # <--- الفحص الآلي والإصلاح الذاتي يتم هنا
+if _journal_records >= JOURNAL_COMPACT_EVERY:
+    _compact()
+
+# ==============================================================================
+# SQLITE BACKEND (optional; indexed queries instead of scans of the in-memory list)
+# ==============================================================================
+def _open_sqlite_store():
+    """
+    Switches persistence to KG_SQLITE_FILE. An empty database is filled from the already loaded
+    JSON snapshot + journal (one-time migration); from then on the database is the source of truth.
+    """
+    global _kg_store, _kg_data, _kg_revision, _vector_index, _title_index, _text_index
+    with _kg_lock:
+        try:
+            store = KGStore(KG_SQLITE_FILE)
+            if store.count() == 0 and _kg_data:
+                log(f"   🗄️ [KG SQLite] Migrating {len(_kg_data)} articles from {DB_FILE} into {KG_SQLITE_FILE}...")
+                store.replace_all(_kg_data)
+            _kg_store = store
+            _kg_data = _ensure_all_embeddings_exist(store.load_all())
+        except Exception as e:
+            log(f"   ❌ [KG SQLite] Could not open {KG_SQLITE_FILE} ({e}). Staying on {DB_FILE}.")
+            return
+        # Derived structures point at the old list objects: rebuild them lazily
+        _kg_revision += 1
+        _vector_index, _title_index, _text_index = None, None, None
+        _index_items.clear()
+        _title_ids.clear()
+    log(f"   🗄️ [KG SQLite] Using {KG_SQLITE_FILE} ({len(_kg_data)} articles).")
+
+def get_recent_articles(limit, section=None, since_date=None):
+    """
+    Newest articles first (by publish date), optionally one section and/or published on or after since_date.
+    Indexed SQL lookup on the SQLite backend; list scan on the JSON backend.
+    """
+    if _kg_store is not None:
+        return _kg_store.recent(limit, section=section, since=since_date)
+    relevant_items = []
+    for item in load_kg():
+        if section is not None and item.get('section') != section: continue
+        if since_date is not None:
+            try:
+                if datetime.datetime.strptime(item.get('date', '2024-01-01'), "%Y-%m-%d").date() < since_date: continue
+            except:
+                continue
+        relevant_items.append(item)
+    relevant_items.sort(key=lambda x: x.get('date', ''), reverse=True)
+    return relevant_items[:limit]
+
+def get_stale_articles(min_age_days=90, limit=1):
+    """
+    Published posts (with a post_id) older than min_age_days, least recently updated first (gardener candidates).
+    Indexed SQL lookup on the SQLite backend; list scan on the JSON backend.
+    """
+    today = datetime.date.today()
+    if _kg_store is not None:
+        return _kg_store.stale(today - datetime.timedelta(days=min_age_days), limit)
+    old_articles = []
+    for item in load_kg():
+        try:
+            if not item.get('post_id'): continue # لا يمكن تحديث مقال بدون ID
+            pub_date = datetime.datetime.strptime(item['date'], "%Y-%m-%d").date()
+            last_updated_date = datetime.datetime.strptime(item.get('last_updated', "1970-01-01"), "%Y-%m-%d").date()
+            if (today - pub_date).days > min_age_days:
+                old_articles.append((item, (today - last_updated_date).days))
+        except:
+            continue
+    old_articles.sort(key=lambda x: x[1], reverse=True)
+    return [item for item, _ in old_articles[:limit]]
+
+# ==============================================================================
+# VECTOR INDEX (built once per process from the memory-mapped store, kept in sync on every write)
+# ==============================================================================
+_vector_index = None
+_index_items = {}   # url -> KG entry
+
+def _get_vector_index():
+    global _vector_index
+    if _vector_index is None:
+        with _kg_lock:
+            if _vector_index is None:
+                items = [item for item in _kg_data if isinstance(item.get("embedding_row"), int) and item.get("url")]
+                dim = _embeddings.shape[1] if _embeddings is not None else 384
+                index = BinaryVectorIndex(dim, lambda: _embeddings) # Float rows stay in the memory-mapped store
+                if len(items): index.add_many([item["url"] for item in items], [item["embedding_row"] for item in items])
+                _index_items.update({item["url"]: item for item in items})
+                _vector_index = index
+    return _vector_index
+
+def _index_upsert(item):
+    """Keeps an already built index in sync (no-op before the first query). The item's row must be in the store."""
+    if _vector_index is not None and item.get("url"):
+        _vector_index.upsert(item["url"], item["embedding_row"])
+        _index_items[item["url"]] = item
+
+# --- Phase-1 title index (character trigrams), same lifecycle as the vector index ---
+_title_index = None
+_title_ids = {}   # url -> id in _title_index
+
+def _get_title_index():
+    global _title_index
+    if _title_index is None:
+        with _kg_lock:
+            if _title_index is None:
+                index = TitleIndex()
+                for item in _kg_data:
+                    tid = index.add(item.get('title', ''))
+                    if item.get('url'): _title_ids[item['url']] = tid
+                _title_index = index
+    return _title_index
+
+def _title_index_upsert(item):
+    if _title_index is None: return
+    url = item.get('url')
+    if url in _title_ids:
+        _title_ids[url] = _title_index.replace(_title_ids[url], item.get('title', ''))
+    else:
+        tid = _title_index.add(item.get('title', ''))
+        if url: _title_ids[url] = tid
+
+# --- Full-text index (BM25 over titles + cached article text), same lifecycle as the vector index ---
+_text_index = None
+_text_cache = None   # url -> plain article text (loaded from KG_TEXT_FILE on first use)
+
+def _get_text_cache():
+    global _text_cache
+    if _text_cache is None:
+        cache = {}
+        try:
+            if os.path.exists(KG_TEXT_FILE):
+                with open(KG_TEXT_FILE, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                            cache[record["url"]] = record.get("text", "")
+                        except (ValueError, KeyError, TypeError):
+                            continue # Torn or foreign line: the article is still indexed by title
+        except Exception as e:
+            log(f"   ⚠️ Article text cache unreadable ({e}). Full-text search falls back to titles.")
+        _text_cache = cache
+    return _text_cache
+
+def _cache_article_text(url, content_html):
+    """Stores the plain text of a published article for full-text search (appended; compacted with the journal)."""
+    if not url or not content_html: return
+    try:
+        text = BeautifulSoup(content_html, 'html.parser').get_text(separator=' ', strip=True)[:MAX_CACHED_TEXT_CHARS]
+        os.makedirs(os.path.dirname(KG_TEXT_FILE), exist_ok=True)
+        with _kg_lock, open(KG_TEXT_FILE, 'a', encoding='utf-8') as f: # _compact rewrites the file under the same lock
+            f.write(json.dumps({"url": url, "text": text}, ensure_ascii=False) + "\n")
+        _get_text_cache()[url] = text
+    except Exception as e:
+        log(f"   ⚠️ Could not cache article text: {e}")
+
+def _get_text_index():
+    global _text_index
+    if _text_index is None:
+        with _kg_lock:
+            if _text_index is None:
+                cache = _get_text_cache()
+                index = BM25Index()
+                for item in _kg_data:
+                    if item.get('url'): index.add(item['url'], item.get('title', ''), cache.get(item['url'], ''))
+                _text_index = index
+    return _text_index
+
+def _text_index_upsert(item):
+    if _text_index is not None and item.get('url'):
+        _text_index.add(item['url'], item.get('title', ''), _get_text_cache().get(item['url'], ''))
+
+def find_similar_articles(text, k=5, exclude_titles=(), vector=None):
+    """
+    Top-k KG entries by cosine similarity to `text` (or a precomputed `vector`).
+    Returns [(score, entry), ...], best first.
+    """
+    index = _get_vector_index()
+    if not len(index): return []
+    if vector is None: vector = _generate_embedding(text)
+    # Over-fetch by the number of excluded titles, then filter: O(k) instead of scanning the KG
+    hits = index.search(vector, k + len(exclude_titles))
+    results = [(score, _index_items[url]) for score, url in hits if _index_items[url].get("title") not in exclude_titles]
+    return results[:k]
+
+def get_embeddings(items):
+    """Stacks the stored vectors of the given KG entries (only these rows are paged in)."""
+    rows = [item["embedding_row"] for item in items]
+    if _embeddings is None or not rows:
+        return np.empty((0, 0), dtype=EMBEDDING_DTYPE)
+    return np.asarray(_embeddings[rows])
+
+def search(query, k=5, section=None, exclude_titles=(), vector=None):
+    """
+    Hybrid archive search: BM25 over titles + cached article text, fused with the title-embedding
+    ranking (reciprocal rank fusion). `vector` lets callers embed a shorter text than the BM25 query.
+    Returns [(fused score, entry), ...], best first.
+    """
+    depth = (HYBRID_CANDIDATES + len(exclude_titles)) * (4 if section else 1)
+    rankings = [[url for _, url in _get_text_index().search(query, depth)]]
+    try:
+        rankings.append([entry['url'] for _, entry in find_similar_articles(query, k=depth, vector=vector)])
+    except Exception as e:
+        log(f"   ⚠️ [Hybrid Search] Embedding ranking unavailable ({e}). Using full-text ranking only.")
+    entries = {item.get('url'): item for item in _kg_data}
+    results = []
+    for score, url in reciprocal_rank_fusion(rankings):
+        entry = entries.get(url)
+        if entry is None or entry.get('title') in exclude_titles: continue
+        if section is not None and entry.get('section') != section: continue
+        results.append((score, entry))
+        if len(results) == k: break
+    return results
 
 def load_kg():
     """
@@ -96,9 +552,10 @@ def load_kg():
     global _kg_data
     return _kg_data
 
-def update_kg(title, url, section, post_id=None):
+def update_kg(title, url, section, post_id=None, content_html=None):
     """
     Updates the Knowledge Graph with a new published article AND its semantic embedding.
+    content_html (optional) is cached as plain text for full-text search.
     """
     global _kg_data
     try:
@@ -110,6 +567,9 @@ def update_kg(title, url, section, post_id=None):
         # 2. الترقية: توليد المتجه الرقمي للعنوان الجديد
         log("   🧠 Generating semantic vector for the new title...")
         embedding = _generate_embedding(title)
+        global _embeddings
+        embedding_row = _append_embedding_rows(embedding)
+        _embeddings = _open_embeddings()
 
         # 3. Construction of the Master Entry
         new_entry = {
@@ -120,15 +580,15 @@ def update_kg(title, url, section, post_id=None):
             "post_id": str(post_id) if post_id else None,
             "last_verified": str(datetime.date.today()),
             "update_count": 0,
-            "embedding": embedding.tolist()  # <-- حفظ المتجه الجديد في قاعدة البيانات
+            "embedding_row": embedding_row  # <-- المتجه نفسه محفوظ في EMBEDDINGS_FILE
         }
 
-        # 4. Atomic Append to the global variable
-        _kg_data.append(new_entry)
-        
-        # 5. Save with high precision and formatting
-        with open(DB_FILE, 'w', encoding='utf-8') as f:
-            json.dump(_kg_data, f, indent=2, ensure_ascii=False)
+        # 4. Journal the insert (vectors are already appended to the .npy store)
+        _journal_append({"op": "insert", "entry": new_entry})
+        _cache_article_text(new_entry["url"], content_html)
+        _index_upsert(new_entry)
+        _title_index_upsert(new_entry)
+        _text_index_upsert(new_entry)
             
         log(f"   💾 [Memory Updated] Total Articles in Blacklist: {len(_kg_data)}.")
         
@@ -136,67 +596,147 @@ def update_kg(title, url, section, post_id=None):
         log(f"   ❌ Failed to update Knowledge Graph: {str(e)}")
         traceback.print_exc()
 
+def retitle_article(url, new_title):
+    """Records a refreshed title (gardener updates): new vector (same store row), last_updated and update_count."""
+    global _embeddings
+    try:
+        item = next((i for i in _kg_data if i.get('url') == url), None)
+        if not item:
+            log(f"   ⚠️ URL '{url}' not found in History. Retitle skipped.")
+            return
+        embedding = _generate_embedding(new_title)
+        embedding_row = item.get('embedding_row')
+        if isinstance(embedding_row, int) and _embeddings is not None and 0 <= embedding_row < _embeddings.shape[0]:
+            _write_embedding_row(embedding_row, embedding) # The memory map sees the new vector immediately
+        else:
+            embedding_row = _append_embedding_rows(embedding)
+            _embeddings = _open_embeddings()
+        _journal_append({"op": "set", "url": url, "fields": {
+            "title": str(new_title).strip(),
+            "embedding_row": embedding_row,
+            "last_updated": str(datetime.date.today()),
+            "update_count": item.get('update_count', 0) + 1
+        }})
+        _index_upsert(item)
+        _title_index_upsert(item)
+        _text_index_upsert(item)
+    except Exception as e:
+        log(f"   ❌ Failed to retitle article in Knowledge Graph: {str(e)}")
+
+def touch_article(url):
+    """Marks an article as checked today (gardener: still fresh, no update needed)."""
+    try:
+        _journal_append({"op": "set", "url": url, "fields": {"last_updated": str(datetime.date.today())}})
+    except Exception as e:
+        log(f"   ❌ Failed to touch article in Knowledge Graph: {str(e)}")
+
+_blacklist_cache = {}   # (kg revision, today, days_limit) -> blacklist string
+
 def get_blacklist_context(category=None, days_limit=120):
     """
     Prepares a descriptive 'Blacklist String' for the AI Judge.
     Filters content by date to keep the prompt window efficient but relevant.
+    Cached until the KG changes (or the day rolls over), so repeated checks skip the date parsing and sort.
     """
     kg = load_kg()
     if not kg:
         return "NO_PREVIOUS_CONTENT"
-    
-    cutoff_date = datetime.date.today() - datetime.timedelta(days=days_limit)
-    
-    relevant_items = []
-    for item in kg:
-        try:
-            pub_date_str = item.get('date', '2024-01-01')
-            pub_date = datetime.datetime.strptime(pub_date_str, "%Y-%m-%d").date()
-            
-            if pub_date >= cutoff_date:
-                relevant_items.append(item)
-        except:
-            continue
 
-    relevant_items.sort(key=lambda x: x.get('date', ''), reverse=True)
-    recent_subset = relevant_items[:MAX_HISTORY_ITEMS_FOR_AI]
+    today = datetime.date.today()
+    cache_key = (_kg_revision, today, days_limit)
+    cached = _blacklist_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    cutoff_date = today - datetime.timedelta(days=days_limit)
+    recent_subset = get_recent_articles(MAX_HISTORY_ITEMS_FOR_AI, since_date=cutoff_date)
     
     formatted_list = [f"- [Published: {i.get('date')}] Topic: {i.get('title')}" for i in recent_subset]
-        
-    return "\n".join(formatted_list)
 
-def check_semantic_duplication(new_keyword, category, config):
-    """
-    THE ULTIMATE DEDUPLICATION GUARD (The Blacklist Comparison Engine).
-    Executes a two-phase check to ensure NO repetitive content.
-    """
-    target = str(new_keyword).strip().lower()
-    
-    kg = load_kg()
-    for item in kg:
-        existing_title = item.get('title', '').lower()
-        
-        ratio = difflib.SequenceMatcher(None, target, existing_title).ratio()
-        if ratio > SIMILARITY_THRESHOLD:
-            log(f"      ⛔ [Phase 1 REJECT] '{target}' is {int(ratio*100)}% similar to an existing title.")
-            return True
+    _blacklist_cache.clear()
+    _blacklist_cache[cache_key] = "\n".join(formatted_list)
+    return _blacklist_cache[cache_key]
 
-        if len(target) > 8 and target in existing_title:
-             log(f"      ⛔ [Phase 1 REJECT] '{target}' is a subset of an existing title.")
-             return True
+# Per-run counters of how each Phase 2 decision was made (logged in main.py's final report)
+_dedup_stats = {"auto_accept": 0, "auto_reject": 0, "llm_judge": 0}
 
-    model_name = config['settings'].get('model_name', 'gemini-2.5-flash')
-    blacklist_text = get_blacklist_context(category)
-    
-    if blacklist_text == "NO_PREVIOUS_CONTENT":
+def get_dedup_stats():
+    """Phase 2 decision counts for this run plus the share that skipped the LLM judge."""
+    stats = dict(_dedup_stats)
+    total = sum(stats.values())
+    stats["skip_rate"] = round((stats["auto_accept"] + stats["auto_reject"]) / total, 3) if total else 0.0
+    return stats
+
+def _phase1_reject(new_keyword):
+    """Phase 1: difflib ratio / substring rules, run only against trigram-index candidates."""
+    target = str(new_keyword).strip().lower()
+    match = _get_title_index().first_match(target, SIMILARITY_THRESHOLD)
+    if not match:
         return False
+    _, reason, ratio = match
+    if reason == 'ratio':
+        log(f"      ⛔ [Phase 1 REJECT] '{target}' is {int(ratio*100)}% similar to an existing title.")
+    else:
+        log(f"      ⛔ [Phase 1 REJECT] '{target}' is a subset of an existing title.")
+    return True
+
+def _dedup_history_days(config):
+    return config.get('settings', {}).get('semantic_dedup', {}).get('history_days', 120)
+
+def _dedup_window(config):
+    """
+    The articles the LLM judge is shown (same date window and cap as get_blacklist_context)
+    with their stored title vectors, so both tiers judge against the same history.
+    """
+    _get_vector_index() # Makes sure the vector store is loaded
+    cutoff = datetime.date.today() - datetime.timedelta(days=_dedup_history_days(config))
+    entries = [e for e in get_recent_articles(MAX_HISTORY_ITEMS_FOR_AI, since_date=cutoff)
+               if isinstance(e.get("embedding_row"), int)]
+    return entries, get_embeddings(entries)
+
+def _vector_prefilter(new_keyword, config, vector=None, window=None):
+    """
+    Max cosine similarity of the proposal to the title vectors of the judge's window (see _dedup_window).
+    Returns 'accept', 'reject' or None (ambiguous band, or no vectors available -> ask the LLM).
+    """
+    dedup_cfg = config.get('settings', {}).get('semantic_dedup', {})
+    accept_below = dedup_cfg.get('auto_accept_below', DEDUP_AUTO_ACCEPT_BELOW)
+    reject_above = dedup_cfg.get('auto_reject_above', DEDUP_AUTO_REJECT_ABOVE)
+    try:
+        entries, matrix = window if window is not None else _dedup_window(config)
+        if not entries: return None
+        if vector is None: vector = _generate_embedding(new_keyword)
+        sims = np.asarray(matrix, dtype=np.float32) @ normalize_rows(vector)[0] # Stored rows are unit length
+    except Exception as e:
+        log(f"      ⚠️ [Vector Tier] Unavailable ({e}). Deferring to the LLM judge.")
+        return None
+    best = int(np.argmax(sims))
+    score, entry = float(sims[best]), entries[best]
+    if score < accept_below:
+        log(f"      ✅ [Vector Tier PASSED] Closest title is only {score:.2f} similar ('{entry.get('title')}'). Skipping LLM judge.")
+        return 'accept'
+    if score > reject_above:
+        log(f"      ⛔ [Vector Tier REJECT] {score:.2f} similar to '{entry.get('title')}'. Skipping LLM judge.")
+        return 'reject'
+    log(f"      🔍 [Vector Tier] Closest title {score:.2f} similar ('{entry.get('title')}') -> ambiguous, asking the LLM judge.")
+    return None
 
-    log(f"   🧠 [Phase 2 Judge] Analyzing 'Reader Value' of '{new_keyword}' against Blacklist...")
+def _judge_proposals(proposals, category, blacklist_text, model_name, related=None):
+    """
+    Phase 2 LLM judge: one prompt for all ambiguous proposals.
+    `related` maps a proposal to its closest archive titles (hybrid search, any publish date).
+    Returns {proposal: is_duplicate}; proposals without a usable verdict count as unique (same as an API failure).
+    """
+    related = related or {}
+    numbered = "\n".join(
+        f"    {i}. {p}" + (f"\n       (Closest archive matches: {' | '.join(related[p])})" if related.get(p) else "")
+        for i, p in enumerate(proposals, 1))
     prompt = f"""
     ROLE: Ruthless Editor-in-Chief & Duplicate Content Police.
-    TASK: Determine if the "New Proposal" is redundant based on the "Blacklist" (Past Articles).
+    TASK: For EACH "New Proposal", determine if it is redundant based on the "Blacklist" (Past Articles).
     
-    INPUT PROPOSAL: {new_keyword}
+    INPUT PROPOSALS:
+{numbered}
     CATEGORY: {category}
     
     RECENTLY PUBLISHED ARTICLES (THE BLACKLIST):
@@ -219,99 +759,150 @@ def check_semantic_duplication(new_keyword, category, config):
     DECISION MATRIX:
     - If strictly distinct (different product, different intent): "is_duplicate": false.
     - If overlapping, contained, or repetitive: "is_duplicate": true.
+    - Judge every proposal ONLY against the Blacklist, not against the other proposals.
     ------------------------------------------------------------------------
     
-    OUTPUT JSON FORMAT ONLY:
+    OUTPUT JSON FORMAT ONLY (one verdict per proposal, "id" = its number above):
     {{
-        "is_duplicate": true/false,
-        "conflict_title": "Title of the existing article that causes the conflict (or 'None')",
-        "reason": "Explain clearly why this is rejected based on the Containment or Entity rule."
+        "verdicts": [
+            {{
+                "id": 1,
+                "is_duplicate": true/false,
+                "conflict_title": "Title of the existing article that causes the conflict (or 'None')",
+                "reason": "Explain clearly why this is rejected based on the Containment or Entity rule."
+            }}
+        ]
     }}
     """
+    verdicts = {p: False for p in proposals}
     try:
         result = generate_step_strict(
             model_name, 
             prompt, 
             "Semantic Blacklist Check", 
-            required_keys=["is_duplicate"]
+            required_keys=["verdicts"]
         )
         
-        is_dup = result.get('is_duplicate', False)
-        reason = result.get('reason', 'N/A')
-        
-        if is_dup:
-            log(f"      ⛔ [Phase 2 REJECT] '{new_keyword}' blocked. Reason: {reason}")
-            return True
-        else:
-            log(f"      ✅ [Phase 2 PASSED] Topic is unique. Reason: {reason}")
-            return False
+        for verdict in result.get('verdicts') or []:
+            try:
+                idx = int(verdict.get('id')) - 1
+            except (AttributeError, TypeError, ValueError):
+                continue
+            if not 0 <= idx < len(proposals): continue
+            proposal = proposals[idx]
+            is_dup = bool(verdict.get('is_duplicate', False))
+            reason = verdict.get('reason', 'N/A')
+            verdicts[proposal] = is_dup
+            if is_dup:
+                log(f"      ⛔ [Phase 2 REJECT] '{proposal}' blocked. Reason: {reason}")
+            else:
+                log(f"      ✅ [Phase 2 PASSED] '{proposal}' is unique. Reason: {reason}")
             
     except Exception as e:
         log(f"      ⚠️ Semantic Check API Failure: {str(e)}. Proceeding with Phase 1 result (False).")
-        return False
+    return verdicts
+
+def check_semantic_duplication_batch(candidates, category, config):
+    """
+    Duplicate guard for a whole candidate list (trend lists, cluster candidates).
+    Phase 1 per candidate, one encode call for the vector tier, one LLM judge prompt for the ambiguous band.
+    Returns {candidate: is_duplicate}.
+    """
+    candidates = list(dict.fromkeys(candidates))
+    results = {}
+    remaining = []
+    for candidate in candidates:
+        if _phase1_reject(candidate):
+            results[candidate] = True
+        else:
+            remaining.append(candidate)
+    if not remaining:
+        return results
+
+    model_name = config['settings'].get('model_name', 'gemini-2.5-flash')
+    blacklist_text = get_blacklist_context(category, days_limit=_dedup_history_days(config))
+    
+    if blacklist_text == "NO_PREVIOUS_CONTENT":
+        results.update({c: False for c in remaining})
+        return results
+
+    try:
+        vectors = _get_model().encode([str(c) for c in remaining], convert_to_numpy=True)
+        window = _dedup_window(config)
+    except Exception as e:
+        log(f"      ⚠️ [Vector Tier] Unavailable ({e}). Deferring to the LLM judge.")
+        vectors, window = [None] * len(remaining), None
+
+    ambiguous, related = [], {}
+    for candidate, vector in zip(remaining, vectors):
+        verdict = _vector_prefilter(candidate, config, vector=vector, window=window) if vector is not None else None
+        if verdict == 'accept':
+            _dedup_stats["auto_accept"] += 1
+            results[candidate] = False
+        elif verdict == 'reject':
+            _dedup_stats["auto_reject"] += 1
+            results[candidate] = True
+        else:
+            _dedup_stats["llm_judge"] += 1
+            ambiguous.append(candidate)
+            try:
+                related[candidate] = [e.get('title') for _, e in search(candidate, k=3, vector=vector)]
+            except Exception:
+                pass
+
+    if ambiguous:
+        log(f"   🧠 [Phase 2 Judge] Analyzing 'Reader Value' of {len(ambiguous)} proposal(s) against Blacklist in one call...")
+        results.update(_judge_proposals(ambiguous, category, blacklist_text, model_name, related))
+    return results
+
+def check_semantic_duplication(new_keyword, category, config):
+    """
+    THE ULTIMATE DEDUPLICATION GUARD (The Blacklist Comparison Engine).
+    Phase 1: fuzzy title match. Phase 2: vector similarity tier, then the LLM judge for the ambiguous band only.
+    """
+    return check_semantic_duplication_batch([new_keyword], category, config).get(new_keyword, False)
 
 def get_recent_titles_string(category=None, limit=100):
     """
     Compatibility function for older modules. 
     Returns a simple string of titles.
     """
-    kg = load_kg()
-    if not kg: return ""
+    if not load_kg(): return ""
     
-    if category:
-        relevant = [i for i in kg if i.get('section') == category]
-    else:
-        relevant = kg
-        
-    subset = relevant[-limit:]
+    subset = get_recent_articles(limit, section=category or None)[::-1] # Oldest -> newest, as before
     titles = [f"- {i.get('title', 'Untitled')}" for i in subset]
     return "\n".join(titles)
 
 # --- الترقية: استبدال كامل لمنطق الربط الداخلي ---
-def get_relevant_kg_for_linking(current_title, current_category):
+def get_relevant_kg_for_linking(current_title, current_category, content_html=None):
     """
-    V3.0 - Semantic Linking Strategy.
-    Finds the 5 most conceptually similar articles from the Knowledge Graph using vector similarity.
+    V4.0 - Hybrid Linking Strategy.
+    Finds the 5 most related articles: title-vector similarity fused with full-text overlap
+    against the draft (content_html, optional) via history_manager.search().
     """
     log("   🔗 [Semantic Linker] Finding conceptually related articles...")
-    kg = load_kg()
     
-    # 1. فلترة المقالات التي لا تحتوي على متجهات أو المقال الحالي نفسه
-    kg_with_embeddings = [
-        item for item in kg if item.get("embedding") and item.get("title") != current_title
-    ]
+    # 1-6. بحث هجين (BM25 + المتجهات) مع استبعاد المقال الحالي نفسه
+    query = current_title
+    if content_html:
+        query += " " + BeautifulSoup(content_html, 'html.parser').get_text(separator=' ', strip=True)[:MAX_CACHED_TEXT_CHARS]
+    try:
+        vector = _generate_embedding(current_title)
+    except Exception as e:
+        log(f"      ⚠️ Title vector unavailable ({e}).")
+        vector = None
+    scored_articles = search(query, k=5, exclude_titles={current_title}, vector=vector)
     
-    if len(kg_with_embeddings) < 1:
+    if len(scored_articles) < 1:
         log("      ⚠️ Not enough historical data for semantic linking. Skipping.")
         return json.dumps([])
-
-    # 2. توليد متجه للمقال الحالي
-    current_embedding = _generate_embedding(current_title)
-    
-    # 3. استخراج متجهات المقالات السابقة
-    historical_embeddings = np.array([item["embedding"] for item in kg_with_embeddings])
-    
-    # 4. حساب التشابه الدلالي (Cosine Similarity)
-    similarities = cosine_similarity(
-        current_embedding.reshape(1, -1),
-        historical_embeddings
-    )[0]
-    
-    # 5. ترتيب المقالات حسب درجة التشابه
-    scored_articles = sorted(
-        zip(similarities, kg_with_embeddings), 
-        key=lambda x: x[0], 
-        reverse=True
-    )
-    
-    # 6. اختيار أفضل 5 مقالات ذات صلة
-    top_5_semantically_related = [article for score, article in scored_articles[:5]]
+    top_5_semantically_related = [article for score, article in scored_articles]
 
     # 7. تجهيز المخرجات للبرومبت
     output = []
     log("      ✅ Top 5 Semantic Matches Found:")
     for item in top_5_semantically_related:
-        log(f"         - (Score: {scored_articles[len(output)][0]:.2f}) {item.get('title')}")
+        log(f"         - (RRF: {scored_articles[len(output)][0]:.3f}) {item.get('title')}")
         output.append({
             "title": item.get('title'),
             "url": item.get('url')
@@ -15,13 +15,13 @@ from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 from io import BytesIO
 from PIL import Image
-from google import genai
 from google.genai import types
 
 # Project imports
 import image_processor 
 from config import log
-from api_manager import key_manager
+from api_manager import key_manager, estimate_tokens
+import cassette
 
 # --- Configuration ---
 MAX_POOL_SIZE = 20  # نجمع عدداً كبيراً من الصور لنعطي الذكاء الاصطناعي خيارات واسعة
@@ -52,6 +52,7 @@ def download_image_to_memory(url: str) -> Optional[bytes]:
         return r.content
     except: return None
 
+@cassette.recordable("image_enricher.targeted_google_search")
 def targeted_google_search(query: str, section_context: str, num_results: int = 3) -> List[Dict]:
     """
     Performs a specialized search for a specific section.
@@ -92,6 +93,7 @@ def targeted_google_search(query: str, section_context: str, num_results: int =
         return results
     except: return []
 
+@cassette.recordable("image_enricher.batch_analyze_and_map")
 def batch_analyze_and_map(candidates: List[Dict], headers_list: List[str], topic: str):
     """
     THE MASTERMIND: Sends everything to Gemini Vision to pick the winners.
@@ -149,8 +151,7 @@ def batch_analyze_and_map(candidates: List[Dict], headers_list: List[str], topic
     
     # 3. API Call
     try:
-        key = key_manager.get_current_key()
-        client = genai.Client(api_key=key)
+        client = key_manager.get_client(estimate_tokens(prompt_text))
         
         response = client.models.generate_content(
             model="gemini-2.5-flash",
@@ -12,11 +12,11 @@ from PIL import Image, ImageDraw, ImageFont, ImageFilter
 import cv2
 import numpy as np
 from github import Github
-from google import genai
 from google.genai import types
 from bs4 import BeautifulSoup
 from config import log, USER_AGENTS
-from api_manager import key_manager
+import cassette
+from api_manager import key_manager, estimate_tokens
 import time # <--- إضافة استيراد الوقت هنا
 
 def extract_og_image(html_content):
@@ -37,6 +37,7 @@ def draw_text_with_outline(draw, position, text, font, fill_color, outline_color
                 draw.text((x + dx, y + dy), text, font=font, fill=outline_color)
     draw.text(position, text, font=font, fill=fill_color)
 
+@cassette.recordable("image_processor.upload_to_github_cdn")
 def upload_to_github_cdn(image_bytes, filename):
     try:
         gh_token = os.getenv('MY_GITHUB_TOKEN')
@@ -149,6 +150,7 @@ def apply_smart_privacy_blur(pil_image):
         log(f"      ⚠️ Smart Blur Error: {e}. Returning original.")
         return pil_image
 
+@cassette.recordable("image_processor.select_best_image_with_gemini")
 def select_best_image_with_gemini(model_name, article_title, images_list):
     if not images_list: return None
     valid_images = []
@@ -172,8 +174,7 @@ def select_best_image_with_gemini(model_name, article_title, images_list):
     OUTPUT: Integer only.
     """
     try:
-        key = key_manager.get_current_key()
-        client = genai.Client(api_key=key)
+        client = key_manager.get_client(estimate_tokens(prompt))
         inputs = [prompt]
         for img in valid_images: inputs.append(types.Part.from_bytes(data=img['data'], mime_type="image/jpeg"))
         
@@ -200,6 +201,7 @@ def _is_placeholder_url(url: str) -> bool:
     url_lower = url.lower()
     return any(p in url_lower for p in _PLACEHOLDER_DOMAINS)
 
+@cassette.recordable("image_processor.upload_external_image")
 def upload_external_image(source_url, filename_title):
     """
     Downloads an image from a URL, applies smart blur, and uploads it to GitHub CDN.
@@ -247,6 +249,7 @@ def upload_external_image(source_url, filename_title):
         log(f"      ❌ External Image Upload Failed: {e}")
         return None
 
+@cassette.recordable("image_processor.process_source_image")
 def process_source_image(source_url, overlay_text, filename_title):
     try:
         headers = {'User-Agent': 'Mozilla/5.0'}
@@ -310,6 +313,7 @@ def process_source_image(source_url, overlay_text, filename_title):
         safe_name = re.sub(r'[^a-zA-Z0-9\s-]', '', filename_title).strip().replace(' ', '-').lower()[:50] + ".jpg"
         return upload_to_github_cdn(img_byte_arr, safe_name)
     except: return None
+@cassette.recordable("image_processor.generate_and_upload_image")
 def generate_and_upload_image(prompt_text, overlay_text=""):
     log(f"   🎨 Generating Professional AI Thumbnail for: {prompt_text[:50]}...")
     
@@ -6,6 +6,7 @@ import json
 import requests
 from oauth2client.service_account import ServiceAccountCredentials
 from config import log
+import cassette
 
 SCOPES = ["https://www.googleapis.com/auth/indexing"]
 ENDPOINT = "https://indexing.googleapis.com/v3/urlNotifications:publish"
@@ -24,6 +25,7 @@ def get_credentials():
         log(f"❌ Indexing Auth Error: {e}")
         return None
 
+@cassette.recordable("indexer.submit_url")
 def submit_url(url):
     log(f"   🚀 [Indexer] Pinging Google for: {url}...")
     creds = get_credentials()
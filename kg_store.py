@@ -0,0 +1,118 @@
+# FILE: kg_store.py
+# ROLE: Optional SQLite Backend for the Knowledge Graph (settings.knowledge_graph.backend = "sqlite")
+# DESCRIPTION: One row per article, indexed on date, section, url, post_id and last_updated, so
+#              "last 60 in category X" or "oldest un-updated posts older than 90 days" are index lookups
+#              instead of Python loops with strptime. Dates are ISO strings (YYYY-MM-DD): string order == date order.
+#              history_manager keeps owning the in-memory list, the vectors and the mutation records;
+#              this module only persists and queries them.
+
+import json
+import sqlite3
+import threading
+
+# Columns with their own index / typed storage. Any other entry field is kept in the `extra` JSON blob.
+COLUMNS = ("url", "title", "section", "date", "post_id", "last_updated", "last_verified", "update_count", "embedding_row")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,   -- insertion order (= order of the legacy JSON list)
+    url TEXT NOT NULL UNIQUE,
+    title TEXT,
+    section TEXT,
+    date TEXT,
+    post_id TEXT,
+    last_updated TEXT,
+    last_verified TEXT,
+    update_count INTEGER,
+    embedding_row INTEGER,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_articles_date ON articles(date);
+CREATE INDEX IF NOT EXISTS idx_articles_section_date ON articles(section, date);
+CREATE INDEX IF NOT EXISTS idx_articles_post_id ON articles(post_id);
+CREATE INDEX IF NOT EXISTS idx_articles_last_updated ON articles(last_updated);
+"""
+
+def _split(entry):
+    """KG entry -> (column values, extra JSON)."""
+    values = [entry.get(col) for col in COLUMNS]
+    extra = {k: v for k, v in entry.items() if k not in COLUMNS}
+    return values, json.dumps(extra, ensure_ascii=False) if extra else None
+
+def _to_entry(row):
+    """Row -> KG entry dict, with the same keys the JSON snapshot would have."""
+    entry = {col: row[col] for col in COLUMNS if row[col] is not None}
+    if row["extra"]:
+        entry.update(json.loads(row["extra"]))
+    return entry
+
+class KGStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def load_all(self):
+        """All entries in insertion order (what load_kg() returns)."""
+        return [_to_entry(r) for r in self._conn.execute("SELECT * FROM articles ORDER BY id")]
+
+    def _insert(self, entry):
+        values, extra = _split(entry)
+        self._conn.execute(
+            f"INSERT OR IGNORE INTO articles ({', '.join(COLUMNS)}, extra) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+            values + [extra])
+
+    def replace_all(self, data):
+        """Rewrites the table from a full KG list in one transaction (migration / self-healing)."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM articles")
+            for entry in data:
+                if entry.get("url"): self._insert(entry)
+
+    def apply(self, record):
+        """Applies one history_manager mutation record ("insert" / "set") in its own transaction."""
+        with self._lock, self._conn:
+            if record.get("op") == "insert":
+                entry = record.get("entry") or {}
+                if entry.get("url"): self._insert(entry)
+            elif record.get("op") == "set":
+                fields = record.get("fields") or {}
+                columns = {k: v for k, v in fields.items() if k in COLUMNS and k != "url"}
+                extras = {k: v for k, v in fields.items() if k not in COLUMNS}
+                if columns:
+                    self._conn.execute(f"UPDATE articles SET {', '.join(f'{k} = ?' for k in columns)} WHERE url = ?",
+                                       list(columns.values()) + [record.get("url")])
+                if extras:
+                    row = self._conn.execute("SELECT extra FROM articles WHERE url = ?", (record.get("url"),)).fetchone()
+                    if row is not None:
+                        merged = json.loads(row["extra"]) if row["extra"] else {}
+                        merged.update(extras)
+                        self._conn.execute("UPDATE articles SET extra = ? WHERE url = ?",
+                                           (json.dumps(merged, ensure_ascii=False), record.get("url")))
+
+    def recent(self, limit, section=None, since=None):
+        """Newest entries first (date, then insertion order), optionally one section / on or after `since`."""
+        sql, params = "SELECT * FROM articles WHERE 1 = 1", []
+        if section is not None:
+            sql += " AND section = ?"
+            params.append(section)
+        if since is not None:
+            sql += " AND date >= ?"
+            params.append(str(since))
+        sql += " ORDER BY date DESC, id ASC LIMIT ?"
+        params.append(int(limit))
+        return [_to_entry(r) for r in self._conn.execute(sql, params)]
+
+    def stale(self, published_before, limit=1):
+        """Posts (with a post_id) published before the date, least recently updated first."""
+        rows = self._conn.execute(
+            "SELECT * FROM articles WHERE post_id IS NOT NULL AND post_id != '' AND date < ? "
+            "ORDER BY COALESCE(last_updated, '1970-01-01') ASC, id ASC LIMIT ?",
+            (str(published_before), int(limit)))
+        return [_to_entry(r) for r in rows]
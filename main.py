@@ -17,6 +17,7 @@ from config import log, FORBIDDEN_PHRASES, ARTICLE_STYLE, BORING_KEYWORDS
 import api_manager
 import news_fetcher
 import scraper
+import scrape_cache
 import image_processor
 import history_manager
 import publisher
@@ -44,21 +45,28 @@ import image_enricher
 import content_architect
 import deep_dive_researcher
 import seo_quality_gate
+import research_compressor
+import cassette
 
+@cassette.recordable("main.is_source_viable")
 def is_source_viable(url, min_text_length=600):
-    """Checks if a source URL is valid and has content."""
+    """Checks if a source URL is valid and has content (a cached scrape answers without any request)."""
     try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        r = requests.head(url, headers=headers, timeout=5, allow_redirects=True)
-        if r.status_code == 404:
-            return False, "404 Not Found"
-        _, _, text, _, _ = scraper.resolve_and_scrape(url)
+        cached = scrape_cache.cache.get(url)
+        if cached is None:
+            headers = {'User-Agent': 'Mozilla/5.0'}
+            r = requests.head(url, headers=headers, timeout=5, allow_redirects=True)
+            if r.status_code == 404:
+                return False, "404 Not Found"
+        # The scrape is cached, so the research phase reuses it instead of fetching the page again
+        _, _, text, _, _ = cached or scraper.resolve_and_scrape(url)
         if text and len(text) >= min_text_length:
             return True, "Valid Content"
         return False, "Content too short or empty"
     except:
         return False, "Connection Failed"
 
+@cassette.recordable("main.is_url_accessible")
 def is_url_accessible(url):
     """Checks if a URL is alive (Status 200) and allows hotlinking."""
     if not url: return False
@@ -75,6 +83,7 @@ def run_pipeline(category, config, forced_keyword=None, is_cluster_topic=False):
     Integrated with Truth Verification, Data Visualization, Code Hunting, and Strict Quality Loops.
     """
     model_name = config['settings'].get('model_name', "gemini-3-flash-preview")
+    api_manager.usage_tracker.set_category(category)
     img_url = None
 
     vid_main_id, vid_main_url = None, None
@@ -112,14 +121,19 @@ def run_pipeline(category, config, forced_keyword=None, is_cluster_topic=False):
 
         if not target_keyword: return False
 
-        smart_query = ai_strategy.generate_smart_query(target_keyword)
-
+        # Smart query extraction and Intent Analysis are independent -> run them together.
         log("   🧠 [Strategy] Analyzing Topic Intent & Accessibility...")
         intent_prompt = PROMPT_ARTICLE_INTENT.format(target_keyword=target_keyword, category=category)
-        try:
-            intent_analysis = api_manager.generate_step_strict(
+        smart_query, intent_analysis = api_manager.run_steps_concurrently(
+            ai_strategy.agenerate_smart_query(target_keyword),
+            api_manager.agenerate_step_strict(
                 model_name, intent_prompt, "Intent Analysis", ["content_type", "visual_strategy", "is_enterprise_b2b"]
             )
+        )
+        if isinstance(smart_query, Exception):
+            smart_query = ai_strategy._get_core_keywords_heuristic(target_keyword)
+        try:
+            if isinstance(intent_analysis, Exception): raise intent_analysis
             content_type = intent_analysis.get("content_type", "News Analysis")
             visual_strategy = intent_analysis.get("visual_strategy", "hunt_for_screenshot") # Not used directly anymore but for logging
             is_b2b = intent_analysis.get("is_enterprise_b2b", False)
@@ -149,17 +163,21 @@ def run_pipeline(category, config, forced_keyword=None, is_cluster_topic=False):
         official_domain = None
 
         # A. Get Sources List
+        # Deep Dive and Competitor Analysis only depend on the keyword -> run them together.
         sources_to_scrape = []
-        deep_dive_results = None
-        try:
-            deep_dive_results = deep_dive_researcher.conduct_deep_dive(target_keyword, model_name)
-            if deep_dive_results:
-                sources_to_scrape.extend(deep_dive_results.get("official_sources", []))
-                sources_to_scrape.extend(deep_dive_results.get("research_studies", []))
-                sources_to_scrape.extend(deep_dive_results.get("personal_experiences", []))
-                sources_to_scrape.extend(deep_dive_results.get("independent_critiques", []))
-        except Exception as e:
-            log(f"   ⚠️ Deep Dive Module Error: {e}")
+        comp_prompt = PROMPT_COMPETITOR_ANALYSIS.format(target_keyword=target_keyword)
+        deep_dive_results, comp_result = api_manager.run_steps_concurrently(
+            deep_dive_researcher.aconduct_deep_dive(target_keyword, model_name),
+            api_manager.agenerate_step_strict(model_name, comp_prompt, "Competitor Analysis", ["competitors"], use_google_search=True)
+        )
+        if isinstance(deep_dive_results, Exception):
+            log(f"   ⚠️ Deep Dive Module Error: {deep_dive_results}")
+            deep_dive_results = None
+        if deep_dive_results:
+            sources_to_scrape.extend(deep_dive_results.get("official_sources", []))
+            sources_to_scrape.extend(deep_dive_results.get("research_studies", []))
+            sources_to_scrape.extend(deep_dive_results.get("personal_experiences", []))
+            sources_to_scrape.extend(deep_dive_results.get("independent_critiques", []))
 
         # Add Official Source URL if exists and not already in list
         if official_source_url:
@@ -168,18 +186,25 @@ def run_pipeline(category, config, forced_keyword=None, is_cluster_topic=False):
              official_domain = urlparse(official_source_url).netloc
 
         if len(sources_to_scrape) < 2:
-            rss_items = news_fetcher.get_strict_rss(smart_query, category)
-            for item in rss_items[:4]:
+            rss_items = news_fetcher.canonicalize_links(news_fetcher.get_strict_rss(smart_query, category)[:4])
+            for item in rss_items:
                 sources_to_scrape.append({"url": item['link'], "page_name": item['title']})
 
         # B. SCRAPE LOOP (WITH ASSET EXTRACTION)
+        # Scraped concurrently (bounded, per-domain polite, one deadline); consumed below in the original order.
         processed_urls = set()
+        scrape_targets = []
         for src_item in sources_to_scrape:
             url = src_item.get('url') or src_item.get('link')
             if not url or url in processed_urls: continue
             processed_urls.add(url)
+            scrape_targets.append((src_item, url))
+        scraped = scraper.scrape_many([url for _, url in scrape_targets])
+
+        for src_item, url in scrape_targets:
+            if url not in scraped: continue
             try:
-                s_url, s_title, s_text, s_og_img, extracted_assets = scraper.resolve_and_scrape(url)
+                s_url, s_title, s_text, s_og_img, extracted_assets = scraped[url]
                 if s_text:
                     s_type = "SOURCE"
                     if official_source_url and url == official_source_url: s_type = "OFFICIAL SOURCE"
@@ -202,6 +227,9 @@ def run_pipeline(category, config, forced_keyword=None, is_cluster_topic=False):
              return False
         log(f"   ✅ Research Complete. Found {len(collected_sources)} sources.")
 
+        # One compressed research bundle (dedup + boilerplate removal + fact priority), reused by every prompt below
+        research_bundle = research_compressor.compress_research(collected_sources)
+
         # ======================================================================
         # 4. REDDIT INTEL & COMPETITOR ANALYSIS
         # ======================================================================
@@ -217,8 +245,7 @@ def run_pipeline(category, config, forced_keyword=None, is_cluster_topic=False):
         log("   🔍 [Competitor Analysis] Identifying market alternatives...")
         competitor_data = []
         try:
-            comp_prompt = PROMPT_COMPETITOR_ANALYSIS.format(target_keyword=target_keyword)
-            comp_result = api_manager.generate_step_strict(model_name, comp_prompt, "Competitor Analysis", ["competitors"], use_google_search=True)
+            if isinstance(comp_result, Exception): raise comp_result
             if comp_result and comp_result.get("competitors"):
                 competitor_data = comp_result["competitors"]
                 log(f"      ✅ Found competitors: {[c['name'] for c in competitor_data]}")
@@ -257,7 +284,7 @@ def run_pipeline(category, config, forced_keyword=None, is_cluster_topic=False):
             valid_asset_count += 1
             
         # Add generated chart if applicable
-        all_text_blob_for_assets = "\n".join([s['text'] for s in collected_sources])[:20000]
+        all_text_blob_for_assets = research_bundle[:research_compressor.CHART_MAX_CHARS]
         
         # Determine if chart should run (expanded logic)
         should_run_chart = (
@@ -292,10 +319,10 @@ def run_pipeline(category, config, forced_keyword=None, is_cluster_topic=False):
         competitor_text = ""
         if competitor_data:
             competitor_text = "\n\n--- COMPETITOR ANALYSIS ---\n" + json.dumps(competitor_data, ensure_ascii=False) # Ensure non-ASCII chars are handled
-        combined_text = "\n\n".join([s['text'][:8000] for s in collected_sources]) + competitor_text
+        combined_text = research_bundle + competitor_text
         
         blueprint = content_architect.create_article_blueprint(
-            target_keyword, content_type, combined_text, reddit_context, 
+            target_keyword, content_type, combined_text[:research_compressor.ARCHITECT_MAX_CHARS], reddit_context, 
             "\n".join(visual_context_for_writer), model_name
         )
         if not blueprint or not blueprint.get("article_blueprint"):
@@ -308,9 +335,9 @@ def run_pipeline(category, config, forced_keyword=None, is_cluster_topic=False):
         log("   ✍️ [The Artisan] Writing the article...")
         artisan_prompt = PROMPT_B_TEMPLATE.format(
             blueprint_json=json.dumps(blueprint, ensure_ascii=False), # ensure_ascii=False for proper Arabic handling
-            raw_data_bundle=json.dumps({"research": combined_text[:15000], "reddit": reddit_context[:5000]}, ensure_ascii=False)
+            raw_data_bundle=json.dumps({"research": combined_text[:research_compressor.ARTISAN_MAX_CHARS], "reddit": reddit_context[:5000]}, ensure_ascii=False)
         )
-        json_b = api_manager.generate_step_strict(model_name, artisan_prompt, "Artisan Writer", ["headline", "article_body"])
+        json_b = api_manager.generate_step_strict(model_name, artisan_prompt, "Artisan Writer", ["headline", "article_body"], stream=True)
         title = blueprint.get("final_title", json_b.get('headline', target_keyword))
         draft_body_html = json_b.get('article_body', '')
 
@@ -408,15 +435,15 @@ def run_pipeline(category, config, forced_keyword=None, is_cluster_topic=False):
                 continue
             sources_data.append({"title": s['title'], "url": s['url']})
         log(f"   ✅ Sources after dead-link filter: {len(sources_data)} valid sources")
-        kg_links = history_manager.get_relevant_kg_for_linking(title, category)
+        kg_links = history_manager.get_relevant_kg_for_linking(title, category, final_body_html)
         seo_payload = {"draft_content": {"headline": title, "article_body": final_body_html}, "sources_data": sources_data}
-        json_c = api_manager.generate_step_strict(model_name, PROMPT_C_TEMPLATE.format(json_input=json.dumps(seo_payload, ensure_ascii=False), knowledge_graph=kg_links), "SEO Polish", ["finalTitle", "finalContent", "seo", "schemaMarkup"])
+        json_c = api_manager.generate_step_strict(model_name, PROMPT_C_TEMPLATE.format(json_input=json.dumps(seo_payload, ensure_ascii=False), knowledge_graph=kg_links), "SEO Polish", ["finalTitle", "finalContent", "seo", "schemaMarkup"], stream=True)
 
         if not img_url and json_c.get('imageGenPrompt'):
             log("   🎨 No real image found. Falling back to AI Image Generation...")
             img_url = image_processor.generate_and_upload_image(json_c['imageGenPrompt'], json_c.get('imageOverlayText', ''))
 
-        humanizer_payload = api_manager.generate_step_strict(model_name, PROMPT_D_TEMPLATE.format(content_input=json_c['finalContent']), "Humanizer", ["finalContent"])
+        humanizer_payload = api_manager.generate_step_strict(model_name, PROMPT_D_TEMPLATE.format(content_input=json_c['finalContent']), "Humanizer", ["finalContent"], stream=True)
         final_title = json_c['finalTitle']
         full_body_html = humanizer_payload['finalContent']
 
@@ -589,7 +616,7 @@ HTML TO FIX:
                 break
 
         # FINAL DISTRIBUTION
-        history_manager.update_kg(final_title, published_url, category, post_id)
+        history_manager.update_kg(final_title, published_url, category, post_id, content_html=full_body_html)
         try: indexer.submit_url(published_url)
         except: pass
         
@@ -615,6 +642,10 @@ def main():
     try:
         with open('config_advanced.json','r', encoding='utf-8') as f: 
             cfg = json.load(f)
+        api_manager.usage_tracker.configure(cfg['settings'])
+        history_manager.configure(cfg['settings'])
+        scrape_cache.configure(cfg['settings'])
+        research_compressor.configure(cfg['settings'])
 
         log("--- Starting Maintenance Phase ---")
         try:
@@ -634,6 +665,7 @@ def main():
 
         for cat in cats:
             if cluster_published: break
+            api_manager.usage_tracker.set_category(cat)
             
             topic, is_c = cluster_manager.get_strategic_topic(cat, cfg)
             
@@ -659,14 +691,16 @@ def main():
 
         for cat in cats:
             if trend_published: break
+            api_manager.usage_tracker.set_category(cat)
             
             fresh_trends = trend_watcher.get_verified_trend(cat, cfg)
             
             if fresh_trends:
+                duplicates = history_manager.check_semantic_duplication_batch(fresh_trends, cat, cfg)
                 for trend in fresh_trends:
                     if trend_published: break
                     
-                    if history_manager.check_semantic_duplication(trend, cat, cfg):
+                    if duplicates.get(trend):
                         log(f"      ⏭️ Skipping duplicate trend: '{trend}'")
                         continue
                     
@@ -685,9 +719,10 @@ def main():
             if not trend_published and cfg['categories'][cat].get('trending_focus'):
                 raw_topics = [t.strip() for t in cfg['categories'][cat]['trending_focus'].split(',')]
                 random.shuffle(raw_topics)
+                duplicates = history_manager.check_semantic_duplication_batch(raw_topics, cat, cfg)
                 for potential_topic in raw_topics:
                     if trend_published: break
-                    if history_manager.check_semantic_duplication(potential_topic, cat, cfg): continue
+                    if duplicates.get(potential_topic): continue
                     
                     log(f"      🚀 Attempting manual topic: {potential_topic}")
                     if run_pipeline(cat, cfg, forced_keyword=potential_topic, is_cluster_topic=False):
@@ -700,10 +735,19 @@ def main():
         log("\n📊 --- DAILY RUN REPORT ---")
         log(f"   1. Cluster Article: {'✅ Published' if cluster_published else '❌ Skipped/Failed'}")
         log(f"   2. Trend Article:   {'✅ Published' if trend_published else '❌ Skipped/Failed'}")
+        dedup = history_manager.get_dedup_stats()
+        log(f"   3. Duplicate Guard: {dedup['auto_accept']} auto-accepted, {dedup['auto_reject']} auto-rejected, "
+            f"{dedup['llm_judge']} sent to the LLM judge (skip rate {dedup['skip_rate']:.0%}).")
+        tiers = scraper.get_tier_stats()
+        log(f"   4. Scraper Tiers:   {tiers['cache']} from cache, {tiers['http']} via HTTP, {tiers['browser']} via browser, "
+            f"{tiers['failed']} failed (cache hit rate {tiers['cache_hit_rate']:.0%}, HTTP hit rate {tiers['http_hit_rate']:.0%}; "
+            f"escalations: {tiers['escalations'] or 'none'}).")
 
     except Exception as e:
         log(f"❌ CRITICAL MAIN ERROR: {e}")
         traceback.print_exc()
+    finally:
+        api_manager.usage_tracker.write_report()
 
 if __name__ == "__main__":
     main()
@@ -2,6 +2,7 @@
 # ROLE: High-Precision News Fetcher & Quality Gatekeeper.
 # DESCRIPTION: Fetches news from Google News RSS & GNews API. 
 #              Enforces strict quality control via AI vetting and aggressive query optimization.
+#              canonicalize_links() turns the Google News links a caller keeps into publisher URLs (url_resolver decoder).
 
 import requests
 import urllib.parse
@@ -12,6 +13,8 @@ import os
 import json
 import re
 from config import log
+import cassette
+import url_resolver
 from api_manager import generate_step_strict
 
 # ---------------------------------------------------------------------------
@@ -47,10 +50,25 @@ def _is_fresh_enough(date_str: str, max_days: int = MAX_SOURCE_AGE_DAYS) -> bool
         except Exception:
             return True  # Can't parse → assume OK
 
+def canonicalize_links(items):
+    """
+    Replaces Google News redirect links with the publisher URLs (one batch, no browser).
+    Call it on the items that will actually be used: each new link costs an HTTP round-trip.
+    """
+    try:
+        resolved = url_resolver.resolve_google_news_urls([item['link'] for item in items])
+    except Exception as e:
+        log(f"   ⚠️ Google News link decoding failed: {e}")
+        return items
+    for item in items:
+        item['link'] = resolved.get(item['link'], item['link'])
+    return items
+
 # ==============================================================================
 # NEW: STRICT RSS FETCHER (PRIMARY MECHANISM)
 # ==============================================================================
 
+@cassette.recordable("news_fetcher.get_strict_rss")
 def get_strict_rss(query_keywords, category):
     """
     آلية البحث الصارمة الجديدة (المرحلة 3 و 4 من الكود الجديد).
@@ -290,6 +308,7 @@ def clean_search_query(query):
 # 3. GNEWS API FETCHER (DIRECT INDEX ACCESS)
 # ==============================================================================
 
+@cassette.recordable("news_fetcher.get_gnews_api_sources")
 def get_gnews_api_sources(query, category):
     """
     Fetches news from GNews API (High Reliability).
@@ -351,6 +370,7 @@ def get_gnews_api_sources(query, category):
 # 4. GOOGLE NEWS RSS FETCHER (THE GOLD STANDARD)
 # ==============================================================================
 
+@cassette.recordable("news_fetcher.get_real_news_rss")
 def get_real_news_rss(query_keywords, category=None):
     """
     Fetches news from Google News RSS.
@@ -400,7 +420,7 @@ def get_real_news_rss(query_keywords, category=None):
                     "date": pub
                 })
             
-            return items 
+            return items
         
         # --- CRITICAL BEHAVIOR ---
         # Explicitly return empty list if no results found.
@@ -5,6 +5,7 @@ import os
 import requests
 import json
 from config import log
+import cassette
 
 def get_blogger_token():
     """
@@ -24,6 +25,7 @@ def get_blogger_token():
         log(f"❌ Blogger Token Refresh Error: {e}")
         return None
 
+@cassette.recordable("publisher.publish_post")
 def publish_post(title, content, labels):
     """
     Publishes a new post to the configured Blogger blog.
@@ -60,6 +62,7 @@ def publish_post(title, content, labels):
 
 
 
+@cassette.recordable("publisher.get_post_by_id")
 def get_post_by_id(post_id):
     """
     Fetches the content and title of a specific post by its ID.
@@ -88,6 +91,7 @@ def get_post_by_id(post_id):
         log(f"   ❌ Blogger Fetch API Error for post {post_id}: {error_msg}")
         return None, None
 
+@cassette.recordable("publisher.update_existing_post")
 def update_existing_post(post_id, title, content):
     """
     تحديث مقال موجود مسبقاً على بلوجر باستخدام معرف المقال (Post ID).
@@ -17,6 +17,7 @@ from typing import List, Dict, Any, Optional
 
 # Project imports for full integration
 from config import log
+import cassette
 import ai_strategy
 
 class RedditManager:
@@ -183,6 +184,7 @@ def generate_writer_brief(data: Dict[str, Any]) -> str:
         brief += "\n"
     return brief
 
+@cassette.recordable("reddit_manager.get_community_intel")
 def get_community_intel(long_keyword: str):
     """
     Main adapter function called by main.py. Implements the graduated search strategy using a proxy.
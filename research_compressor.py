@@ -0,0 +1,184 @@
+# FILE: research_compressor.py
+# ROLE: Research Bundle Compressor (runs once per pipeline, output reused by every downstream prompt)
+# DESCRIPTION: Scraped sources repeat each other and carry page chrome. This stage drops boilerplate,
+#              removes near-duplicate sentences across sources (MinHash + LSH) and fills a token budget
+#              with fact-bearing sentences (prices, numbers, versions) first.
+# CONFIG: settings.research_bundle {token_budget, architect_max_chars, artisan_max_chars, chart_max_chars}.
+
+import re
+import zlib
+import numpy as np
+from config import log
+
+# --- CONFIGURATION ---
+RESEARCH_TOKEN_BUDGET = 6000     # ~24k chars of compressed research shared by the downstream prompts
+# Hard per-prompt caps (chars), applied on top of the budget (the Architect also gets the competitor analysis)
+ARCHITECT_MAX_CHARS = 40000
+ARTISAN_MAX_CHARS = 15000
+CHART_MAX_CHARS = 20000
+CHARS_PER_TOKEN = 4
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16                   # 16 bands x 4 rows -> candidate pairs from ~0.5 Jaccard upwards
+NEAR_DUPLICATE_JACCARD = 0.7     # Estimated Jaccard at which a later sentence is dropped
+SHINGLE_SIZE = 3                 # Word shingles
+MIN_SENTENCE_WORDS = 4
+LEAD_SENTENCES = 2               # Opening sentences of each source get a small priority bonus
+
+_MERSENNE_PRIME = (1 << 31) - 1
+
+_BOILERPLATE_RE = re.compile(
+    r"\b(cookies?|subscribe|newsletter|sign (?:up|in)|log ?in|all rights reserved|privacy policy|"
+    r"terms of (?:use|service)|share (?:this|on)|follow us|advertisement|click here|read more|"
+    r"related (?:articles|posts|stories)|skip to (?:main )?content|accept all|enable javascript|"
+    r"you may also like|recommended for you|leave a comment|copyright ©?)\b", re.I)
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+(?=["\'“(\[]?[A-Z0-9])')
+_WORD_RE = re.compile(r"[a-z0-9$%.]+", re.I)
+_SOURCE_TAG_RE = re.compile(r'^\[[A-Z ]+\]$')
+
+# Fact signals, strongest first: prices, then measured quantities / versions, then any number
+_PRICE_RE = re.compile(r'[$€£]\s?\d|\d\s?(?:usd|eur|dollars?)\b|\bper (?:month|year|user|seat|1m|million)\b', re.I)
+_QUANTITY_RE = re.compile(r'\d(?:[\d,.]*)\s?(?:%|x\b|ms\b|sec|seconds|minutes|hours|gb\b|tb\b|mb\b|fps|tokens?|'
+                          r'params|parameters|languages|k\b|m\b|b\b)|\bv?\d+\.\d+(?:\.\d+)?\b', re.I)
+_NUMBER_RE = re.compile(r'\d')
+
+class MinHasher:
+    """
+    MinHash signatures over word shingles (vectorised with numpy).
+    Jaccard(a, b) is estimated by the fraction of equal signature slots.
+    """
+    def __init__(self, num_perm=MINHASH_PERMUTATIONS, shingle_size=SHINGLE_SIZE, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.randint(1, _MERSENNE_PRIME, size=(num_perm, 1)).astype(np.uint64)
+        self.b = rng.randint(0, _MERSENNE_PRIME, size=(num_perm, 1)).astype(np.uint64)
+
+    def shingles(self, text):
+        words = [w.lower() for w in _WORD_RE.findall(text)]
+        if len(words) < self.shingle_size:
+            return set(words)
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        shingles = self.shingles(text)
+        if not shingles:
+            return np.full(self.num_perm, _MERSENNE_PRIME, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        hashes %= _MERSENNE_PRIME
+        return ((self.a * hashes + self.b) % _MERSENNE_PRIME).min(axis=1)
+
+    @staticmethod
+    def jaccard(sig_a, sig_b):
+        return float(np.mean(sig_a == sig_b))
+
+class LSHIndex:
+    """Banded LSH over MinHash signatures: only signatures sharing a band are compared."""
+    def __init__(self, num_perm=MINHASH_PERMUTATIONS, bands=LSH_BANDS):
+        self.rows = num_perm // bands
+        self.bands = bands
+        self.buckets = {}
+        self.signatures = []
+
+    def _keys(self, sig):
+        return [(band, sig[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def query(self, sig):
+        """Indexes of stored signatures sharing at least one band with `sig`."""
+        candidates = set()
+        for key in self._keys(sig):
+            candidates.update(self.buckets.get(key, ()))
+        return candidates
+
+    def add(self, sig):
+        idx = len(self.signatures)
+        self.signatures.append(sig)
+        for key in self._keys(sig):
+            self.buckets.setdefault(key, []).append(idx)
+        return idx
+
+def _fact_score(sentence):
+    if _PRICE_RE.search(sentence): return 3
+    if _QUANTITY_RE.search(sentence): return 2
+    if _NUMBER_RE.search(sentence): return 1
+    return 0
+
+def _is_boilerplate(line):
+    words = _WORD_RE.findall(line)
+    if len(words) < MIN_SENTENCE_WORDS and not _NUMBER_RE.search(line):
+        return True # Nav crumbs, buttons, bylines
+    return len(words) < 25 and bool(_BOILERPLATE_RE.search(line))
+
+def _split_sentences(text):
+    for line in text.splitlines():
+        line = line.strip()
+        if not line: continue
+        for sentence in _SENTENCE_SPLIT_RE.split(line):
+            sentence = sentence.strip()
+            if sentence: yield sentence
+
+def configure(settings):
+    """Reads settings.research_bundle (token budget and per-prompt character caps)."""
+    global RESEARCH_TOKEN_BUDGET, ARCHITECT_MAX_CHARS, ARTISAN_MAX_CHARS, CHART_MAX_CHARS
+    cfg = (settings or {}).get("research_bundle") or {}
+    RESEARCH_TOKEN_BUDGET = int(cfg.get("token_budget", RESEARCH_TOKEN_BUDGET))
+    ARCHITECT_MAX_CHARS = int(cfg.get("architect_max_chars", ARCHITECT_MAX_CHARS))
+    ARTISAN_MAX_CHARS = int(cfg.get("artisan_max_chars", ARTISAN_MAX_CHARS))
+    CHART_MAX_CHARS = int(cfg.get("chart_max_chars", CHART_MAX_CHARS))
+
+def compress_research(sources, token_budget=None):
+    """
+    sources: the pipeline's collected_sources ([{'title', 'url', 'text', 'domain'}, ...]).
+    Returns one research text, grouped by source in original order, that fits token_budget
+    (default: RESEARCH_TOKEN_BUDGET, see configure()).
+    """
+    if not sources: return ""
+    if token_budget is None: token_budget = RESEARCH_TOKEN_BUDGET
+    hasher = MinHasher()
+    lsh = LSHIndex()
+    candidates = []
+    headers = []
+    dropped_boilerplate = dropped_duplicates = 0
+    original_chars = sum(len(s.get('text') or "") for s in sources)
+
+    for src_idx, src in enumerate(sources):
+        text = src.get('text') or ""
+        tag = ""
+        first_line, _, rest = text.partition("\n")
+        if _SOURCE_TAG_RE.match(first_line.strip()):
+            tag, text = first_line.strip() + " ", rest
+        headers.append(f"{tag}{src.get('title') or 'Source'} ({src.get('domain') or src.get('url') or ''})")
+
+        position = 0
+        for sentence in _split_sentences(text):
+            if _is_boilerplate(sentence):
+                dropped_boilerplate += 1
+                continue
+            sig = hasher.signature(sentence)
+            if any(MinHasher.jaccard(sig, lsh.signatures[i]) >= NEAR_DUPLICATE_JACCARD for i in lsh.query(sig)):
+                dropped_duplicates += 1
+                continue
+            lsh.add(sig)
+            score = _fact_score(sentence) + (1 if position < LEAD_SENTENCES else 0)
+            candidates.append((src_idx, position, sentence, score))
+            position += 1
+
+    # Fill the budget: strongest facts first, earlier sources (official first) break ties
+    budget_chars = token_budget * CHARS_PER_TOKEN - sum(len(h) + 2 for h in headers)
+    kept = []
+    for src_idx, position, sentence, score in sorted(candidates, key=lambda c: (-c[3], c[0], c[1])):
+        if len(sentence) + 1 > budget_chars: continue
+        budget_chars -= len(sentence) + 1
+        kept.append((src_idx, position, sentence))
+
+    kept.sort()
+    blocks = []
+    for src_idx, header in enumerate(headers):
+        body = " ".join(sentence for i, _, sentence in kept if i == src_idx)
+        if body: blocks.append(f"{header}\n{body}")
+    compressed = "\n\n".join(blocks)
+
+    saved = 100 - (len(compressed) * 100 // original_chars) if original_chars else 0
+    log(f"   🗜️ [Compressor] Research {original_chars:,} -> {len(compressed):,} chars (-{saved}%). "
+        f"Dropped {dropped_duplicates} near-duplicate + {dropped_boilerplate} boilerplate sentences, "
+        f"{len(candidates) - len(kept)} over budget.")
+    return compressed
@@ -0,0 +1,147 @@
+# FILE: scrape_cache.py
+# ROLE: Persistent Scrape Cache (resolve_and_scrape results, shared by research, viability checks and retries)
+# DESCRIPTION: One JSON file per normalized URL under .ai_cache/scrapes (kept between workflow runs).
+#              Entries younger than the TTL are served directly; older ones are revalidated with a conditional
+#              HEAD (ETag / Last-Modified) and re-scraped only when the page changed. LRU eviction by total size.
+# CONFIG: settings.scrape_cache {ttl_hours, max_age_days, max_mb}; SCRAPE_CACHE_DISABLED=1 turns it off.
+
+import os
+import json
+import time
+import hashlib
+import urllib.parse
+import requests
+from config import log
+
+# --- CONFIGURATION ---
+SCRAPE_CACHE_DIR = ".ai_cache/scrapes"
+SCRAPE_CACHE_TTL = 12 * 3600            # Served without any network round-trip
+SCRAPE_CACHE_MAX_AGE = 7 * 24 * 3600    # Re-scraped after this even if the server still says 304
+SCRAPE_CACHE_MAX_BYTES = 100 * 1024 * 1024
+REVALIDATE_TIMEOUT = 5
+
+# Query parameters that never change the page content
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid", "ref_src", "igshid", "_hsenc", "_hsmi")
+
+def normalize_url(url):
+    """Cache key: lower-case scheme/host; fragment, default port, tracking params and trailing slash dropped."""
+    try:
+        parts = urllib.parse.urlsplit(url.strip())
+        host = (parts.hostname or "").lower()
+        if parts.port and parts.port not in (80, 443): host = f"{host}:{parts.port}"
+        query = sorted((k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+                       if not k.lower().startswith(_TRACKING_PARAMS))
+        path = parts.path.rstrip("/") or "/"
+        return urllib.parse.urlunsplit((parts.scheme.lower(), host, path, urllib.parse.urlencode(query), ""))
+    except Exception:
+        return url
+
+class ScrapeCache:
+    """Same storage scheme as api_manager.ResponseCache (file mtime = LRU clock)."""
+    def __init__(self, cache_dir=SCRAPE_CACHE_DIR, ttl=SCRAPE_CACHE_TTL, max_age=SCRAPE_CACHE_MAX_AGE,
+                 max_bytes=SCRAPE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.enabled = os.getenv("SCRAPE_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+
+    def configure(self, settings):
+        cfg = (settings or {}).get("scrape_cache") or {}
+        self.ttl = cfg.get("ttl_hours", self.ttl / 3600) * 3600
+        self.max_age = cfg.get("max_age_days", self.max_age / 86400) * 86400
+        self.max_bytes = cfg.get("max_mb", self.max_bytes / (1024 * 1024)) * 1024 * 1024
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest() + ".json")
+
+    def _drop(self, path):
+        try: os.remove(path)
+        except OSError: pass
+
+    def _still_valid(self, entry):
+        """Conditional HEAD: 304, or unchanged validators on a 200, means the cached extraction still holds."""
+        etag, last_modified = entry.get("etag"), entry.get("last_modified")
+        if not (etag or last_modified): return False
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        if etag: headers['If-None-Match'] = etag
+        if last_modified: headers['If-Modified-Since'] = last_modified
+        try:
+            r = requests.head(entry.get("fetch_url") or entry["url"], headers=headers, timeout=REVALIDATE_TIMEOUT, allow_redirects=True)
+        except Exception:
+            return False
+        if r.status_code == 304: return True
+        if r.status_code != 200: return False
+        return bool((etag and r.headers.get('ETag') == etag) or
+                    (last_modified and r.headers.get('Last-Modified') == last_modified))
+
+    def get(self, url):
+        """Cached resolve_and_scrape tuple, or None (miss, expired, or changed upstream: the entry is dropped)."""
+        if not self.enabled or not url: return None
+        path = self._path(url)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            self._drop(path) # Corrupted entry
+            return None
+        now = time.time()
+        if now - entry.get("created", 0) > self.max_age:
+            self._drop(path)
+            return None
+        if now - entry.get("validated", 0) > self.ttl:
+            if not self._still_valid(entry):
+                self._drop(path)
+                return None
+            entry["validated"] = now
+            self._write(path, entry)
+            log(f"      ♻️ [Scrape Cache] Revalidated (not modified): {url[:60]}")
+        else:
+            os.utime(path, None) # Touch: mark as recently used
+        return tuple(entry["result"])
+
+    def set(self, url, result, etag=None, last_modified=None, fetch_url=None):
+        """Stores a successful resolve_and_scrape tuple (final_url, title, text, og_image, assets)."""
+        if not self.enabled or not url or not result or not result[2]: return
+        now = time.time()
+        entry = {"url": url, "fetch_url": fetch_url, "created": now, "validated": now,
+                 "etag": etag, "last_modified": last_modified, "result": list(result)}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._write(self._path(url), entry)
+            self._evict()
+        except Exception as e:
+            log(f"      ⚠️ Scrape cache write failed: {e}")
+
+    def _write(self, path, entry):
+        tmp_path = f"{path}.{os.getpid()}.{id(entry)}.tmp" # Unique per writer: scrape_many runs several threads
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _evict(self):
+        """Drops least-recently-used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"): continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        if total <= self.max_bytes: return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes: break
+            self._drop(path)
+            total -= size
+
+cache = ScrapeCache()
+
+def configure(settings):
+    cache.configure(settings)
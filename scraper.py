@@ -1,19 +1,28 @@
 # FILE: scraper.py
 # ROLE: Advanced Web Scraper & Visual Hunter (Scroll & Capture Edition).
-# FEATURES: AI-Guided Media Hunt, Selenium Fallback, Smart Anti-Detection, Lazy-Load Scrolling.
+# FEATURES: AI-Guided Media Hunt, Selenium Fallback, Smart Anti-Detection, Lazy-Load Scrolling,
+#           Pooled Chrome (browser_pool.py) instead of one browser launch per URL,
+#           HTTP-first scraping (plain GET + trafilatura) with the browser only as fallback,
+#           On-disk scrape cache with ETag / Last-Modified revalidation (scrape_cache.py),
+#           Google News links decoded over HTTP (url_resolver.py) before any fetch.
 
 import re
 import time
 import random
+import threading
+import contextvars
 import urllib.parse
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
 from selenium.webdriver.common.by import By
 import trafilatura
 from bs4 import BeautifulSoup
 from config import log, USER_AGENTS
+import cassette
+import browser_pool
+import scrape_cache
+import url_resolver
 
 # ==============================================================================
 # 1. CONFIGURATION & BLACKLISTS
@@ -36,6 +45,47 @@ MEDIA_LINK_BLACKLIST = [
     "footer", "header", "button"
 ]
 
+# HTTP-first tier: escalate to the browser below this much extracted text or on these page signals
+HTTP_MIN_TEXT_CHARS = 1200
+HTTP_TIMEOUT = 15
+HTTP_POOL_SIZE = 16
+JS_CHALLENGE_SIGNALS = [
+    "just a moment...", "checking your browser", "cf-browser-verification", "cf_chl_", "challenge-platform",
+    "enable javascript and cookies", "please enable javascript", "you need to enable javascript",
+    "ddos protection by", "are you a robot", "captcha-delivery", "px-captcha"
+]
+
+# Research-phase scrape executor (scrape_many)
+SCRAPE_CONCURRENCY = 4          # Sources scraped at once (browser work is further capped by the browser pool)
+PER_DOMAIN_CONCURRENCY = 1      # Politeness: one request at a time per domain
+SCRAPE_PHASE_DEADLINE = 150     # Seconds for the whole batch; network timeouts shrink to fit, late sources are dropped
+SCROLL_MIN_SECONDS = 6          # Lazy-load scrolling is skipped when less than this is left before the deadline
+
+# Shared keep-alive connections for the HTTP tier
+_http_session = requests.Session()
+_http_session.mount("https://", HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE))
+_http_session.mount("http://", HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE))
+
+# Per-run tier hit counters (logged in main.py's final report)
+_tier_stats = {"cache": 0, "http": 0, "browser": 0, "failed": 0, "escalations": {}}
+_tier_stats_lock = threading.Lock()   # resolve_and_scrape runs on several threads (scrape_many)
+
+# time.monotonic() cutoff of the current scrape_many batch (set per worker; None outside a batch)
+_scrape_deadline = contextvars.ContextVar("scrape_deadline", default=None)
+
+def _time_left(cap):
+    """Timeout for the next network step: `cap`, shortened to what is left before the batch deadline."""
+    deadline = _scrape_deadline.get()
+    if deadline is None: return cap
+    left = deadline - time.monotonic()
+    if left <= 0: raise TimeoutError("scrape deadline reached")
+    return min(cap, left)
+
+def _count_tier(tier, reason=None):
+    with _tier_stats_lock:
+        _tier_stats[tier] += 1
+        if reason: _tier_stats["escalations"][reason] = _tier_stats["escalations"].get(reason, 0) + 1
+
 # ==============================================================================
 # 2. HELPER FUNCTIONS
 # ==============================================================================
@@ -89,7 +139,7 @@ def scroll_page(driver):
         # نقسم الصفحة إلى 4 أجزاء وننزل تدريجياً
         for i in range(1, 5):
             driver.execute_script(f"window.scrollTo(0, document.body.scrollHeight * {i/4});")
-            time.sleep(1.5) # انتظار تحميل الصور
+            browser_pool.wait_for_settle(driver, max_wait=1.5) # انتظار تحميل الصور (حتى 1.5 ثانية فقط عند الحاجة)
             
         # العودة للأعلى قليلاً لضمان الثبات
         driver.execute_script("window.scrollTo(0, 0);")
@@ -173,6 +223,7 @@ def extract_assets_from_soup(soup, base_url):
 # 3. THE SMART HUNTER (AI + SELENIUM)
 # ==============================================================================
 
+@cassette.recordable("scraper.smart_media_hunt")
 def smart_media_hunt(target_keyword, category, directive, content_type="Review"):
     """
     Hybrid Hunt:
@@ -220,53 +271,40 @@ def smart_media_hunt(target_keyword, category, directive, content_type="Review")
     log("         🕵️‍♂️ Switching to Selenium Sniper (Google Images Direct) for deep visual search...")
     search_query = get_smart_query_by_category(target_keyword, category, directive, content_type)
     
-    chrome_options = Options()
-    chrome_options.page_load_strategy = 'eager'
-    chrome_options.add_argument("--headless=new")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument(f'user-agent={random.choice(USER_AGENTS)}')
-    
-    driver = None
     try:
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        driver.set_page_load_timeout(45)
-        
-        # Search Google Images Directly (tbm=isch)
-        driver.get(f"https://www.google.com/search?tbm=isch&q={urllib.parse.quote(search_query)}")
-        time.sleep(3)
-        
-        # نمرر لأسفل الصفحة لتحميل المزيد من الصور (Deep Search)
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(2) 
-        
-        # نجمع كل الروابط الصغيرة للصور المصغرة التي يمكن أن نستخدمها كمرشح
-        image_elements = driver.find_elements(By.CSS_SELECTOR, 'img.Q4LuWd')
-        
-        log(f"         📸 Sniper found {len(image_elements)} candidate thumbnails.")
-        
-        # نأخذ أول 10 عناصر ونحلل الروابط الأصلية المخفية بها
-        for i, img_el in enumerate(image_elements[:10]):
-            try:
-                # الروابط الأصلية تكون غالباً في عنصر الأب (a) أو مخفية في (data-src)
-                url = img_el.get_attribute('src') or img_el.get_attribute('data-src')
-
-                if url and url.startswith("http"):
-                    # نفلتر الروابط القصيرة جداً
-                    if len(url) < 50: continue 
-                    all_media.append({
-                        "type": "image", 
-                        "url": url, 
-                        "description": img_el.get_attribute('alt') or f"Google Image Search result {i+1}",
-                        "score": 5 # نعطيها درجة متوسطة
-                    })
-            except: continue
+        with browser_pool.page(timeout=45) as driver:
+            # Search Google Images Directly (tbm=isch)
+            driver.get(f"https://www.google.com/search?tbm=isch&q={urllib.parse.quote(search_query)}")
+            browser_pool.wait_for_settle(driver, max_wait=3)
+            
+            # نمرر لأسفل الصفحة لتحميل المزيد من الصور (Deep Search)
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            browser_pool.wait_for_settle(driver, max_wait=2)
+            
+            # نجمع كل الروابط الصغيرة للصور المصغرة التي يمكن أن نستخدمها كمرشح
+            image_elements = driver.find_elements(By.CSS_SELECTOR, 'img.Q4LuWd')
+            
+            log(f"         📸 Sniper found {len(image_elements)} candidate thumbnails.")
+            
+            # نأخذ أول 10 عناصر ونحلل الروابط الأصلية المخفية بها
+            for i, img_el in enumerate(image_elements[:10]):
+                try:
+                    # الروابط الأصلية تكون غالباً في عنصر الأب (a) أو مخفية في (data-src)
+                    url = img_el.get_attribute('src') or img_el.get_attribute('data-src')
+
+                    if url and url.startswith("http"):
+                        # نفلتر الروابط القصيرة جداً
+                        if len(url) < 50: continue 
+                        all_media.append({
+                            "type": "image", 
+                            "url": url, 
+                            "description": img_el.get_attribute('alt') or f"Google Image Search result {i+1}",
+                            "score": 5 # نعطيها درجة متوسطة
+                        })
+                except: continue
         
     except Exception as e:
         log(f"      ⚠️ Selenium Sniper Error: {e}")
-    finally:
-        if driver: driver.quit()
     
     # نُزيل الروابط المكررة قبل الإرسال
     unique_media = list({m['url']: m for m in all_media}.values())
@@ -276,76 +314,193 @@ def smart_media_hunt(target_keyword, category, directive, content_type="Review")
 # 4. RESOLVE AND SCRAPE (FULL PIPELINE)
 # ==============================================================================
 
-def resolve_and_scrape(target_url):
-    """
-    Full extraction pipeline: Scrolls, scrapes text, and gathers visual/code assets.
-    Returns: final_url, final_title, extracted_text, og_image, assets_list
-    """
-    log(f"      🕵️‍♂️ Deep Scraping: {target_url[:60]}...")
+def get_tier_stats():
+    """How resolve_and_scrape calls were served this run, plus why the HTTP tier escalated."""
+    stats = {k: v for k, v in _tier_stats.items() if k != "escalations"}
+    fetched = stats["http"] + stats["browser"] + stats["failed"]
+    stats["http_hit_rate"] = round(stats["http"] / fetched, 3) if fetched else 0.0
+    stats["cache_hit_rate"] = round(stats["cache"] / (fetched + stats["cache"]), 3) if stats["cache"] else 0.0
+    stats["escalations"] = dict(_tier_stats["escalations"])
+    return stats
+
+def _build_scrape_result(page_source, final_url, final_title=None):
+    """Shared by both tiers: text via trafilatura, hero image + assets via BS4 (title from <title> if not given)."""
+    # 4. Extract Text (using Trafilatura for quality)
+    extracted_text = trafilatura.extract(page_source, include_comments=False, favor_precision=True)
+    
+    # 5. Extract Assets (Images & Code) using BS4
+    soup = BeautifulSoup(page_source, 'html.parser')
+    if final_title is None:
+        final_title = soup.title.get_text(strip=True) if soup.title else ""
     
-    chrome_options = Options()
-    chrome_options.add_argument("--headless=new")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument(f'user-agent={random.choice(USER_AGENTS)}')
+    # Find OG Image (Hero Image Candidate)
+    og_image = (soup.find('meta', property='og:image') or {}).get('content')
     
-    driver = None
+    # Extract all other assets
+    assets = extract_assets_from_soup(soup, final_url)
+    
+    # Add OG Image to assets if unique and exists
+    if og_image:
+         # Check for relative URL in OG Image
+         if og_image.startswith('/'):
+             og_image = urllib.parse.urljoin(final_url, og_image)
+         
+         if not any(a['url'] == og_image for a in assets if a['type'] == 'image'):
+            assets.insert(0, {
+                "type": "image",
+                "url": og_image,
+                "description": "Main Featured Image / OpenGraph Image",
+                "source_url": final_url,
+                "is_hero": True,
+                "score": 15 # Highest score for Hero
+            })
+
+    return final_url, final_title, extracted_text, og_image, assets
+
+def _fetch_http(target_url):
+    """Plain GET on the shared session. Returns (final_url, html, validators) or (target_url, None, {})."""
     try:
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        driver.set_page_load_timeout(60)
-        
+        r = _http_session.get(target_url, headers={
+            'User-Agent': random.choice(USER_AGENTS),
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.9'
+        }, timeout=_time_left(HTTP_TIMEOUT), allow_redirects=True)
+        if r.status_code != 200 or 'html' not in r.headers.get('Content-Type', 'text/html').lower():
+            return r.url or target_url, None, {}
+        validators = {"etag": r.headers.get('ETag'), "last_modified": r.headers.get('Last-Modified')}
+        return r.url, r.text, validators
+    except Exception:
+        return target_url, None, {}
+
+def _scrape_http(target_url):
+    """Tier 1: GET + trafilatura. Returns (result, None, validators) or (None, escalation_reason, {})."""
+    final_url, page_source, validators = _fetch_http(target_url)
+    if page_source is None:
+        return None, "http_error", {}
+    head = page_source[:20000].lower()
+    if any(sig in head for sig in JS_CHALLENGE_SIGNALS):
+        return None, "js_challenge", {}
+    result = _build_scrape_result(page_source, final_url)
+    if len(result[2] or "") < HTTP_MIN_TEXT_CHARS:
+        return None, "thin_text", {}
+    return result, None, validators
+
+def _scrape_browser(target_url):
+    """Tier 2: pooled headless Chrome (redirects, JS rendering, lazy-loaded images)."""
+    with browser_pool.page(timeout=_time_left(60), acquire_timeout=_time_left(browser_pool.ACQUIRE_TIMEOUT)) as driver:
         driver.get(target_url)
         
         # 1. Handle Redirects (Wait for final URL) & Google Consent
         start_wait = time.time()
         final_url = target_url
-        while time.time() - start_wait < 15: 
+        redirect_wait = _time_left(15)
+        while time.time() - start_wait < redirect_wait: 
             current = driver.current_url
             if "news.google.com" not in current and "google.com" not in current:
                 final_url = current
                 break
-            time.sleep(1)
+            time.sleep(0.25)
         
-        # 2. Scroll to load images (Lazy Loading)
-        scroll_page(driver)
+        # 2. Scroll to load images (Lazy Loading), unless the batch deadline is too close
+        if _time_left(SCROLL_MIN_SECONDS) >= SCROLL_MIN_SECONDS:
+            scroll_page(driver)
         
         # 3. Get Content
         page_source = driver.page_source
         final_title = driver.title
-        
-        # 4. Extract Text (using Trafilatura for quality)
-        extracted_text = trafilatura.extract(page_source, include_comments=False, favor_precision=True)
-        
-        # 5. Extract Assets (Images & Code) using BS4
-        soup = BeautifulSoup(page_source, 'html.parser')
-        
-        # Find OG Image (Hero Image Candidate)
-        og_image = (soup.find('meta', property='og:image') or {}).get('content')
-        
-        # Extract all other assets
-        assets = extract_assets_from_soup(soup, final_url)
-        
-        # Add OG Image to assets if unique and exists
-        if og_image:
-             # Check for relative URL in OG Image
-             if og_image.startswith('/'):
-                 og_image = urllib.parse.urljoin(final_url, og_image)
-             
-             if not any(a['url'] == og_image for a in assets if a['type'] == 'image'):
-                assets.insert(0, {
-                    "type": "image",
-                    "url": og_image,
-                    "description": "Main Featured Image / OpenGraph Image",
-                    "source_url": final_url,
-                    "is_hero": True,
-                    "score": 15 # Highest score for Hero
-                })
+    return _build_scrape_result(page_source, final_url, final_title)
 
-        return final_url, final_title, extracted_text, og_image, assets
+@cassette.recordable("scraper.resolve_and_scrape")
+def resolve_and_scrape(target_url):
+    """
+    Full extraction pipeline: scrape cache first, then HTTP GET; the browser (scroll + render) only
+    for undecodable Google News links, JS challenges or pages whose extracted text is too thin.
+    Returns: final_url, final_title, extracted_text, og_image, assets_list
+    """
+    cached = scrape_cache.cache.get(target_url)
+    if cached:
+        _count_tier("cache")
+        log(f"      💾 [Scrape Cache] Hit ({len(cached[2]):,} chars): {target_url[:60]}")
+        return cached
+
+    log(f"      🕵️‍♂️ Deep Scraping: {target_url[:60]}...")
+    
+    try:
+        fetch_url = target_url
+        if "news.google.com" in target_url:
+            fetch_url = url_resolver.resolve_google_news_url(target_url)
+        if "news.google.com" in fetch_url:
+            reason = "google_news"
+        else:
+            result, reason, validators = _scrape_http(fetch_url)
+            if result:
+                _count_tier("http")
+                log(f"      ⚡ [Tier 1 HTTP] Extracted {len(result[2]):,} chars without a browser.")
+                scrape_cache.cache.set(target_url, result, fetch_url=result[0], **validators)
+                return result
+        log(f"      🌐 [Tier 2 Browser] Escalating ({reason})...")
+        result = _scrape_browser(fetch_url)
+        _count_tier("browser", reason)
+        scrape_cache.cache.set(target_url, result) # No validators: served for the TTL, then re-scraped
+        return result
 
     except Exception as e:
+        _count_tier("failed")
         log(f"      ❌ Scraper Error on {target_url}: {e}")
         return None, None, None, None, []
-    finally:
-        if driver: driver.quit()
+
+# ==============================================================================
+# 5. CONCURRENT SCRAPE EXECUTOR (RESEARCH PHASE)
+# ==============================================================================
+
+def _domain(url):
+    return urllib.parse.urlparse(url).netloc.lower()
+
+def scrape_many(urls, max_workers=SCRAPE_CONCURRENCY, deadline=SCRAPE_PHASE_DEADLINE):
+    """
+    resolve_and_scrape over a list of URLs with bounded concurrency, at most PER_DOMAIN_CONCURRENCY
+    requests per domain at a time, and one deadline for the whole batch.
+    The deadline reaches into every fetch (HTTP timeout, browser slot wait, page load), so workers
+    still running when it passes give up within seconds instead of holding browser slots.
+    Returns {url: result tuple}; URLs that failed hard or missed the deadline are absent.
+    """
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls: return {}
+    deadline_at = time.monotonic() + deadline
+
+    # Round-robin across domains so the first workers do not all queue on the same host
+    by_domain = {}
+    for url in urls:
+        by_domain.setdefault(_domain(url), []).append(url)
+    ordered = []
+    while any(by_domain.values()):
+        for domain_urls in by_domain.values():
+            if domain_urls: ordered.append(domain_urls.pop(0))
+    domain_slots = {d: threading.BoundedSemaphore(PER_DOMAIN_CONCURRENCY) for d in by_domain}
+
+    # Google News links: one batch decode up front, so the workers only hit the resolver's cache
+    gnews_urls = [u for u in urls if url_resolver.is_google_news_url(u)]
+    if gnews_urls: url_resolver.resolve_google_news_urls(gnews_urls)
+
+    def task(url):
+        _scrape_deadline.set(deadline_at) # Worker threads do not inherit the caller's context
+        with domain_slots[_domain(url)]:
+            if time.monotonic() >= deadline_at: return None
+            return resolve_and_scrape(url)
+
+    log(f"      🚦 [Scrape Executor] {len(urls)} sources, {min(max_workers, len(urls))} at a time, {deadline}s deadline...")
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(urls)), thread_name_prefix="scrape")
+    futures = {executor.submit(task, url): url for url in ordered}
+    done, pending = wait(futures, timeout=max(0.0, deadline_at - time.monotonic()))
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = {}
+    for future in done:
+        try:
+            result = future.result()
+            if result is not None: results[futures[future]] = result
+        except Exception as e:
+            log(f"         ⚠️ Scrape failed for {futures[future]}: {e}")
+    if pending:
+        log(f"      ⏱️ [Scrape Executor] Deadline reached: {len(pending)} source(s) dropped.")
+    return results
@@ -3,6 +3,7 @@ import requests
 import datetime
 import time
 from github import Github  # تأكد أن PyGithub موجودة في requirements.txt
+import cassette
 
 # ==============================================================================
 # TOKEN AUTO-RENEWAL SYSTEM (كودك مع تحسينات بسيطة)
@@ -147,6 +148,7 @@ def post_to_facebook(content, image_url, link):
         print(f"   ❌ FB Connection Error: {e}")
 
 # The function signature now accepts 'article_url'
+@cassette.recordable("social_manager.post_reel_to_facebook")
 def post_reel_to_facebook(video_path, caption, article_url):
     current_token = os.getenv('FB_PAGE_ACCESS_TOKEN')
     try:
@@ -193,6 +195,7 @@ def post_reel_to_facebook(video_path, caption, article_url):
 # MAIN ORCHESTRATOR
 # ==============================================================================
 
+@cassette.recordable("social_manager.distribute_content")
 def distribute_content(facebook_text, article_url, image_url):
     print(f"\n📢 Distributing to Social Media (Facebook)...")
     if facebook_text and article_url and image_url:
@@ -0,0 +1,112 @@
+# FILE: text_index.py
+# ROLE: Full-Text Index over the published archive (BM25 half of history_manager.search)
+# DESCRIPTION: Inverted index over titles + cached article text, scored with Okapi BM25.
+#              Documents are added / replaced incrementally on publish; ids are insertion positions
+#              (replaced documents are retired in place, like title_matcher.TitleIndex).
+#              reciprocal_rank_fusion() merges its ranking with the embedding ranking.
+
+import re
+import math
+import numpy as np
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+TITLE_WEIGHT = 3        # Title terms count as if they appeared 3 times in the body
+RRF_K = 60              # Standard RRF damping constant
+MAX_QUERY_TERMS = 64    # Long queries (title + article text) keep their most frequent terms
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9.+#-]*[a-z0-9+#]|[a-z0-9]", re.I)
+_STOPWORDS = frozenset("""
+a an and are as at be been but by can do does for from has have how i if in into is it its of on or our
+so than that the their them then there these they this to too us was we were what when which who why will
+with you your vs not no new more most all any about after before over under up out just also only
+""".split())
+
+def tokenize(text):
+    return [t for t in (m.lower() for m in _TOKEN_RE.findall(text or "")) if t not in _STOPWORDS and len(t) > 1]
+
+class BM25Index:
+    def __init__(self):
+        self.keys = []          # id -> key (None = retired)
+        self._positions = {}    # key -> live id
+        self._postings = {}     # term -> ([ids], [term frequencies])
+        self._arrays = {}       # term -> cached (ids array, tf array)
+        self._lengths = []      # id -> document length (0 once retired)
+        self._live = 0
+        self._total_length = 0
+
+    def __len__(self):
+        return self._live
+
+    def add(self, key, title, text=""):
+        """Indexes a document; re-adding an existing key replaces it."""
+        if key in self._positions:
+            self._retire(self._positions.pop(key))
+        terms = tokenize(title) * TITLE_WEIGHT + tokenize(text)
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        doc_id = len(self.keys)
+        self.keys.append(key)
+        self._positions[key] = doc_id
+        self._lengths.append(len(terms))
+        for term, tf in counts.items():
+            ids, tfs = self._postings.setdefault(term, ([], []))
+            ids.append(doc_id)
+            tfs.append(tf)
+            self._arrays.pop(term, None)
+        self._live += 1
+        self._total_length += len(terms)
+        return doc_id
+
+    def _retire(self, doc_id):
+        self._total_length -= self._lengths[doc_id]
+        self._lengths[doc_id] = 0
+        self.keys[doc_id] = None
+        self._live -= 1
+
+    def _posting_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            ids, tfs = self._postings.get(term, ((), ()))
+            arrays = (np.fromiter(ids, dtype=np.int64), np.fromiter(tfs, dtype=np.float32))
+            self._arrays[term] = arrays
+        return arrays
+
+    def search(self, query, k=10):
+        """Returns [(score, key), ...] for the k best BM25 matches, best first (only documents sharing a term)."""
+        if not self._live or k <= 0: return []
+        counts = {}
+        for term in tokenize(query):
+            counts[term] = counts.get(term, 0) + 1
+        terms = sorted(counts, key=counts.get, reverse=True)[:MAX_QUERY_TERMS]
+        lengths = np.asarray(self._lengths, dtype=np.float32)
+        avg_length = self._total_length / self._live or 1.0
+        scores = np.zeros(len(self.keys), dtype=np.float32)
+        for term in terms:
+            ids, tfs = self._posting_arrays(term)
+            if not len(ids): continue
+            live = lengths[ids] > 0
+            ids, tfs = ids[live], tfs[live]
+            df = len(ids)
+            if not df: continue
+            idf = math.log(1 + (self._live - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[ids] / avg_length)
+            scores[ids] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+        hits = np.nonzero(scores)[0]
+        if not len(hits): return []
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(float(scores[i]), self.keys[i]) for i in hits]
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    rankings: lists of keys, best first. Returns [(fused score, key), ...], best first.
+    A key's score is sum(1 / (k + rank)) over the rankings that contain it.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(((score, key) for key, score in fused.items()), key=lambda x: -x[0])
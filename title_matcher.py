@@ -0,0 +1,85 @@
+# FILE: title_matcher.py
+# ROLE: Indexed Fuzzy Title Matcher (Phase 1 of the duplicate guard)
+# DESCRIPTION: Character-trigram inverted index over published titles. A query only runs the exact
+#              difflib ratio / substring rules against titles that share enough trigrams with it,
+#              instead of against the whole archive.
+
+import difflib
+import numpy as np
+
+NGRAM_SIZE = 3
+MIN_SHARED_NGRAM_FRACTION = 0.3   # Candidate if it shares >= 30% of the query's trigrams
+MIN_SUBSTRING_LEN = 8             # Same rule as the legacy scan: only targets longer than this
+
+def char_ngrams(text, n=NGRAM_SIZE):
+    padded = f" {text} "
+    if len(padded) < n: return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+class TitleIndex:
+    """Append-only trigram index; ids are insertion positions, retitled entries are replaced in place."""
+    def __init__(self):
+        self.titles = []        # id -> lowercased title (None = removed)
+        self._postings = {}     # trigram -> list of ids
+        self._arrays = {}       # trigram -> cached np.array of its postings
+        self._lengths = []
+
+    def __len__(self):
+        return sum(1 for t in self.titles if t is not None)
+
+    def add(self, title):
+        title = str(title or "").lower()
+        tid = len(self.titles)
+        self.titles.append(title)
+        self._lengths.append(len(title))
+        for gram in char_ngrams(title):
+            self._postings.setdefault(gram, []).append(tid)
+            self._arrays.pop(gram, None)
+        return tid
+
+    def replace(self, tid, title):
+        """Retires an id and indexes the new title; returns the new id."""
+        self.titles[tid] = None
+        return self.add(title)
+
+    def _posting_array(self, gram):
+        arr = self._arrays.get(gram)
+        if arr is None:
+            arr = np.fromiter(self._postings.get(gram, ()), dtype=np.int64)
+            self._arrays[gram] = arr
+        return arr
+
+    def candidates(self, target, threshold):
+        """
+        Ids worth an exact comparison, in insertion order:
+        - length filter: ratio can only exceed `threshold` if 2*min(len)/(sum len) does;
+        - trigram filter: enough shared trigrams for a ratio match, or all of them for a substring match.
+        """
+        if not self.titles: return []
+        grams = char_ngrams(target)
+        arrays = [self._posting_array(g) for g in grams]
+        arrays = [a for a in arrays if len(a)]
+        if not arrays: return []
+        shared = np.bincount(np.concatenate(arrays), minlength=len(self.titles))
+        lengths = np.asarray(self._lengths)
+        length_ok = 2 * np.minimum(lengths, len(target)) > threshold * (lengths + len(target))
+        ratio_plausible = length_ok & (shared >= max(1, int(MIN_SHARED_NGRAM_FRACTION * len(grams))))
+        # " target " padding trigrams are not inside a longer title, so require all inner trigrams
+        substring_plausible = (shared >= len(grams) - 2) if len(target) > MIN_SUBSTRING_LEN else np.zeros_like(length_ok)
+        ids = np.nonzero(ratio_plausible | substring_plausible)[0]
+        return [int(i) for i in ids if self.titles[i] is not None]
+
+    def first_match(self, target, threshold):
+        """
+        Same rules and order as the legacy full scan. Returns (id, reason, ratio) or None.
+        reason: 'ratio' (SequenceMatcher ratio > threshold) or 'subset' (target contained in the title).
+        """
+        target = str(target).strip().lower()
+        for tid in self.candidates(target, threshold):
+            existing = self.titles[tid]
+            ratio = difflib.SequenceMatcher(None, target, existing).ratio()
+            if ratio > threshold:
+                return tid, 'ratio', ratio
+            if len(target) > MIN_SUBSTRING_LEN and target in existing:
+                return tid, 'subset', ratio
+        return None
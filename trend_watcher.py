@@ -9,7 +9,9 @@ import traceback
 from pytrends.request import TrendReq
 from config import log
 from api_manager import generate_step_strict
+import cassette
 
+@cassette.recordable("trend_watcher.get_trending_topics_pytrends")
 def get_trending_topics_pytrends(category_keywords):
     """
     Method A: PyTrends API (Hard Data).
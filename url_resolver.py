@@ -1,63 +1,233 @@
+# FILE: url_resolver.py
+# ROLE: URL Resolution (Google News article links -> publisher URLs, page HTML via the browser pool)
+# DESCRIPTION: Google News article ids are decoded without a browser: legacy ids carry the URL in their
+#              base64 payload; newer ("AU_yqL...") ids are resolved over plain HTTP through Google's
+#              batchexecute endpoint, several per POST. Resolved ids are cached in .ai_cache/gnews_urls.json.
+
+import os
+import json
 import time
+import base64
 import logging
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from bs4 import BeautifulSoup
+import browser_pool
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 
+CONTENT_SETTLE_SECONDS = 10   # Upper bound; returns as soon as the page and its images are loaded
+
+# Google News decoder
+GNEWS_CACHE_FILE = ".ai_cache/gnews_urls.json"
+GNEWS_CACHE_MAX_ENTRIES = 5000   # Oldest mappings dropped beyond this
+GNEWS_BATCH_SIZE = 10            # Article ids per batchexecute POST
+GNEWS_FETCH_CONCURRENCY = 8      # Article pages fetched at once (signature + timestamp)
+GNEWS_TIMEOUT = 10
+GNEWS_BATCHEXECUTE_URL = "https://news.google.com/_/DotsSplashUi/data/batchexecute"
+
+_gnews_session = requests.Session()
+_gnews_session.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36'
+})
+_gnews_cache = None
+_gnews_lock = threading.Lock()   # Guards _gnews_cache (scraper.scrape_many resolves from several threads)
+
+# ==============================================================================
+# GOOGLE NEWS DECODER (NO BROWSER)
+# ==============================================================================
+
+def is_google_news_url(url):
+    return "news.google.com" in (url or "") and _article_id(url) is not None
+
+def _article_id(url):
+    """'.../rss/articles/<id>?oc=5' or '.../articles/<id>' or '.../read/<id>' -> '<id>'."""
+    try:
+        segments = [s for s in urllib.parse.urlparse(url).path.split('/') if s]
+        for i, seg in enumerate(segments[:-1]):
+            if seg in ("articles", "read"):
+                return segments[i + 1]
+    except Exception:
+        pass
+    return None
+
+def _decode_offline(article_id):
+    """Legacy ids are a base64 protobuf whose field 4 is the URL. Returns None for the newer opaque ids."""
+    try:
+        raw = base64.urlsafe_b64decode(article_id + "=" * (-len(article_id) % 4))
+    except Exception:
+        return None
+    prefix = b'\x08\x13\x22'
+    if raw.startswith(prefix): raw = raw[len(prefix):]
+    # Varint length of the URL field
+    length, shift, pos = 0, 0, 0
+    while pos < len(raw):
+        byte = raw[pos]
+        length |= (byte & 0x7F) << shift
+        pos += 1
+        if not byte & 0x80: break
+        shift += 7
+    payload = raw[pos:pos + length]
+    if payload.startswith(b'AU_yqL'): return None
+    try:
+        url = payload.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    return url if url.startswith(("http://", "https://")) else None
+
+def _fetch_decoding_params(article_id):
+    """Signature + timestamp embedded in the article page, required by batchexecute."""
+    for url in (f"https://news.google.com/rss/articles/{article_id}", f"https://news.google.com/articles/{article_id}"):
+        try:
+            r = _gnews_session.get(url, timeout=GNEWS_TIMEOUT)
+            if r.status_code != 200: continue
+            div = BeautifulSoup(r.text, 'html.parser').select_one('c-wiz > div[jscontroller]')
+            if div and div.get('data-n-a-sg') and div.get('data-n-a-ts'):
+                return div['data-n-a-sg'], div['data-n-a-ts']
+        except Exception:
+            continue
+    return None
+
+def _batch_decode(params):
+    """params: {article_id: (signature, timestamp)}. One POST for all of them; returns {article_id: url}."""
+    ids = list(params)
+    envelopes = []
+    for n, article_id in enumerate(ids, 1):
+        signature, timestamp = params[article_id]
+        payload = ('["garturlreq",[["X","X",["X","X"],null,null,1,1,"US:en",null,1,null,null,null,null,null,0,1],'
+                   f'"X","X",1,[1,1,1],1,1,null,0,0,null,0],"{article_id}",{timestamp},"{signature}"]')
+        envelopes.append(["Fbv4je", payload, None, str(n)])
+    r = _gnews_session.post(GNEWS_BATCHEXECUTE_URL, timeout=GNEWS_TIMEOUT,
+                            headers={'Content-Type': 'application/x-www-form-urlencoded;charset=UTF-8'},
+                            data={'f.req': json.dumps([envelopes])})
+    r.raise_for_status()
+    decoded = {}
+    # Body: ")]}'" guard line, then the JSON array of responses
+    for chunk in r.text.split("\n\n")[1:]:
+        try:
+            rows = json.loads(chunk)
+        except ValueError:
+            continue
+        for row in rows:
+            if not (isinstance(row, list) and len(row) > 2 and row[0] == "wrb.fr" and row[2]): continue
+            try:
+                url = json.loads(row[2])[1]
+                n = int(row[6]) if len(row) > 6 and str(row[6]).isdigit() else None
+            except Exception:
+                continue
+            if n and 1 <= n <= len(ids) and isinstance(url, str) and url.startswith("http"):
+                decoded[ids[n - 1]] = url
+    return decoded
+
+def _load_gnews_cache():
+    global _gnews_cache
+    if _gnews_cache is None:
+        try:
+            with open(GNEWS_CACHE_FILE, 'r', encoding='utf-8') as f:
+                _gnews_cache = json.load(f)
+        except Exception:
+            _gnews_cache = {}
+    return _gnews_cache
+
+def _save_gnews_cache():
+    try:
+        while len(_gnews_cache) > GNEWS_CACHE_MAX_ENTRIES:
+            _gnews_cache.pop(next(iter(_gnews_cache)))  # Insertion order: oldest first
+        os.makedirs(os.path.dirname(GNEWS_CACHE_FILE), exist_ok=True)
+        tmp_path = f"{GNEWS_CACHE_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_gnews_cache, f)
+        os.replace(tmp_path, GNEWS_CACHE_FILE)
+    except Exception as e:
+        print(f"      ⚠️ Google News cache write failed: {e}")
+
+def resolve_google_news_urls(urls):
+    """
+    Batch-resolves Google News article links to publisher URLs without a browser.
+    Returns {google_url: publisher_url} for the links it could resolve (others are simply absent).
+    The lock only guards the cache: network work runs outside it, article pages concurrently.
+    """
+    resolved = {}
+    pending = {}
+    with _gnews_lock:
+        cache = _load_gnews_cache()
+        for url in dict.fromkeys(u for u in urls if is_google_news_url(u)):
+            article_id = _article_id(url)
+            target = cache.get(article_id) or _decode_offline(article_id)
+            if target:
+                resolved[url] = target
+            else:
+                pending.setdefault(article_id, []).append(url)
+    if not pending: return resolved
+
+    with ThreadPoolExecutor(max_workers=min(GNEWS_FETCH_CONCURRENCY, len(pending))) as executor:
+        params = {i: p for i, p in zip(pending, executor.map(_fetch_decoding_params, pending)) if p}
+    decoded = {}
+    ids = list(params)
+    for start in range(0, len(ids), GNEWS_BATCH_SIZE):
+        batch = {i: params[i] for i in ids[start:start + GNEWS_BATCH_SIZE]}
+        try:
+            decoded.update(_batch_decode(batch))
+        except Exception as e:
+            print(f"      ⚠️ Google News batch decode failed: {e}")
+    for article_id, target in decoded.items():
+        for url in pending[article_id]: resolved[url] = target
+    print(f"      🔓 Google News: {len(decoded)}/{len(pending)} new link(s) decoded over HTTP.")
+
+    if decoded:
+        with _gnews_lock:
+            cache.update(decoded)
+            _save_gnews_cache()
+    return resolved
+
+def resolve_google_news_url(url):
+    """Publisher URL for one Google News link, or the link itself if it cannot be decoded."""
+    return resolve_google_news_urls([url]).get(url, url)
+
+# ==============================================================================
+# PAGE HTML VIA BROWSER
+# ==============================================================================
+
 def get_page_html(target_url):
     """
     يفتح الصفحة، ينتظر التحويل، ويعيد الرابط النهائي + كود HTML الكامل
     """
-    if "news.google.com" not in target_url:
-        # لو الرابط مباشر، سنحتاج لفتحه أيضاً لجلبه عبر Selenium لتجنب الحظر
-        pass 
+    if "news.google.com" in target_url:
+        # فك رابط جوجل بدون متصفح أولاً، فلا حاجة لانتظار التحويل
+        target_url = resolve_google_news_url(target_url)
 
     print(f"      🕵️‍♂️ Selenium: Opening & Resolving: {target_url[:50]}...")
 
-    chrome_options = Options()
-    chrome_options.add_argument("--headless=new")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=1920,1080")
-    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-    chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-
-    driver = None
     try:
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        driver.set_page_load_timeout(120) # زيادة المهلة للمواقع الثقيلة
-        
-        driver.get(target_url)
-        
-        # منطق الانتظار الذكي (لو كان رابط جوجل)
-        is_google = "news.google.com" in target_url
-        start_time = time.time()
-        
-        while time.time() - start_time < 45:
-            current = driver.current_url
+        with browser_pool.page(timeout=120) as driver: # زيادة المهلة للمواقع الثقيلة
+            driver.get(target_url)
             
-            # إذا كان الرابط جوجل، ننتظر حتى يتغير
-            if is_google:
-                if "news.google.com" not in current and "search?" not in current:
-                     if "consent.google" not in current:
-                        # وصلنا! ننتظر قليلاً ليتحمل المحتوى (JS)
-                        time.sleep(30) 
-                        html = driver.page_source
-                        print(f"      ✅ Success: {current}")
-                        return {"url": current, "html": html}
-            else:
-                # إذا لم يكن رابط جوجل (مباشر)، ننتظر قليلاً ثم نسحب
-                time.sleep(60)
-                html = driver.page_source
-                print(f"      ✅ Direct Access: {current}")
-                return {"url": current, "html": html}
+            # منطق الانتظار الذكي (لو كان رابط جوجل)
+            is_google = "news.google.com" in target_url
+            start_time = time.time()
+            
+            while time.time() - start_time < 45:
+                current = driver.current_url
+                
+                # إذا كان الرابط جوجل، ننتظر حتى يتغير
+                if is_google:
+                    if "news.google.com" not in current and "search?" not in current:
+                         if "consent.google" not in current:
+                            # وصلنا! ننتظر اكتمال تحميل المحتوى (JS) بدلاً من انتظار ثابت
+                            browser_pool.wait_for_settle(driver, max_wait=CONTENT_SETTLE_SECONDS)
+                            html = driver.page_source
+                            print(f"      ✅ Success: {current}")
+                            return {"url": current, "html": html}
+                else:
+                    # إذا لم يكن رابط جوجل (مباشر)، ننتظر اكتمال التحميل ثم نسحب
+                    browser_pool.wait_for_settle(driver, max_wait=CONTENT_SETTLE_SECONDS)
+                    html = driver.page_source
+                    print(f"      ✅ Direct Access: {current}")
+                    return {"url": current, "html": html}
 
-            time.sleep(4)
+                time.sleep(0.5)
             
         print("      ⚠️ Timeout: Could not resolve URL.")
         return None
@@ -65,7 +235,3 @@ def get_page_html(target_url):
     except Exception as e:
         print(f"      ❌ Selenium Error: {e}")
         return None
-    finally:
-        if driver:
-            try: driver.quit()
-            except: pass
@@ -0,0 +1,180 @@
+# FILE: vector_index.py
+# ROLE: In-Memory Top-K Vector Index (semantic linking & duplicate checks)
+# DESCRIPTION: Holds unit-normalized vectors in one contiguous float32 buffer keyed by an id (the article URL).
+#              Cosine similarity becomes a single mat-vec product; top-k uses argpartition instead of a full sort.
+#              Adds/updates are O(1) amortized (capacity doubling), so history_manager keeps it in sync on publish.
+#              BinaryVectorIndex (used by history_manager) scans 1-bit codes and re-ranks the top candidates exactly;
+#              VectorIndex is the exact float32 variant (and the benchmark's reference).
+
+import numpy as np
+
+INITIAL_CAPACITY = 256
+
+def normalize_rows(vectors):
+    """L2-normalizes each row (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1: vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class VectorIndex:
+    def __init__(self, dim):
+        self.dim = dim
+        self._buffer = np.zeros((INITIAL_CAPACITY, dim), dtype=np.float32)
+        self._size = 0
+        self.keys = []
+        self._positions = {}   # key -> row in the buffer
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def matrix(self):
+        return self._buffer[:self._size]
+
+    def _grow(self, needed):
+        capacity = len(self._buffer)
+        if needed <= capacity: return
+        while capacity < needed: capacity *= 2
+        grown = np.zeros((capacity, self.dim), dtype=np.float32)
+        grown[:self._size] = self._buffer[:self._size]
+        self._buffer = grown
+
+    def add_many(self, keys, vectors):
+        vectors = normalize_rows(vectors)
+        for key, vector in zip(keys, vectors):
+            self.upsert(key, vector, normalized=True)
+
+    def upsert(self, key, vector, normalized=False):
+        """Adds a vector, or replaces the vector already stored under `key` (e.g. a retitled article)."""
+        vector = vector if normalized else normalize_rows(vector)[0]
+        pos = self._positions.get(key)
+        if pos is None:
+            self._grow(self._size + 1)
+            pos = self._size
+            self._size += 1
+            self.keys.append(key)
+            self._positions[key] = pos
+        self._buffer[pos] = vector
+
+    def search(self, vector, k=5, exclude=()):
+        """
+        Returns [(score, key), ...] for the k most similar vectors, best first.
+        `exclude` keys are skipped (the current article itself, for instance).
+        """
+        if self._size == 0 or k <= 0: return []
+        query = normalize_rows(vector)[0]
+        scores = self.matrix @ query
+        for key in exclude:
+            pos = self._positions.get(key)
+            if pos is not None: scores[pos] = -np.inf
+        k = min(k, self._size)
+        if k < self._size:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(self._size)
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.keys[i]) for i in top if np.isfinite(scores[i])]
+
+# ==============================================================================
+# BINARY-QUANTIZED INDEX (first pass on 1-bit codes, exact re-rank on the float store)
+# ==============================================================================
+RERANK_MIN_CANDIDATES = 256   # Below this many vectors the search is exact
+RERANK_FRACTION = 0.02        # Share of the index re-scored exactly (top-5 recall >= 0.95, see benchmark_suite.py)
+
+_M1, _M2, _M4, _H01 = (np.uint64(0x5555555555555555), np.uint64(0x3333333333333333),
+                       np.uint64(0x0F0F0F0F0F0F0F0F), np.uint64(0x0101010101010101))
+
+def _popcount64(x):
+    """Bits set per uint64 (SWAR; numpy < 2.0 has no bitwise_count)."""
+    x = x - ((x >> np.uint64(1)) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return (x * _H01) >> np.uint64(56)
+
+class BinaryVectorIndex:
+    """
+    Keeps 1 bit per dimension (sign of the mean-centred vector): 48 bytes instead of 1.5 KB for a 384-dim
+    float32 vector, scanned with XOR + popcount. The best candidates by Hamming distance are re-scored
+    exactly against the float rows, which stay in the memory-mapped store instead of RAM.
+    """
+    def __init__(self, dim, rows):
+        self.dim = dim
+        self._rows = rows      # callable -> current float matrix (re-opened by history_manager after appends)
+        self._words = (dim + 63) // 64
+        self._codes = np.zeros((INITIAL_CAPACITY, self._words), dtype=np.uint64)
+        self._row_ids = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._center = np.zeros(dim, dtype=np.float32)
+        self._size = 0
+        self.keys = []
+        self._positions = {}   # key -> slot
+
+    def __len__(self):
+        return self._size
+
+    def _encode(self, vectors):
+        bits = np.packbits(normalize_rows(vectors) - self._center > 0, axis=1)
+        padded = np.zeros((len(bits), self._words * 8), dtype=np.uint8)
+        padded[:, :bits.shape[1]] = bits
+        return padded.view(np.uint64)
+
+    def _grow(self, needed):
+        capacity = len(self._codes)
+        if needed <= capacity: return
+        while capacity < needed: capacity *= 2
+        codes = np.zeros((capacity, self._words), dtype=np.uint64)
+        codes[:self._size] = self._codes[:self._size]
+        row_ids = np.zeros(capacity, dtype=np.int64)
+        row_ids[:self._size] = self._row_ids[:self._size]
+        self._codes, self._row_ids = codes, row_ids
+
+    def add_many(self, keys, row_ids):
+        """Indexes store rows by id (rows must be unit-length, as history_manager writes them). The first batch fixes the centring vector."""
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        if not len(row_ids): return
+        vectors = normalize_rows(np.asarray(self._rows()[row_ids]))
+        if self._size == 0:
+            self._center = vectors.mean(axis=0)
+        codes = self._encode(vectors)
+        for key, row_id, code in zip(keys, row_ids, codes):
+            self._set(key, row_id, code)
+
+    def upsert(self, key, row_id):
+        """Adds or re-points `key` at a store row (the row must already be written)."""
+        self._set(key, row_id, self._encode(np.asarray(self._rows()[row_id]))[0])
+
+    def _set(self, key, row_id, code):
+        pos = self._positions.get(key)
+        if pos is None:
+            self._grow(self._size + 1)
+            pos = self._size
+            self._size += 1
+            self.keys.append(key)
+            self._positions[key] = pos
+        self._codes[pos] = code
+        self._row_ids[pos] = row_id
+
+    def search(self, vector, k=5, exclude=()):
+        """Same contract as VectorIndex.search; scores are exact cosine similarities."""
+        if self._size == 0 or k <= 0: return []
+        query = normalize_rows(vector)[0]
+        candidates = max(RERANK_MIN_CANDIDATES, int(RERANK_FRACTION * self._size), k)
+        if candidates < self._size:
+            distances = _popcount64(self._codes[:self._size] ^ self._encode(query)[0]).sum(axis=1)
+            for key in exclude:
+                pos = self._positions.get(key)
+                if pos is not None: distances[pos] = self.dim + 1
+            slots = np.argpartition(distances, candidates - 1)[:candidates]
+        else:
+            slots = np.arange(self._size)
+        row_ids = self._row_ids[slots]
+        order = np.argsort(row_ids)   # Sorted reads from the memory-mapped store
+        slots, row_ids = slots[order], row_ids[order]
+        scores = np.asarray(self._rows()[row_ids]) @ query   # Store rows are unit-length (see add_many)
+        excluded = [self._positions[key] for key in exclude if key in self._positions]
+        if excluded: scores[np.isin(slots, excluded)] = -np.inf
+        top = min(k, len(scores))
+        best = np.argpartition(-scores, top - 1)[:top] if top < len(scores) else np.arange(len(scores))
+        best = best[np.argsort(-scores[best])]
+        return [(float(scores[i]), self.keys[slots[i]]) for i in best if np.isfinite(scores[i])]
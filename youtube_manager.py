@@ -3,6 +3,7 @@ import json
 import googleapiclient.discovery
 import googleapiclient.errors
 from google.oauth2.credentials import Credentials
+import cassette
 
 def get_authenticated_service():
     json_creds = os.getenv('YOUTUBE_CREDENTIALS_JSON')
@@ -18,6 +19,7 @@ def get_authenticated_service():
         print(f"❌ Error loading YouTube credentials: {e}")
         return None
 
+@cassette.recordable("youtube_manager.upload_video_to_youtube")
 def upload_video_to_youtube(file_path, title, description, tags, category_id="28"):
     youtube = get_authenticated_service()
     if not youtube: return None, None
@@ -57,6 +59,7 @@ def upload_video_to_youtube(file_path, title, description, tags, category_id="28
         print(f"❌ YouTube Upload Failed: {e}")
         return None, None
 
+@cassette.recordable("youtube_manager.update_video_description")
 def update_video_description(video_id, update_text):
     """
     Appends the article URL (update_text) to the TOP of the existing description